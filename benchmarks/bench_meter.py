@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+    Measure the speed of the numpy EBU R128 meter of the normalize plugin on generated PCM.
+
+    Noise whose level changes every few seconds is fed to the meter in the blocks PcmReader hands out, the
+    decode is left out so only the meter is timed. The realtime factor (seconds of audio measured per second)
+    is the median over all runs.
+
+    Usage:
+        bench_meter.py [--runs N] [--seconds S] [--channels C [C ...]]
+
+    Requires numpy and the plugin requirements (guessit, humanize) to be installed.
+"""
+import argparse
+import os
+import statistics
+import sys
+
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(project_root, 'source'))
+
+from normalize.lib.pyff.loudnessmeter import READ_SUB_BLOCKS, SAMPLE_RATE, SUB_BLOCK, LoudnessMeter
+
+LAYOUTS = {1: "mono", 2: "stereo", 6: "5.1", 8: "7.1"}
+
+
+def generate(seconds, channels):
+    rng = np.random.default_rng(0)
+    samples = rng.standard_normal((int(seconds * SAMPLE_RATE), channels))
+    # Levels between -30 and -15 dBFS held for 5 s each, the gates and the loudness range have work to do
+    levels = 10 ** (rng.uniform(-30, -15, int(seconds / 5) + 1) / 20)
+    samples *= np.repeat(levels, 5 * SAMPLE_RATE)[:samples.shape[0], None]
+    return samples.astype(np.float32)
+
+
+def bench_channels(seconds, channels, runs):
+    samples = generate(seconds, channels)
+    block = SUB_BLOCK * READ_SUB_BLOCKS
+    factors = []
+    for _ in range(runs):
+        meter = LoudnessMeter(channels, LAYOUTS.get(channels))
+        for start in range(0, samples.shape[0], block):
+            meter.process(samples[start:start + block])
+        factors.append(meter.throughput())
+    print("{:>2} channels {:>8.0f}x realtime  (integrated {:.2f} LUFS, LRA {:.2f} LU)".format(
+        channels, statistics.median(factors), meter.histogram.integrated(), meter.histogram.loudness_range()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the numpy EBU R128 meter")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=600)
+    parser.add_argument("--channels", type=int, nargs="+", default=[2, 6])
+    args = parser.parse_args()
+
+    print("{:.0f}s of audio per run, median of {} runs".format(args.seconds, args.runs))
+    for c in args.channels:
+        bench_channels(args.seconds, c, args.runs)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+    Compare the full ffprobe json query with the field projected flat query used by pyff.
+
+    For every file the subprocess time (spawn until stdout is drained) and the parse time are measured
+    separately, the median over all runs is reported.
+
+    Usage:
+        bench_probe.py [--runs N] FILE [FILE ...]
+        bench_probe.py [--runs N] --generate DIR [--audio N] [--attachments N]
+
+    --generate creates a short Matroska file with many audio streams and attachments in DIR and benchmarks it.
+    Requires ffmpeg, ffprobe and the plugin requirements (guessit, humanize) to be installed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(project_root, 'source'))
+
+from opus.lib.pyff import probe
+
+window = probe.PROBE_STAGES[-1]
+
+
+def full_args(name):
+    args = ["ffprobe", "-v", "quiet", "-hide_banner", "-show_format", "-show_streams", "-print_format", "json"]
+    args.extend(["-analyzeduration", str(window[0]), "-probesize", str(window[1])])
+    args.extend(["-i", name])
+    return args
+
+
+def run(args):
+    start = time.perf_counter()
+    out = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return time.perf_counter() - start, out.decode('utf8')
+
+
+def bench_file(name, runs):
+    full_run, full_parse, proj_run, proj_parse = [], [], [], []
+    full_out, proj_out = "", ""
+    for _ in range(runs):
+        elapsed, full_out = run(full_args(name))
+        full_run.append(elapsed)
+        start = time.perf_counter()
+        json.loads(full_out)
+        full_parse.append(time.perf_counter() - start)
+
+        elapsed, proj_out = run(probe.ffprobe_args(name, window))
+        proj_run.append(elapsed)
+        start = time.perf_counter()
+        probe.parse_flat(proj_out.splitlines(True))
+        proj_parse.append(time.perf_counter() - start)
+
+    n_streams = len(json.loads(full_out).get("streams", []))
+    print("{} ({} streams)".format(name, n_streams))
+    print("    {:<10} {:>12} {:>12} {:>12}".format("", "output", "subprocess", "parse"))
+    print("    {:<10} {:>10} B {:>10.2f}ms {:>10.3f}ms".format(
+        "full", len(full_out), statistics.median(full_run) * 1000, statistics.median(full_parse) * 1000))
+    print("    {:<10} {:>10} B {:>10.2f}ms {:>10.3f}ms".format(
+        "projected", len(proj_out), statistics.median(proj_run) * 1000, statistics.median(proj_parse) * 1000))
+
+
+def generate(directory, n_audio, n_attachments):
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.join(directory, "many_streams.mkv")
+    args = ["ffmpeg", "-y", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=10:size=1280x720:rate=25"]
+    for i in range(n_audio):
+        args.extend(["-f", "lavfi", "-i", "sine=frequency={}:duration=10".format(220 + 20 * i)])
+    args.extend(["-map", "0:v"])
+    for i in range(n_audio):
+        args.extend(["-map", "{}:a".format(i + 1)])
+    for i in range(n_attachments):
+        attachment = os.path.join(directory, "attachment_{}.bin".format(i))
+        with open(attachment, "wb") as f:
+            f.write(os.urandom(64 * 1024))
+        args.extend(["-attach", attachment])
+    if n_attachments > 0:
+        args.extend(["-metadata:s:t", "mimetype=application/octet-stream"])
+    args.extend(["-c:v", "mpeg4", "-c:a", "ac3", name])
+    subprocess.run(args, check=True)
+    return name
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark full vs projected ffprobe queries")
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--generate", metavar="DIR")
+    parser.add_argument("--audio", type=int, default=24)
+    parser.add_argument("--attachments", type=int, default=40)
+    args = parser.parse_args()
+
+    files = list(args.files)
+    if args.generate:
+        files.append(generate(args.generate, args.audio, args.attachments))
+    if not files:
+        parser.error("no files given")
+    for f in files:
+        bench_file(f, args.runs)
@@ -25,12 +25,29 @@ from __future__ import absolute_import
 import warnings
 
 from .transcode import TranscodeJob, TranscodeResult
+from .decision import DecisionEngine, EncodeDecision
 from .mediafile import MediaFile
+from .probe import AdaptiveProber
+from .decisionmemo import DecisionMemo, read_version, settings_hash
+from .provenance import Provenance, provenance_args, read_provenance
+from .probecache import ProbeCache
+from .registry import ProbeRegistry
 
 __author__ = 'Bregell (johan@bregell.se)'
 
 __all__ = (
     'TranscodeJob',
     'TranscodeResult',
+    'DecisionEngine',
+    'EncodeDecision',
     'MediaFile',
+    'AdaptiveProber',
+    'DecisionMemo',
+    'read_version',
+    'settings_hash',
+    'Provenance',
+    'provenance_args',
+    'read_provenance',
+    'ProbeCache',
+    'ProbeRegistry',
 )
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    decision.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (20:15)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import humanize
+
+from .mediafile import MediaFile
+
+# Codecs that compress at least as well as HEVC, re-encoding them only costs quality
+EFFICIENT_CODECS = ["hevc", "av1", "vp9", "vvc"]
+
+# Expected size of the HEVC encode relative to the source codec at the same quality
+HEVC_SIZE_RATIO = {
+    "h264": 0.6,
+    "vc1": 0.5,
+    "wmv3": 0.5,
+    "vp8": 0.6,
+    "mpeg4": 0.45,
+    "msmpeg4v3": 0.45,
+    "mpeg2video": 0.35,
+    "mpeg1video": 0.3,
+}
+DEFAULT_SIZE_RATIO = 0.6
+
+# Sources below this many bits per pixel are already starved, an encode saves little and loses detail
+DEFAULT_MIN_BPP = 0.05
+
+class EncodeDecision(object):
+    def __init__(self, encode, reason, expected_savings = 0, bpp = None):
+        self.encode = encode
+        self.reason = reason
+        self.expected_savings = expected_savings
+        self.bpp = bpp
+
+    def getInfo(self):
+        txt = "Encode: {}, Reason: {}, Expected savings: {}".format(
+            self.encode, self.reason, humanize.naturalsize(self.expected_savings))
+        if self.bpp != None:
+            txt += ", Bits per pixel: {:.3f}".format(self.bpp)
+        return txt
+
+    def to_dict(self):
+        return {
+            "encode": self.encode,
+            "reason": self.reason,
+            "expected_savings": self.expected_savings,
+            "bpp": self.bpp,
+        }
+
+class DecisionEngine(object):
+    """
+    Decide from the probed video streams whether an HEVC encode is worth it.
+
+    Files are skipped when every video stream already uses an efficient codec or when a stream is below the bits
+    per pixel floor. Files that are encoded get the expected size reduction of their video streams.
+    """
+    def __init__(self, min_bpp = DEFAULT_MIN_BPP, efficient_codecs = None):
+        self.min_bpp = min_bpp
+        self.efficient_codecs = (EFFICIENT_CODECS if efficient_codecs == None else efficient_codecs)
+
+    @staticmethod
+    def bits_per_pixel(v_stream):
+        if v_stream.bitrate <= 0 or not v_stream.width or not v_stream.height or v_stream.frame_rate <= 0:
+            return None
+        return v_stream.bitrate / (v_stream.width * v_stream.height * v_stream.frame_rate)
+
+    def decide(self, m_file: MediaFile) -> EncodeDecision:
+        v_streams = m_file.getVideoStreams()
+        if len(v_streams) == 0:
+            return EncodeDecision(False, "No video streams")
+
+        if all(v_stream.codec in self.efficient_codecs for v_stream in v_streams):
+            codecs = ", ".join(sorted(set(v_stream.codec for v_stream in v_streams)))
+            return EncodeDecision(False, "Video is already {}".format(codecs))
+
+        # The bits per pixel need the video bit rate of the source, estimated now for streams that do not store one.
+        # It is not capped, the cap only limits the bit rate the encode is given.
+        m_file.estimate_video_bitrates()
+
+        expected_savings = 0
+        min_bpp = None
+        for v_stream in v_streams:
+            bpp = self.bits_per_pixel(v_stream)
+            if bpp != None:
+                min_bpp = (bpp if min_bpp == None else min(min_bpp, bpp))
+                if bpp < self.min_bpp:
+                    txt = "Video stream {} has {:.3f} bits per pixel, below the floor of {}".format(
+                        v_stream.index, bpp, self.min_bpp)
+                    return EncodeDecision(False, txt, bpp = bpp)
+            # Efficient streams are encoded along with the others but are not expected to shrink
+            ratio = (1.0 if v_stream.codec in self.efficient_codecs else
+                     HEVC_SIZE_RATIO.get(v_stream.codec, DEFAULT_SIZE_RATIO))
+            expected_savings += int(v_stream.bitrate * (1 - ratio) * m_file.length / 8)
+
+        return EncodeDecision(True, "Video can be encoded to HEVC", expected_savings, min_bpp)
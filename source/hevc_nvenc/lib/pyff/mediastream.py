@@ -44,4 +44,9 @@ class MediaStream(Stream):
         txt = ""
         txt += Stream.getInfo(self) + ", "
         txt += "Bitrate: {}/s".format(humanize.naturalsize(self.bitrate))
-        return txt
\ No newline at end of file
+        return txt
+
+    def to_dict(self):
+        data = Stream.to_dict(self)
+        data["bitrate"] = self.bitrate
+        return data
\ No newline at end of file
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    mp4.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (17:20)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import struct
+
+from typing import Optional
+
+from . import audioheader
+
+# Largest moov box read, the sample size tables of a feature length film take a few MB
+MOOV_READ_LIMIT = 4 * 1024 * 1024
+
+# Top level boxes skipped while looking for moov
+MAX_TOP_LEVEL_BOXES = 64
+
+HANDLER_TYPES = {
+    b"vide": "video",
+    b"soun": "audio",
+    b"sbtl": "subtitle",
+    b"subt": "subtitle",
+    b"text": "subtitle",
+    b"clcp": "subtitle",
+}
+
+# Sample entry fourccs mapped to ffmpeg codec names
+CODECS = {
+    b"avc1": "h264",
+    b"avc3": "h264",
+    b"hvc1": "hevc",
+    b"hev1": "hevc",
+    b"vvc1": "vvc",
+    b"vvi1": "vvc",
+    b"av01": "av1",
+    b"vp08": "vp8",
+    b"vp09": "vp9",
+    b"mp4v": "mpeg4",
+    b"jpeg": "mjpeg",
+    b"mjpa": "mjpeg",
+    b"apch": "prores",
+    b"apcn": "prores",
+    b"apcs": "prores",
+    b"apco": "prores",
+    b"ap4h": "prores",
+    b"mp4a": "aac",
+    b"ac-3": "ac3",
+    b"ec-3": "eac3",
+    b"Opus": "opus",
+    b"fLaC": "flac",
+    b"alac": "alac",
+    b".mp3": "mp3",
+    b".mp2": "mp2",
+    b"tx3g": "mov_text",
+    b"text": "mov_text",
+    b"wvtt": "webvtt",
+    b"c608": "eia_608",
+}
+
+# MPEG-4 object type indications of mp4v and mp4a entries, MPEG audio is left to ffprobe to tell the layer
+OBJECT_TYPES = {
+    0x20: "mpeg4",
+    0x21: "h264",
+    0x40: "aac",
+    0x60: "mpeg2video",
+    0x61: "mpeg2video",
+    0x62: "mpeg2video",
+    0x63: "mpeg2video",
+    0x64: "mpeg2video",
+    0x65: "mpeg2video",
+    0x66: "aac",
+    0x67: "aac",
+    0x68: "aac",
+    0x6A: "mpeg1video",
+    0x6C: "mjpeg",
+    0xA5: "ac3",
+    0xA6: "eac3",
+    0xA9: "dts",
+}
+
+# Channel count by AAC channel configuration
+AAC_CHANNELS = [0, 1, 2, 3, 4, 5, 6, 8]
+
+# Packed ISO 639-2/T code for undetermined and the QuickTime code for English
+LANGUAGE_UND = 0x55C4
+MAC_LANGUAGE_ENGLISH = 0
+MAC_LANGUAGE_UNSPECIFIED = 0x7FFF
+
+# Probe results read without ffprobe use the same format name as ffmpeg
+FORMAT_NAME = "mov,mp4,m4a,3gp,3g2,mj2"
+
+class Mp4Error(Exception):
+    pass
+
+def read_box_header(data, pos, end):
+    """
+    Returns (type, data start, box end) of the box at pos.
+    """
+    if pos + 8 > end:
+        raise Mp4Error("Truncated box header")
+    size, box_type = struct.unpack_from(">I4s", data, pos)
+    header = 8
+    if size == 1:
+        size = struct.unpack_from(">Q", data, pos + 8)[0]
+        header = 16
+    elif size == 0:
+        size = end - pos
+    if size < header or pos + size > end:
+        raise Mp4Error("Bad size for box {}".format(box_type))
+    return box_type, pos + header, pos + size
+
+def iter_boxes(data, start, end):
+    pos = start
+    while pos + 8 <= end:
+        box_type, b_start, b_end = read_box_header(data, pos, end)
+        yield box_type, b_start, b_end
+        pos = b_end
+
+def find_box(data, start, end, path):
+    """
+    Returns (data start, box end) of the first box following the list of box types, None if there is none.
+    """
+    for box_type, b_start, b_end in iter_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return b_start, b_end
+            return find_box(data, b_start, b_end, path[1:])
+    return None
+
+def read_descriptor(data, pos):
+    """
+    MPEG-4 descriptor header, returns (tag, data start, length).
+    """
+    tag = data[pos]
+    length = 0
+    pos += 1
+    for _ in range(4):
+        byte = data[pos]
+        pos += 1
+        length = (length << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            break
+    return tag, pos, length
+
+def read_language(code):
+    if code == LANGUAGE_UND or code == MAC_LANGUAGE_UNSPECIFIED:
+        return None
+    if code < 0x400:
+        if code == MAC_LANGUAGE_ENGLISH:
+            return "eng"
+        raise Mp4Error("QuickTime language code {}".format(code))
+    return "".join(chr(((code >> shift) & 0x1F) + 0x60) for shift in [10, 5, 0])
+
+class Mp4Reader(object):
+    def __init__(self, f, size):
+        self.f = f
+        self.size = size
+        self.moov = None
+
+    def read_moov(self, limit = MOOV_READ_LIMIT):
+        """
+        Walk the top level box headers and read the moov box, wherever it is placed in the file.
+        """
+        pos = 0
+        for _ in range(MAX_TOP_LEVEL_BOXES):
+            if pos + 8 > self.size:
+                break
+            self.f.seek(pos)
+            header = self.f.read(16)
+            box_type, b_start, b_end = read_box_header(header, 0, self.size - pos)
+            if box_type == b"moof":
+                raise Mp4Error("Fragmented file")
+            if box_type == b"moov":
+                if b_end - b_start > limit:
+                    raise Mp4Error("moov box too large")
+                self.f.seek(pos + b_start)
+                self.moov = self.f.read(b_end - b_start)
+                if len(self.moov) != b_end - b_start:
+                    raise Mp4Error("Truncated moov box")
+                return
+            pos += b_end
+        raise Mp4Error("No moov box")
+
+    def read_duration(self) -> Optional[float]:
+        box = find_box(self.moov, 0, len(self.moov), [b"mvhd"])
+        if box == None:
+            return None
+        timescale, duration = self.__read_times(box[0])
+        if timescale == 0:
+            return None
+        return duration / timescale
+
+    def read_tracks(self) -> list:
+        moov = self.moov
+        if find_box(moov, 0, len(moov), [b"mvex"]) != None:
+            raise Mp4Error("Fragmented file")
+        tracks = []
+        for box_type, t_start, t_end in iter_boxes(moov, 0, len(moov)):
+            if box_type == b"trak":
+                tracks.append(self.__read_track(t_start, t_end))
+        return tracks
+
+    def __read_times(self, pos):
+        # mvhd and mdhd share the layout up to the duration
+        if self.moov[pos] == 1:
+            timescale, duration = struct.unpack_from(">IQ", self.moov, pos + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", self.moov, pos + 12)
+        return timescale, duration
+
+    def __read_track(self, start, end):
+        moov = self.moov
+        track = {}
+        mdia = find_box(moov, start, end, [b"mdia"])
+        if mdia == None:
+            raise Mp4Error("Track without mdia")
+
+        hdlr = find_box(moov, mdia[0], mdia[1], [b"hdlr"])
+        if hdlr == None:
+            raise Mp4Error("Track without hdlr")
+        track["handler"] = bytes(moov[hdlr[0] + 8:hdlr[0] + 12])
+
+        mdhd = find_box(moov, mdia[0], mdia[1], [b"mdhd"])
+        if mdhd == None:
+            raise Mp4Error("Track without mdhd")
+        track["timescale"], track["duration"] = self.__read_times(mdhd[0])
+        lang_pos = mdhd[0] + (32 if moov[mdhd[0]] == 1 else 20)
+        track["language"] = read_language(struct.unpack_from(">H", moov, lang_pos)[0])
+
+        stbl = find_box(moov, mdia[0], mdia[1], [b"minf", b"stbl"])
+        if stbl == None:
+            raise Mp4Error("Track without stbl")
+        for box_type, b_start, b_end in iter_boxes(moov, stbl[0], stbl[1]):
+            if box_type == b"stsd":
+                self.__read_sample_entry(track, b_start, b_end)
+            elif box_type == b"stsz":
+                sample_size, count = struct.unpack_from(">II", moov, b_start + 4)
+                if sample_size != 0:
+                    track["stream_size"] = sample_size * count
+                else:
+                    track["stream_size"] = sum(struct.unpack_from(">{}I".format(count), moov, b_start + 12))
+                track["samples"] = count
+            elif box_type == b"stts":
+                count = struct.unpack_from(">I", moov, b_start + 4)[0]
+                entries = struct.unpack_from(">{}I".format(count * 2), moov, b_start + 8)
+                track["media_duration"] = sum(entries[i] * entries[i + 1] for i in range(0, len(entries), 2))
+        return track
+
+    def __read_sample_entry(self, track, start, end):
+        moov = self.moov
+        if struct.unpack_from(">I", moov, start + 4)[0] == 0:
+            return
+        fourcc, e_start, e_end = read_box_header(moov, start + 8, end)
+        track["fourcc"] = fourcc
+        if track["handler"] == b"vide":
+            track["width"], track["height"] = struct.unpack_from(">HH", moov, e_start + 24)
+            children = e_start + 78
+        elif track["handler"] == b"soun":
+            version, = struct.unpack_from(">H", moov, e_start + 8)
+            if version == 2:
+                raise Mp4Error("Version 2 sound description")
+            track["channels"], track["bit_depth"] = struct.unpack_from(">HH", moov, e_start + 16)
+            track["sample_rate"] = struct.unpack_from(">I", moov, e_start + 24)[0] >> 16
+            children = e_start + (44 if version == 1 else 28)
+        else:
+            return
+        for box_type, b_start, b_end in iter_boxes(moov, children, e_end):
+            if box_type == b"esds":
+                self.__read_esds(track, b_start + 4, b_end)
+            elif box_type == b"dac3":
+                bits = audioheader.BitReader(moov, b_start)
+                bits.read(2 + 5 + 3)
+                acmod = bits.read(3)
+                track["channels"] = audioheader.AC3_CHANNELS[acmod] + bits.read(1)
+
+    def __read_esds(self, track, start, end):
+        moov = self.moov
+        tag, pos, length = read_descriptor(moov, start)
+        if tag != 0x03:
+            return
+        flags = moov[pos + 2]
+        pos += 3
+        if flags & 0x80:
+            pos += 2
+        if flags & 0x40:
+            pos += moov[pos] + 1
+        if flags & 0x20:
+            pos += 2
+        tag, pos, length = read_descriptor(moov, pos)
+        if tag != 0x04:
+            return
+        track["object_type"] = moov[pos]
+        tag, pos, length = read_descriptor(moov, pos + 13)
+        if tag != 0x05 or track["object_type"] not in [0x40, 0x66, 0x67, 0x68]:
+            return
+        # AudioSpecificConfig
+        bits = audioheader.BitReader(moov, pos)
+        if bits.read(5) == 31:
+            bits.read(6)
+        if bits.read(4) == 15:
+            bits.read(24)
+        channel_config = bits.read(4)
+        if 0 < channel_config < len(AAC_CHANNELS):
+            track["channels"] = AAC_CHANNELS[channel_config]
+
+def codec_name(track) -> Optional[str]:
+    if "object_type" in track:
+        return OBJECT_TYPES.get(track["object_type"])
+    return CODECS.get(track.get("fourcc"))
+
+def probe(name) -> Optional[dict]:
+    """
+    Probe an MP4/MOV file without ffprobe, the result has the layout of the ffprobe json output.
+
+    Only the moov box is read. Returns None when the box layout is not understood or a field needed by MediaFile
+    is missing, the caller should then fall back to ffprobe.
+    """
+    try:
+        with open(name, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            reader = Mp4Reader(f, size)
+            reader.read_moov()
+        duration = reader.read_duration()
+        tracks = reader.read_tracks()
+    except (OSError, IndexError, Mp4Error, struct.error):
+        return None
+    if duration == None or duration <= 0:
+        return None
+
+    streams = []
+    for index, track in enumerate(tracks):
+        codec_type = HANDLER_TYPES.get(track["handler"])
+        if codec_type == None:
+            # Timecode, hint and metadata tracks
+            streams.append({"index": index, "codec_type": "data"})
+            continue
+        codec = codec_name(track)
+        if codec == None:
+            return None
+        item = {"index": index, "codec_type": codec_type, "codec_name": codec}
+        if codec_type in ["video", "audio"]:
+            media_duration = track.get("media_duration") or track["duration"]
+            if track.get("samples", 0) == 0 or media_duration == 0 or track["timescale"] == 0:
+                return None
+            item["bit_rate"] = str(int(track["stream_size"] * 8 * track["timescale"] / media_duration))
+        if codec_type == "video":
+            if track.get("width", 0) == 0 or track.get("height", 0) == 0:
+                return None
+            item["width"] = track["width"]
+            item["height"] = track["height"]
+            item["avg_frame_rate"] = "{}/{}".format(track["samples"] * track["timescale"],
+                                                    track.get("media_duration") or track["duration"])
+        elif codec_type == "audio":
+            item["channels"] = track["channels"]
+            if track["channels"] in audioheader.DEFAULT_LAYOUTS:
+                item["channel_layout"] = audioheader.DEFAULT_LAYOUTS[track["channels"]]
+            item["sample_rate"] = track["sample_rate"]
+        if track["language"] != None:
+            item["tags"] = {"language": track["language"]}
+        streams.append(item)
+
+    return {
+        "format": {
+            "format_name": FORMAT_NAME,
+            "size": str(size),
+            "duration": "{:.6f}".format(duration),
+            "bit_rate": str(int(size * 8 / duration)),
+        },
+        "streams": streams,
+    }
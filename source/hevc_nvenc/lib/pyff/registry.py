@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    registry.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (11:05)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import sys
+import threading
+import types
+from collections import OrderedDict
+
+from typing import Optional
+
+from .fileidentity import FileIdentity
+
+# Each plugin ships its own copy of pyff, so the state lives on a module every copy can look up by name
+STATE_MODULE = "pyff_probe_registry"
+
+def _shared_state():
+    state = sys.modules.get(STATE_MODULE)
+    if state == None:
+        new_state = types.ModuleType(STATE_MODULE)
+        new_state.lock = threading.Lock()
+        new_state.records = OrderedDict()
+        state = sys.modules.setdefault(STATE_MODULE, new_state)
+    return state
+
+class ProbeRegistry(object):
+    """
+    Process wide registry of probe records shared by all plugins running in the same Unmanic process.
+
+    Records are the plain dicts from MediaFile.to_record() so that every pyff copy can load them into its own
+    stream classes. A record is only returned while the file identity is unchanged.
+    """
+    def __init__(self, max_entries = 256):
+        self.max_entries = max_entries
+        self.__state = _shared_state()
+
+    def get(self, identity: FileIdentity) -> Optional[dict]:
+        with self.__state.lock:
+            entry = self.__state.records.get(identity.path)
+            if entry == None:
+                return None
+            if entry[0] != identity:
+                del self.__state.records[identity.path]
+                return None
+            self.__state.records.move_to_end(identity.path)
+            return entry[1]
+
+    def put(self, identity: FileIdentity, record: dict):
+        with self.__state.lock:
+            self.__state.records[identity.path] = (identity, record)
+            self.__state.records.move_to_end(identity.path)
+            while len(self.__state.records) > self.max_entries:
+                self.__state.records.popitem(last = False)
+
+    def invalidate(self, path):
+        with self.__state.lock:
+            self.__state.records.pop(path, None)
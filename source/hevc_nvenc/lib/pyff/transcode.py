@@ -22,6 +22,7 @@
 """
 
 from .mediafile import MediaFile
+from .provenance import provenance_args
 
 class TranscodeResult(object):
     def __init__(self, status = True, string = None):
@@ -50,8 +51,13 @@ class TranscodeResult(object):
 
 
 class TranscodeJob(object):
-    def __init__(self, mediafile, log, args = None, result = None, new_file = None):
+    def __init__(self, mediafile, log, args = None, result = None, new_file = None, provenance = None,
+                 audio_args = None, tag_args = None):
         self.log = log
+        self.provenance = provenance
+        # Encoder options of audio streams by position, set when other plugins fuse their audio work into the command
+        self.audio_args = ({} if audio_args == None else audio_args)
+        self.tag_args = ([] if tag_args == None else tag_args)
         self.mediafile = mediafile
         self.args = ([] if args == None else args)
         self.result = (TranscodeResult() if result == None else result)
@@ -92,8 +98,11 @@ class TranscodeJob(object):
         # Use ffmpeg
         self.args = ["ffmpeg", "-hide_banner", "-loglevel", "info", "-vsync", "0"]
 
-        # Extend stream scan for VOB
-        if ".vob" in self.mediafile.name:
+        # Reuse the probe window that resolved the file, extend stream scan for VOB when unknown
+        if self.mediafile.probe_window != None:
+            analyzeduration, probesize = self.mediafile.probe_window
+            self.args.extend(["-analyzeduration", str(analyzeduration), "-probesize", str(probesize)])
+        elif ".vob" in self.mediafile.name:
             self.args.extend(["-analyzeduration", "500M", "-probesize", "500M"])
         else :
             self.args.extend(["-analyzeduration", "250M", "-probesize", "250M"])
@@ -125,22 +134,23 @@ class TranscodeJob(object):
 
         # Loop over video steams
         for v_stream in self.mediafile.getVideoStreams():
-            self.args.extend(["-map", "0:{}".format(v_stream.index)])
+            self.args.extend(["-map", "0:{}".format(v_stream.specifier())])
 
         # Loop over audio streams
         for a_stream in self.mediafile.getAudioStreams():
-            self.args.extend(["-map", "0:{}".format(a_stream.index)])
+            self.args.extend(["-map", "0:{}".format(a_stream.specifier())])
 
         # Loop over subtitle streams
         for s_stream in self.mediafile.getSubtitleStreams():
             if s_stream.codec in ["subrip", "ass", "dvd_subtitle", "dvb_subtitle", "pgssub", "hdmv_pgs_subtitle"]:
-                self.args.extend(["-map", "0:{}".format(s_stream.index)])
+                self.args.extend(["-map", "0:{}".format(s_stream.specifier())])
 
         # Loop over subtitle files
         for i in range(1, m_index):
             self.args.extend(["-map", "{}".format(i)])
 
-        # Video encoder settings
+        # Video encoder settings, maxrate and bufsize follow the estimated bit rate of streams that store none
+        self.mediafile.estimate_video_bitrates()
         v_index = 0
         for v_stream in self.mediafile.getVideoStreams():
             # Encode to HEVC with nvenc
@@ -153,10 +163,11 @@ class TranscodeJob(object):
             self.args.extend(["-g", "250"])
             # Quality Min - Max
             self.args.extend(["-qmin", "0", "-qmax", "34"])
-            # Set bitrate targets, bitrate=0 maxrate=input_bitrate
-            self.args.extend(["-b:v:{}".format(v_index), "0", "-maxrate", str(v_stream.bitrate)])
-            # Set buffer to 2 * maxrate
-            self.args.extend(["-bufsize", str(v_stream.bitrate * 2)])
+            # Set bitrate targets, bitrate=0 maxrate=input_bitrate capped by frame width
+            v_bitrate, v_max_bitrate = v_stream.target_bitrates()
+            self.args.extend(["-b:v:{}".format(v_index), "0", "-maxrate", str(v_bitrate)])
+            # Set buffer to 2 * maxrate, or the measured peak of the source when it is higher
+            self.args.extend(["-bufsize", str(max(v_bitrate * 2, v_max_bitrate))])
             # Use spatial aq
             self.args.extend(["-spatial_aq", "1", "-aq-strength", "15"])
             v_index += 1
@@ -165,8 +176,11 @@ class TranscodeJob(object):
         a_index = 0
         for a_stream in self.mediafile.getAudioStreams():
             # Audio encoder settings
-            a_encoder = "copy"
-            self.args.extend(["-c:a:{}".format(a_index), a_encoder])
+            if a_index in self.audio_args:
+                self.args.extend(self.audio_args[a_index])
+            else:
+                a_encoder = "copy"
+                self.args.extend(["-c:a:{}".format(a_index), a_encoder])
             a_index += 1
 
         # Config subtitle streams
@@ -176,6 +190,11 @@ class TranscodeJob(object):
                 self.args.extend(["-c:s:{}".format(s_index), "copy"])
             s_index += 1
 
+        # Tag the output with how it was made, later scans trust the tag instead of probing
+        if self.provenance != None:
+            self.args.extend(provenance_args(self.provenance))
+        self.args.extend(self.tag_args)
+
         # Set output filename
         self.args.extend(["-f", "matroska", self.new_file.name])
         return
@@ -36,18 +36,24 @@
 
     THIS EXAMPLE:
 
+        > The Library Management File Test runner
+            :param data     - Dictionary object of data about the file being tested for the pending tasks queue.
+
         > The Worker Process Plugin runner
             :param data     - Dictionary object of data that will configure how the FFMPEG process is executed.
 
 """
+import importlib
 import logging
 import os
+from typing import List, Optional, Tuple
 
 from unmanic.libs.unplugins.settings import PluginSettings
 from unmanic.libs.system import System
 
 from hevc_nvenc.lib.ffmpeg import Probe, Parser
-from hevc_nvenc.lib.pyff import MediaFile, TranscodeJob, TranscodeResult
+from hevc_nvenc.lib.pyff import DecisionEngine, DecisionMemo, EncodeDecision, MediaFile, ProbeCache, ProbeRegistry, TranscodeJob, TranscodeResult
+from hevc_nvenc.lib.pyff import Provenance, provenance_args, read_provenance, read_version, settings_hash
 
 # Configure plugin logger
 logger = logging.getLogger("Unmanic.Plugin.hevc_nvenc")
@@ -68,9 +74,259 @@ class Settings(PluginSettings):
 
     """
     settings = {
+        "probe_cache_max_entries": 100000,
+        "probe_failure_retry_hours": 24,
+        "min_bits_per_pixel": 0.05,
+        "fused_audio_plugins": "",
     }
 
-def check_run(m_file: MediaFile) -> bool:
+
+# Probe cache shared by all runners of this plugin, opened on first use
+probe_cache = None
+
+# Decisions of earlier scans, opened on first use
+decision_memo = None
+
+# Version from info.json, read on first use
+plugin_version = None
+
+# Probe results shared with the other plugins running in this process
+probe_registry = ProbeRegistry()
+
+
+def get_probe_cache(settings: Settings) -> ProbeCache:
+    global probe_cache
+    if probe_cache == None:
+        db_file = os.path.join(settings.get_profile_directory(), "probe_cache.db")
+        max_entries = int(settings.get_setting("probe_cache_max_entries"))
+        failure_ttl = float(settings.get_setting("probe_failure_retry_hours")) * 3600
+        probe_cache = ProbeCache(db_file, max_entries = max_entries, failure_ttl = failure_ttl, log = logger)
+    return probe_cache
+
+
+def get_plugin_version() -> str:
+    global plugin_version
+    if plugin_version == None:
+        plugin_version = read_version(os.path.join(os.path.dirname(os.path.abspath(__file__)), "info.json"))
+    return plugin_version
+
+
+def get_decision_memo(settings: Settings) -> DecisionMemo:
+    global decision_memo
+    if decision_memo == None:
+        db_file = os.path.join(settings.get_profile_directory(), "decision_memo.db")
+        max_entries = int(settings.get_setting("probe_cache_max_entries"))
+        decision_memo = DecisionMemo(db_file, "hevc_nvenc", get_plugin_version(), settings_hash(settings.get_setting()),
+                                     max_entries = max_entries, log = logger)
+    return decision_memo
+
+
+def get_provenance(settings: Settings) -> Provenance:
+    return Provenance("hevc_nvenc", get_plugin_version(), settings_hash(settings.get_setting()))
+
+
+def check_provenance(m_file: MediaFile, expected: Provenance) -> Optional[str]:
+    """
+    Files this plugin made carry a provenance tag, read from the Matroska header without probing. The tag is only
+    trusted when it matches the expected provenance of this version and settings, other files are probed and decided.
+    Returns the reason to skip the file or None.
+    """
+    provenance = read_provenance(m_file.name, "hevc_nvenc")
+    if provenance == None:
+        return None
+    m_file.log.debug("{}: {}".format(m_file.name, provenance.getInfo()))
+    if not provenance.matches(expected):
+        return None
+    return "File was processed by hevc_nvenc {}".format(provenance.version)
+
+
+def check_name(name) -> Optional[str]:
+    """
+    Cheapest check, the file name alone. Returns the reason to skip the file or None.
+    """
+    # Check for HEVC in filename
+    if "hevc" in name.lower():
+        return "File is HEVC"
+
+    if "x265" in name.lower():
+        return "File is x265"
+
+    if "h265" in name.lower():
+        return "File is h265"
+
+    return None
+
+
+def get_decision_engine(settings: Settings) -> DecisionEngine:
+    return DecisionEngine(min_bpp = float(settings.get_setting("min_bits_per_pixel")))
+
+
+def check_streams(m_file: MediaFile, engine: DecisionEngine) -> EncodeDecision:
+    """
+    Decision on the probed streams, codec and bits per pixel.
+    """
+    decision = engine.decide(m_file)
+    txt = "{}: {}".format(m_file.name, decision.getInfo())
+    m_file.log.debug(txt)
+    return decision
+
+
+def decide(m_file: MediaFile, engine: DecisionEngine, expected: Provenance) -> Tuple[bool, str]:
+    # Stage 1: file name
+    reason = check_name(m_file.name)
+    if reason != None:
+        return False, reason
+
+    # Stage 2: provenance tag
+    reason = check_provenance(m_file, expected)
+    if reason != None:
+        return False, reason
+
+    # Stage 3: probe, raises when the file can not be probed
+    txt = m_file.getInfo()
+    m_file.log.debug(txt)
+
+    # Stage 4: codec and bits per pixel decision
+    decision = check_streams(m_file, engine)
+    return decision.encode, decision.reason
+
+
+def check_run(m_file: MediaFile, engine: DecisionEngine, expected: Provenance,
+              memo: Optional[DecisionMemo] = None) -> Tuple[bool, str]:
+    """
+    Returns whether the file should be encoded and the reason.
+
+    Unchanged files decided before by this plugin version with the same settings are answered from the memo
+    without probing. Files that can not be probed raise and are left to the probe cache failure rows.
+    """
+    identity = None
+    if memo != None:
+        identity, memoized = memo.lookup(m_file.name)
+        if memoized != None:
+            encode, reason = memoized
+            txt = "{}: {} (memoized)".format(m_file.name, reason)
+            m_file.log.debug(txt)
+            return encode, reason
+
+    encode, reason = decide(m_file, engine, expected)
+    if memo != None:
+        memo.put(identity, encode, reason)
+
+    txt = "{}: {}".format(m_file.name, reason)
+    m_file.log.debug(txt)
+    return encode, reason
+
+def load_plugin(plugin_id):
+    """
+    Runner module of another plugin installed next to this one, None when it is not installed.
+    """
+    try:
+        return importlib.import_module("{}.plugin".format(plugin_id))
+    except ImportError:
+        return None
+    except Exception as e:
+        logger.warning("Plugin {} could not be loaded: {}".format(plugin_id, e))
+        return None
+
+
+def get_fused_plugins(settings: Settings) -> List[str]:
+    """
+    Ids of the audio plugins to fuse into the video encode, comma separated in the settings. Only the plugins
+    enabled for the library after this one belong there, the list is not checked against the library.
+    """
+    plugins = [plugin_id.strip() for plugin_id in settings.get_setting("fused_audio_plugins").split(",")]
+    return [plugin_id for plugin_id in plugins if plugin_id in ["normalize", "opus"]]
+
+
+def plan_fused_loudness(norm, in_abs) -> Tuple[Optional[object], List[str]]:
+    """
+    NormalizeJob of the normalize plugin for the streams it would correct and the marker tags, None and no tags
+    when there is nothing to correct.
+
+    Streams are corrected linearly with the pass 1 values normalize measured before, or measures with its parallel
+    meter when enabled. When a stream to correct has no values nothing is fused, normalize measures and corrects
+    the output on its own, the marker records a target a single pass loudnorm does not reliably reach.
+    """
+    n_settings = norm.Settings()
+    target = norm.get_target(n_settings)
+    cache = norm.get_probe_cache(n_settings)
+    tolerance = float(n_settings.get_setting("loudness_tolerance"))
+    n_file = norm.MediaFile(in_abs, log = logger, cache = cache, registry = norm.probe_registry)
+    run_norm, reason = norm.check_run(n_file, target, norm.get_decision_memo(n_settings), cache, tolerance)
+    logger.debug("Fused normalize: {}, {}".format(run_norm, reason))
+    if not run_norm:
+        return None, []
+
+    n_file.getInfo()
+    a_streams = n_file.getAudioStreams()
+    identity = norm.FileIdentity.from_path(in_abs)
+    measured = norm.get_measurements(cache, identity, a_streams, target)
+    missing = [a_stream for a_stream in a_streams if a_stream.index not in measured]
+    if len(missing) > 0 and int(n_settings.get_setting("parallel_measure_workers")) > 0:
+        measured.update(norm.measure_parallel(n_settings, cache, identity, n_file, missing, target))
+        missing = [a_stream for a_stream in missing if a_stream.index not in measured]
+    if len(missing) > 0:
+        logger.debug("Fused normalize: streams {} not measured, left to normalize".format(
+            [a_stream.index for a_stream in missing]))
+        return None, []
+
+    correct = {index: values for index, values in measured.items() if not target.within(values, tolerance)}
+    if len(correct) == 0:
+        return None, []
+    codec = ("libopus" if n_settings.get_setting("normalize_to_opus") else "pcm_s16le")
+    n_job = norm.NormalizeJob(n_file, logger, target, correct, codec = codec)
+    return n_job, norm.marker_args(target, norm.get_tool_version(), norm.format_measured(measured))
+
+
+def plan_fused_audio(in_abs, plugins: List[str]) -> Tuple[dict, List[str]]:
+    """
+    Audio encoder options by stream position and output tags for the work the normalize and opus plugins would do
+    on the file, so that it is done in the same command as the video encode. Only the given plugins are fused.
+
+    Each plugin decides with its own check_run and settings. Corrected streams are encoded with the opus rules when
+    opus is fused, as opus would encode the PCM output of normalize, the other streams as opus would on its own.
+    The outputs carry the loudness marker and the opus provenance tag, so the runners of those plugins skip them.
+    """
+    audio_args = {}
+    tag_args = []
+
+    n_job = None
+    norm = (load_plugin("normalize") if "normalize" in plugins else None)
+    if norm != None:
+        n_job, tag_args = plan_fused_loudness(norm, in_abs)
+    correct = ({} if n_job == None else n_job.measured)
+
+    opus = (load_plugin("opus") if "opus" in plugins else None)
+    if opus != None:
+        o_settings = opus.Settings()
+        o_file = opus.MediaFile(in_abs, log = logger, cache = opus.get_probe_cache(o_settings), registry = opus.probe_registry)
+        o_provenance = opus.get_provenance(o_settings)
+        run_opus, reason = opus.check_run(o_file, o_provenance, opus.get_decision_memo(o_settings))
+        logger.debug("Fused opus: {}, {}".format(run_opus, reason))
+        if run_opus or len(correct) > 0:
+            o_file.getInfo()
+            # Loudness is measured over all channels, dropping some after loudnorm would move it off target
+            downmix = {index: layout for index, layout in opus.plan_downmix(o_settings, o_file).items()
+                       if index not in correct}
+            o_job = opus.TranscodeJob(o_file, logger, downmix = downmix)
+            for a_index, a_stream in enumerate(o_file.getAudioStreams()):
+                values = correct.get(a_stream.index)
+                if values == None:
+                    audio_args[a_index] = o_job.audio_args(a_stream, a_index)
+                else:
+                    # Encoded whatever the source codec, normalize writes PCM and opus encodes it
+                    audio_args[a_index] = o_job.audio_args(a_stream, a_index, [n_job.target.loudnorm_filter(values)],
+                                                           force = True)
+            tag_args.extend(provenance_args(o_provenance))
+    elif n_job != None:
+        # Same output as normalize on its own
+        for a_index, a_stream in enumerate(n_job.mediafile.getAudioStreams()):
+            audio_args[a_index] = n_job.audio_args(a_stream, a_index)
+
+    return audio_args, tag_args
+
+
+def on_library_management_file_test(data):
     """
     Runner function - enables additional actions during the library management file tests.
 
@@ -79,38 +335,41 @@ def check_run(m_file: MediaFile) -> bool:
         issues                          - List of currently found issues for not processing the file.
         add_file_to_pending_tasks       - Boolean, is the file currently marked to be added to the queue for processing.
 
+    The file name is checked first, then the provenance tag of files this plugin encoded, then the file is probed
+    (from the probe registry or cache when unchanged, the native readers otherwise) and the streams are checked,
+    so files that would be skipped never take a worker. Unchanged files are answered from the decision memo.
+
     :param data:
     :return:
 
     """
+    settings = Settings()
 
+    abspath = os.path.abspath(data.get('path'))
+
+    m_file = MediaFile(abspath, log = logger, cache = get_probe_cache(settings), registry = probe_registry)
+    try:
+        encode, reason = check_run(m_file, get_decision_engine(settings), get_provenance(settings),
+                                   get_decision_memo(settings))
+    except Exception as e:
+        # Unreadable or without audio/video, the message already names the file
+        txt = str(e)
+    else:
+        txt = (None if encode else "{}: {}".format(abspath, reason))
+
+    if txt != None:
+        logger.debug(txt)
+        data['issues'].append({
+            'id':      'hevc_nvenc',
+            'message': txt,
+        })
+        return data
+
+    txt = "{}: Add to pending tasks".format(abspath)
+    logger.debug(txt)
+    data['add_file_to_pending_tasks'] = True
 
-    # Check for HEVC in filename
-    if "hevc" in m_file.name.lower():
-        txt = "{}: File is HEVC".format(m_file.name)
-        m_file.log.debug(txt)
-        return False
-
-    if "x265" in m_file.name.lower():
-        txt = "{}: File is x265".format(m_file.name)
-        m_file.log.debug(txt)
-        return False
-
-    if "h265" in m_file.name.lower():
-        txt = "{}: File is h265".format(m_file.name)
-        m_file.log.debug(txt)
-        return False
-
-    # Get file info
-    txt = m_file.getInfo()
-    if len(m_file.getVideoStreams()) == 0:
-        m_file.log.debug(txt)
-        return False
-
-    txt = "{}: Add to pending tasks".format(m_file.name)
-    m_file.log.debug(txt)
-
-    return True
+    return data
 
 def on_worker_process(data):
     """
@@ -134,14 +393,21 @@ def on_worker_process(data):
     in_abs = os.path.abspath(data.get('file_in'))
     out_abs = os.path.abspath(data.get('file_out'))
 
-    m_file = MediaFile(in_abs, log = logger)
-    m_file.getInfo()
-
-    run_hevc = check_run(m_file)
+    m_file = MediaFile(in_abs, log = logger, cache = get_probe_cache(settings), registry = probe_registry)
+    provenance = get_provenance(settings)
+    run_hevc, reason = check_run(m_file, get_decision_engine(settings), provenance, get_decision_memo(settings))
+    logger.debug("Probe cache: {}".format(probe_cache.stats()))
+    logger.debug("Decision memo: {}".format(decision_memo.stats()))
 
     if run_hevc:
         m_file_new = MediaFile(out_abs, log = logger)
-        t_job = TranscodeJob(m_file, logger, new_file = m_file_new)
+        audio_args = {}
+        tag_args = []
+        fused_plugins = get_fused_plugins(settings)
+        if len(fused_plugins) > 0:
+            audio_args, tag_args = plan_fused_audio(in_abs, fused_plugins)
+        t_job = TranscodeJob(m_file, logger, new_file = m_file_new, provenance = provenance,
+                             audio_args = audio_args, tag_args = tag_args)
 
         # Start transcoding job
         t_job.create_cmd()
@@ -151,6 +417,7 @@ def on_worker_process(data):
 
         if t_job.result.status:
             data['exec_command'] = t_job.args
+            probe_registry.invalidate(out_abs)
 
             # Set the parser
             # Get the path to the file
@@ -24,13 +24,45 @@
 from __future__ import absolute_import
 import warnings
 
-from .transcode import TranscodeJob, TranscodeResult
+from .transcode import MeasureJob, NormalizeJob, TranscodeJob, TranscodeResult
 from .mediafile import MediaFile
+from .fileidentity import FileIdentity
+from .probe import AdaptiveProber
+from .loudness import LoudnessTarget, LoudnormParser, format_measured, marker_args, read_marker
+from .r128 import LoudnessHistogram, ParallelMeter, SampledMeter
+from .decisionmemo import DecisionMemo, read_version, settings_hash
+from .provenance import Provenance, provenance_args, read_provenance
+from .probecache import ProbeCache
+from .registry import ProbeRegistry
+from .opusencoder import opus_args, opus_bitrate, opus_layout
 
 __author__ = 'Bregell (johan@bregell.se)'
 
 __all__ = (
+    'MeasureJob',
+    'NormalizeJob',
     'TranscodeJob',
     'TranscodeResult',
     'MediaFile',
+    'FileIdentity',
+    'AdaptiveProber',
+    'LoudnessTarget',
+    'LoudnormParser',
+    'format_measured',
+    'marker_args',
+    'read_marker',
+    'LoudnessHistogram',
+    'ParallelMeter',
+    'SampledMeter',
+    'DecisionMemo',
+    'read_version',
+    'settings_hash',
+    'Provenance',
+    'provenance_args',
+    'read_provenance',
+    'ProbeCache',
+    'ProbeRegistry',
+    'opus_args',
+    'opus_bitrate',
+    'opus_layout',
 )
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    audioheader.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (16:05)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from collections import namedtuple
+
+from typing import Optional
+
+# Parsed audio frame header
+FrameInfo = namedtuple("FrameInfo", ["bit_rate", "channels", "sample_rate"])
+
+# Minimum number of bytes needed from the start of a frame
+HEADER_SIZE = 16
+
+# Layouts ffmpeg reports for these channel counts when the container has none, MediaFile fills in the others
+DEFAULT_LAYOUTS = {1: "mono", 2: "stereo"}
+
+AC3_BITRATES = [32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384, 448, 512, 576, 640]
+AC3_SAMPLE_RATES = [48000, 44100, 32000]
+AC3_CHANNELS = [2, 1, 2, 3, 3, 4, 4, 5]
+EAC3_BLOCKS = [1, 2, 3, 6]
+
+DTS_BITRATES = [
+    32000, 56000, 64000, 96000, 112000, 128000, 192000, 224000, 256000, 320000, 384000, 448000, 512000, 576000,
+    640000, 768000, 896000, 1024000, 1152000, 1280000, 1344000, 1408000, 1411200, 1472000, 1536000, 1920000,
+    2048000, 3072000, 3840000,
+]
+DTS_SAMPLE_RATES = [0, 8000, 16000, 32000, 0, 0, 11025, 22050, 44100, 0, 0, 12000, 24000, 48000, 0, 0]
+DTS_CHANNELS = [1, 2, 2, 2, 2, 3, 3, 4, 4, 5, 6, 6, 6, 7, 8, 8]
+
+MPA_BITRATES = {
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MPA_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+class BitReader(object):
+    def __init__(self, data, pos = 0):
+        self.data = data
+        self.bit = pos * 8
+
+    def read(self, n):
+        value = 0
+        for _ in range(n):
+            byte = self.data[self.bit >> 3]
+            value = (value << 1) | ((byte >> (7 - (self.bit & 7))) & 1)
+            self.bit += 1
+        return value
+
+def ac3_info(data) -> Optional[FrameInfo]:
+    """
+    AC-3 and E-AC-3 sync frame header.
+    """
+    if len(data) < 8 or data[0] != 0x0B or data[1] != 0x77:
+        return None
+    bsid = data[5] >> 3
+    if bsid <= 10:
+        fscod = data[4] >> 6
+        frmsizecod = data[4] & 0x3F
+        if fscod == 3 or frmsizecod >> 1 >= len(AC3_BITRATES):
+            return None
+        bits = BitReader(data, 6)
+        acmod = bits.read(3)
+        if acmod & 1 and acmod != 1:
+            bits.read(2)
+        if acmod & 4:
+            bits.read(2)
+        if acmod == 2:
+            bits.read(2)
+        lfeon = bits.read(1)
+        return FrameInfo(AC3_BITRATES[frmsizecod >> 1] * 1000, AC3_CHANNELS[acmod] + lfeon, AC3_SAMPLE_RATES[fscod])
+    if bsid <= 16:
+        bits = BitReader(data, 2)
+        bits.read(2)
+        bits.read(3)
+        frmsiz = bits.read(11)
+        fscod = bits.read(2)
+        if fscod == 3:
+            fscod2 = bits.read(2)
+            if fscod2 == 3:
+                return None
+            sample_rate = AC3_SAMPLE_RATES[fscod2] // 2
+            blocks = 6
+        else:
+            sample_rate = AC3_SAMPLE_RATES[fscod]
+            blocks = EAC3_BLOCKS[bits.read(2)]
+        acmod = bits.read(3)
+        lfeon = bits.read(1)
+        frame_bytes = (frmsiz + 1) * 2
+        bit_rate = int(frame_bytes * 8 * sample_rate / (blocks * 256))
+        return FrameInfo(bit_rate, AC3_CHANNELS[acmod] + lfeon, sample_rate)
+    return None
+
+def dts_info(data) -> Optional[FrameInfo]:
+    """
+    DTS core frame header (big endian 16 bit words).
+    """
+    if len(data) < 12 or bytes(data[0:4]) != b"\x7f\xfe\x80\x01":
+        return None
+    bits = BitReader(data, 4)
+    bits.read(1 + 5 + 1 + 7 + 14)
+    amode = bits.read(6)
+    sfreq = bits.read(4)
+    rate = bits.read(5)
+    bits.read(1 + 1 + 1 + 1 + 1 + 3 + 1 + 1)
+    lff = bits.read(2)
+    if rate >= len(DTS_BITRATES) or DTS_SAMPLE_RATES[sfreq] == 0:
+        return None
+    channels = (DTS_CHANNELS[amode] if amode < len(DTS_CHANNELS) else 0) + (1 if lff in [1, 2] else 0)
+    return FrameInfo(DTS_BITRATES[rate], channels, DTS_SAMPLE_RATES[sfreq])
+
+def mpa_info(data) -> Optional[FrameInfo]:
+    """
+    MPEG audio layer II and III frame header.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] & 0xE0 != 0xE0:
+        return None
+    version = (data[1] >> 3) & 3
+    layer = 4 - ((data[1] >> 1) & 3)
+    bitrate_index = data[2] >> 4
+    rate_index = (data[2] >> 2) & 3
+    if version == 1 or layer not in [2, 3] or bitrate_index in [0, 15] or rate_index == 3:
+        return None
+    mode = data[3] >> 6
+    table = MPA_BITRATES[(1 if version == 3 else 2, layer)]
+    return FrameInfo(table[bitrate_index] * 1000, (1 if mode == 3 else 2), MPA_SAMPLE_RATES[version][rate_index])
+
+# Header parsers by ffmpeg codec name
+PARSERS = {
+    "ac3": ac3_info,
+    "eac3": ac3_info,
+    "dts": dts_info,
+    "mp2": mpa_info,
+    "mp3": mpa_info,
+}
+
+def frame_info(codec, data) -> Optional[FrameInfo]:
+    parser = PARSERS.get(codec)
+    if parser == None:
+        return None
+    try:
+        return parser(data)
+    except IndexError:
+        return None
@@ -52,3 +52,9 @@ class AudioStream(MediaStream):
         txt += MediaStream.getInfo(self) + ", "
         txt += "Channels: {}, Channel Layout: {}".format(self.channels, self.channel_layout)
         return txt
+
+    def to_dict(self):
+        data = MediaStream.to_dict(self)
+        data["channels"] = self.channels
+        data["channel_layout"] = self.channel_layout
+        return data
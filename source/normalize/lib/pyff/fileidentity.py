@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    fileidentity.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (10:12)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+from collections import namedtuple
+
+class FileIdentity(namedtuple("FileIdentity", ["path", "size", "mtime_ns", "inode"])):
+    """
+    Identity of a file on disk, a file with the same identity is assumed to have unchanged content.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_path(cls, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return cls(path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    def matches(self, size, mtime_ns, inode):
+        return self.size == size and self.mtime_ns == mtime_ns and self.inode == inode
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    loudness.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (21:30)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import re
+from collections import namedtuple
+
+from typing import Dict, List, Optional
+
+from . import matroska
+
+# Global Matroska tags marking a file as loudness normalized
+TAG_TARGET = "LOUDNESS_TARGET"
+TAG_MEASURED = "LOUDNESS_MEASURED"
+TAG_TOOL = "LOUDNESS_TOOL"
+
+# Analyzer name of the loudnorm pass 1 results in the probe cache
+ANALYZER = "loudnorm"
+
+# Analyzer name of the loudness estimates from sampled windows, kept apart from the measured values
+ESTIMATE_ANALYZER = "loudnorm_estimate"
+
+# Values of the loudnorm json output needed for the second pass
+MEASURED_KEYS = ["input_i", "input_tp", "input_lra", "input_thresh", "target_offset"]
+
+class LoudnessTarget(namedtuple("LoudnessTarget", ["i", "tp", "lra"])):
+    """
+    EBU R128 target, integrated loudness (LUFS), true peak (dBTP) and loudness range (LU).
+    """
+    __slots__ = ()
+
+    def to_tag(self):
+        return "I={:.1f}:TP={:.1f}:LRA={:.1f}".format(self.i, self.tp, self.lra)
+
+    def loudnorm_filter(self, measured = None):
+        """
+        ffmpeg loudnorm filter, single pass unless the pass 1 values are given, the correction is then linear.
+        loudnorm upsamples so the output is resampled back to 48 kHz.
+        """
+        args = "I={:.1f}:TP={:.1f}:LRA={:.1f}".format(self.i, self.tp, self.lra)
+        if measured != None:
+            args += ":measured_I={}:measured_TP={}:measured_LRA={}:measured_thresh={}:offset={}:linear=true".format(
+                measured["input_i"], measured["input_tp"], measured["input_lra"], measured["input_thresh"],
+                measured["target_offset"])
+        return "loudnorm={},aresample=48000".format(args)
+
+    def linear(self, measured) -> bool:
+        """
+        Whether loudnorm corrects a stream with these pass 1 values linearly, the same rule as the filter. Otherwise
+        it falls back to dynamic correction, which also needs the target offset only loudnorm itself measures.
+        """
+        offset = self.i - float(measured["input_i"])
+        return (float(measured["input_tp"]) + offset <= self.tp and float(measured["input_lra"]) <= self.lra and
+                float(measured["input_lra"]) != 0 and float(measured["input_thresh"]) != -70)
+
+    def within(self, measured, tolerance) -> bool:
+        """
+        Whether a stream with these pass 1 values is already within tolerance LU of the integrated loudness target
+        and at most tolerance dB above the true peak target.
+        """
+        return (abs(float(measured["input_i"]) - self.i) <= tolerance and
+                float(measured["input_tp"]) <= self.tp + tolerance)
+
+    def measure_filter(self):
+        """
+        ffmpeg loudnorm filter for pass 1, prints the measured values as json when the input ends.
+        """
+        return "loudnorm=I={:.1f}:TP={:.1f}:LRA={:.1f}:print_format=json".format(self.i, self.tp, self.lra)
+
+def marker_args(target: LoudnessTarget, tool, measured = None) -> List[str]:
+    """
+    ffmpeg output options writing the marker tags, the measured tag is left out when no value is given.
+    """
+    args = ["-metadata", "{}={}".format(TAG_TARGET, target.to_tag())]
+    if measured != None:
+        args.extend(["-metadata", "{}={}".format(TAG_MEASURED, measured)])
+    args.extend(["-metadata", "{}={}".format(TAG_TOOL, tool)])
+    return args
+
+def format_measured(measured: Dict[int, dict]) -> str:
+    """
+    Measured input loudness by input stream index, 'stream:I=..:TP=..:LRA=..' joined by ';'.
+    """
+    return ";".join("{}:I={}:TP={}:LRA={}".format(index, values["input_i"], values["input_tp"], values["input_lra"])
+                    for index, values in sorted(measured.items()))
+
+class LoudnormParser(object):
+    """
+    Collect the json loudnorm prints at the end of pass 1 from the ffmpeg output lines.
+
+    Each loudnorm instance logs its values under its own name, Parsed_loudnorm_<n>, where n is the position of the
+    filter in the filter graph. results holds the values needed for the second pass by that position.
+    """
+    def __init__(self):
+        self.results = {}
+        self.__instance = None
+        self.__lines = None
+
+    def feed(self, line):
+        instance = re.search(r"\[Parsed_loudnorm_([0-9]+) @", line)
+        if instance != None:
+            self.__instance = int(instance.group(1))
+            self.__lines = None
+            return
+        if self.__instance == None:
+            return
+        line = line.strip()
+        if self.__lines == None:
+            if line == "{":
+                self.__lines = [line]
+            return
+        self.__lines.append(line)
+        if line == "}":
+            try:
+                values = json.loads("\n".join(self.__lines))
+                self.results[self.__instance] = {key: values[key] for key in MEASURED_KEYS}
+            except (KeyError, ValueError):
+                pass
+            self.__instance = None
+            self.__lines = None
+
+def read_marker(name) -> Optional[dict]:
+    """
+    Read the marker tags from the Matroska header, None when the file is not marked or not Matroska.
+    """
+    tags = matroska.read_tags(name)
+    if tags == None or TAG_TARGET not in tags[0]:
+        return None
+    return {
+        "target": tags[0][TAG_TARGET],
+        "measured": tags[0].get(TAG_MEASURED, ""),
+        "tool": tags[0].get(TAG_TOOL),
+    }
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    loudnessmeter.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     19 Oct 2026, (00:05)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import subprocess
+import time
+
+import numpy as np
+
+from typing import Optional
+
+from .audiopipeline import decode_args as pcm_args
+from .r128 import ABSOLUTE_GATE, BINS_PER_LU, BLOCK_STEP, CHUNK_PREROLL, SHORT_TERM_SECONDS, LoudnessHistogram
+
+# The meter runs at 48 kHz, ffmpeg resamples other rates, the K-weighting coefficients are those of BS.1770 for it
+SAMPLE_RATE = 48000
+SUB_BLOCK = int(SAMPLE_RATE * BLOCK_STEP)
+GATING_SUB_BLOCKS = 4
+SHORT_TERM_SUB_BLOCKS = int(round(SHORT_TERM_SECONDS / BLOCK_STEP))
+
+# K-weighting, a high shelf followed by a high pass, as (b, a) biquads
+SHELF = ([1.53512485958697, -2.69169618940638, 1.19839281085285], [1.0, -1.69065929318241, 0.73248077421585])
+HIGH_PASS = ([1.0, -2.0, 1.0], [1.0, -1.99004745483398, 0.99007225036621])
+
+# True peak interpolation of BS.1770 annex 2, 4 phases of 12 taps
+OVERSAMPLE = 4
+PHASE_TAPS = 12
+INTERPOLATION_PHASES = [
+    [0.0017089843750, 0.0109863281250, -0.0196533203125, 0.0332031250000, -0.0594482421875, 0.1373291015625,
+     0.9721679687500, -0.1022949218750, 0.0476074218750, -0.0266113281250, 0.0148925781250, -0.0083007812500],
+    [-0.0291748046875, 0.0292968750000, -0.0517578125000, 0.0891113281250, -0.1665039062500, 0.4650878906250,
+     0.7797851562500, -0.2003173828125, 0.1015625000000, -0.0582275390625, 0.0330810546875, -0.0189208984375],
+    [-0.0189208984375, 0.0330810546875, -0.0582275390625, 0.1015625000000, -0.2003173828125, 0.7797851562500,
+     0.4650878906250, -0.1665039062500, 0.0891113281250, -0.0517578125000, 0.0292968750000, -0.0291748046875],
+    [-0.0083007812500, 0.0148925781250, -0.0266113281250, 0.0476074218750, -0.1022949218750, 0.9721679687500,
+     0.1373291015625, -0.0594482421875, 0.0332031250000, -0.0196533203125, 0.0109863281250, 0.0017089843750],
+]
+
+# Sub-blocks read from the pipe at a time
+READ_SUB_BLOCKS = 10
+
+# Channel order of the ffmpeg layouts, surround channels are weighted 1.41 and LFE is left out
+LAYOUT_CHANNELS = {
+    "mono": ["FC"],
+    "stereo": ["FL", "FR"],
+    "2.1": ["FL", "FR", "LFE"],
+    "3.0": ["FL", "FR", "FC"],
+    "3.0(back)": ["FL", "FR", "BC"],
+    "4.0": ["FL", "FR", "FC", "BC"],
+    "quad": ["FL", "FR", "BL", "BR"],
+    "quad(side)": ["FL", "FR", "SL", "SR"],
+    "3.1": ["FL", "FR", "FC", "LFE"],
+    "5.0": ["FL", "FR", "FC", "BL", "BR"],
+    "5.0(side)": ["FL", "FR", "FC", "SL", "SR"],
+    "4.1": ["FL", "FR", "FC", "LFE", "BC"],
+    "5.1": ["FL", "FR", "FC", "LFE", "BL", "BR"],
+    "5.1(side)": ["FL", "FR", "FC", "LFE", "SL", "SR"],
+    "6.0": ["FL", "FR", "FC", "BC", "SL", "SR"],
+    "6.1": ["FL", "FR", "FC", "LFE", "BC", "SL", "SR"],
+    "7.0": ["FL", "FR", "FC", "BL", "BR", "SL", "SR"],
+    "7.1": ["FL", "FR", "FC", "LFE", "BL", "BR", "SL", "SR"],
+    "7.1(wide)": ["FL", "FR", "FC", "LFE", "BL", "BR", "FLC", "FRC"],
+}
+SURROUND_CHANNELS = ["BL", "BR", "BC", "SL", "SR"]
+SURROUND_WEIGHT = 1.41
+
+def channel_weights(channels, channel_layout = None) -> np.ndarray:
+    names = LAYOUT_CHANNELS.get(channel_layout)
+    if names == None or len(names) != channels:
+        names = (LAYOUT_CHANNELS["5.1"] if channels == 6 else [None] * channels)
+    return np.array([0.0 if name == "LFE" else SURROUND_WEIGHT if name in SURROUND_CHANNELS else 1.0
+                     for name in names])
+
+class BlockFilter(object):
+    """
+    IIR filter run on whole blocks of samples of every channel at once.
+
+    The filter is written in state space form, the output of a block is the response to the state left by the
+    block before plus the convolution of the block with the impulse response, done with an FFT. Only the state of
+    the filter is carried between blocks, the result is the same as running the recursion sample by sample.
+    """
+    def __init__(self, b, a, block):
+        b = np.asarray(b, dtype = np.float64) / a[0]
+        a = np.asarray(a, dtype = np.float64) / a[0]
+        order = len(a) - 1
+        self.a_matrix = np.zeros((order, order))
+        self.a_matrix[0, :] = -a[1:]
+        self.a_matrix[1:, :-1] = np.eye(order - 1)
+        self.c = b[1:] - b[0] * a[1:]
+        self.d = b[0]
+        self.block = block
+        self.nfft = 1 << (2 * block - 1).bit_length()
+
+        # Powers of A applied to the state, C A^n for the outputs and A^(L-1-k) B for the next state
+        powers = np.empty((block + 1, order, order))
+        powers[0] = np.eye(order)
+        for n in range(1, block + 1):
+            powers[n] = self.a_matrix @ powers[n - 1]
+        self.zero_input = np.einsum("j,njk->nk", self.c, powers[:block])
+        self.next_state = powers[block - 1::-1, :, 0].T
+        self.powers = powers
+        impulse = np.empty(block)
+        impulse[0] = self.d
+        impulse[1:] = self.zero_input[:-1, 0]
+        self.impulse = impulse
+        self.impulse_fft = np.fft.rfft(impulse, self.nfft)
+
+    def initial_state(self, channels) -> np.ndarray:
+        return np.zeros((len(self.c), channels))
+
+    def process(self, x: np.ndarray, state: np.ndarray) -> np.ndarray:
+        """
+        Filter a block of at most the block length, (samples, channels), and update the state in place.
+        """
+        n = x.shape[0]
+        if n == self.block:
+            impulse_fft = self.impulse_fft
+        else:
+            impulse_fft = np.fft.rfft(self.impulse[:n], self.nfft)
+        y = np.fft.irfft(np.fft.rfft(x, self.nfft, axis = 0) * impulse_fft[:, None], self.nfft, axis = 0)[:n]
+        y += self.zero_input[:n] @ state
+        state[:] = self.powers[n] @ state + self.next_state[:, self.block - n:] @ x
+        return y
+
+class LoudnessMeter(object):
+    """
+    EBU R128 meter on 48 kHz float samples, (samples, channels) arrays as they come from an f32le pipe.
+
+    The K-weighted mean square of every 100 ms sub-block is kept for the last 3 s, gating blocks (400 ms) and
+    short-term blocks (3 s) ending on every sub-block are added to a LoudnessHistogram. Samples are processed in
+    whole sub-blocks, only the last call may end with a partial one which then only counts for the true peak.
+
+    The first skip sub-blocks only settle the filters, blocks ending in them and their samples are not measured.
+    """
+    def __init__(self, channels, channel_layout = None, skip = 0, read_sub_blocks = READ_SUB_BLOCKS):
+        self.channels = channels
+        self.weights = channel_weights(channels, channel_layout)
+        self.skip = skip
+        self.histogram = LoudnessHistogram()
+        self.samples = 0
+        self.elapsed = 0.0
+        self.__filter = BlockFilter(np.convolve(SHELF[0], HIGH_PASS[0]), np.convolve(SHELF[1], HIGH_PASS[1]),
+                                    SUB_BLOCK * read_sub_blocks)
+        self.__state = self.__filter.initial_state(channels)
+        self.__powers = np.zeros(0)
+        # Taps reversed so that a window of input samples is multiplied straight with them, (taps, phases)
+        self.__phases = np.array(INTERPOLATION_PHASES)[:, ::-1].T.copy()
+        self.__history = np.zeros((PHASE_TAPS - 1, channels))
+        self.__sub_blocks = 0
+
+    def process(self, samples: np.ndarray):
+        start = time.monotonic()
+        for offset in range(0, samples.shape[0], self.__filter.block):
+            self.__process_block(samples[offset:offset + self.__filter.block])
+            self.samples += min(self.__filter.block, samples.shape[0] - offset)
+        self.elapsed += time.monotonic() - start
+
+    def __process_block(self, x: np.ndarray):
+        x = x.astype(np.float64)
+        self.__true_peak(x)
+
+        y = self.__filter.process(x, self.__state)
+        whole = (x.shape[0] // SUB_BLOCK) * SUB_BLOCK
+        if whole == 0:
+            return
+        # Weighted sum over the channels of the mean square of every sub-block
+        powers = (y[:whole] ** 2).reshape(-1, SUB_BLOCK, self.channels).mean(axis = 1) @ self.weights
+        self.__powers = np.concatenate((self.__powers, powers))[-(SHORT_TERM_SUB_BLOCKS + len(powers)):]
+        self.__add_blocks(GATING_SUB_BLOCKS, len(powers), self.histogram.blocks)
+        self.__add_blocks(SHORT_TERM_SUB_BLOCKS, len(powers), self.histogram.short_term)
+        self.__sub_blocks += len(powers)
+        self.__powers = self.__powers[-SHORT_TERM_SUB_BLOCKS:]
+
+    def __add_blocks(self, length, new, histogram):
+        # Blocks ending on the new sub-blocks that are complete and measured, averaged with a running sum
+        first = max(0, max(length - 1, self.skip) - self.__sub_blocks)
+        if first >= new:
+            return
+        sums = np.concatenate(([0.0], np.cumsum(self.__powers)))
+        ends = np.arange(len(self.__powers) - new + first, len(self.__powers)) + 1
+        power = (sums[ends] - sums[ends - length]) / length
+        with np.errstate(divide = "ignore"):
+            loudness = -0.691 + 10 * np.log10(power)
+        keys, counts = np.unique(np.round(loudness[loudness > ABSOLUTE_GATE] * BINS_PER_LU).astype(np.int64),
+                                 return_counts = True)
+        histogram.update(dict(zip(keys.tolist(), counts.tolist())))
+
+    def __true_peak(self, x: np.ndarray):
+        # Windows over the last input samples of the block before and this block, no copy of the samples is made
+        extended = np.concatenate((self.__history, x))
+        self.__history = extended[-(PHASE_TAPS - 1):]
+        begin = max(0, self.skip * SUB_BLOCK - self.samples)
+        if begin >= x.shape[0]:
+            return
+        windows = np.lib.stride_tricks.sliding_window_view(extended, PHASE_TAPS, axis = 0)[begin:]
+        peak = np.abs(windows @ self.__phases).max(initial = 0.0)
+        self.histogram.add_peak(float(max(peak, np.abs(x[begin:]).max(initial = 0.0))))
+
+    def throughput(self) -> float:
+        """
+        Seconds of audio measured per second of processing.
+        """
+        return (0.0 if self.elapsed == 0 else self.samples / SAMPLE_RATE / self.elapsed)
+
+class PcmReader(object):
+    """
+    Read (samples, channels) blocks of float samples from a pipe into one preallocated buffer, the blocks handed
+    out are views of it and are only valid until the next read.
+    """
+    def __init__(self, pipe, channels, sub_blocks = READ_SUB_BLOCKS):
+        self.pipe = pipe
+        self.buffer = np.empty((SUB_BLOCK * sub_blocks, channels), dtype = np.float32)
+        self.__bytes = memoryview(self.buffer).cast("B")
+        self.__frame = channels * self.buffer.itemsize
+
+    def read(self) -> Optional[np.ndarray]:
+        filled = 0
+        while filled < len(self.__bytes):
+            n = self.pipe.readinto(self.__bytes[filled:])
+            if not n:
+                break
+            filled += n
+        frames = filled // self.__frame
+        if frames == 0:
+            return None
+        return self.buffer[:frames]
+
+    def __iter__(self):
+        while True:
+            block = self.read()
+            if block is None:
+                return
+            yield block
+
+def measure_pcm(name, specifier, channels, channel_layout = None, start = 0.0, end = None, skip = 0) -> LoudnessMeter:
+    """
+    Run a stream from start to end in seconds through a meter, raises when ffmpeg fails.
+    """
+    meter = LoudnessMeter(channels, channel_layout, skip)
+    pipe = subprocess.Popen(pcm_args(name, specifier, channels, start, end), stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+    with pipe.stdout:
+        for block in PcmReader(pipe.stdout, channels):
+            meter.process(block)
+    if pipe.wait() != 0:
+        raise RuntimeError("Decoding stream {} of {} failed".format(specifier, name))
+    return meter
+
+def measure_chunk(name, specifier, keep_from, keep_to = None, channels = 2, channel_layout = None) -> LoudnessHistogram:
+    """
+    Histogram of the blocks of a stream ending between keep_from and keep_to in seconds, None for the end, like
+    r128.measure_chunk but measured by the meter.
+    """
+    start = max(0.0, keep_from - CHUNK_PREROLL)
+    skip = int(round((keep_from - start) / BLOCK_STEP))
+    return measure_pcm(name, specifier, channels, channel_layout, start, keep_to, skip).histogram
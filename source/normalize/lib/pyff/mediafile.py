@@ -22,8 +22,6 @@
 """
 
 import os
-import subprocess
-import json
 import re
 from difflib import SequenceMatcher
 
@@ -32,6 +30,8 @@ from typing import List
 from guessit import guessit as guessit
 
 from .basefile import BaseFile
+from .fileidentity import FileIdentity
+from .probe import default_prober
 from .videostream import VideoStream
 from .audiostream import AudioStream
 from .subtitlestream import SubtitleStream
@@ -43,9 +43,16 @@ from .miniseries import MiniSeries
 from .episode import Episode
 
 class MediaFile(BaseFile):
-    def __init__(self, name, log, size = 0, length = 0.0, v_streams = None, a_streams = None, s_streams = None, s_files = None):
+    def __init__(self, name, log, size = 0, length = 0.0, v_streams = None, a_streams = None, s_streams = None, s_files = None, cache = None, registry = None, prober = None):
         BaseFile.__init__(self, name, size)
         self.log = log
+        self.cache = cache
+        self.registry = registry
+        self.prober = (default_prober if prober == None else prober)
+        self.probe_stage = None
+        self.probe_window = None
+        self.start_time = 0.0
+        self.format_bitrate = 0
         self.length = length
         self.v_streams  = ([] if v_streams  == None else v_streams)
         self.a_streams  = ([] if a_streams  == None else a_streams)
@@ -110,30 +117,101 @@ class MediaFile(BaseFile):
             txt.extend([s_file.getInfo()])
         return ", ".join(txt)
 
-    def __populate_file_info(self):
-        # Command
-        args = ["ffprobe", "-v", "quiet", "-hide_banner", "-show_format", "-show_streams", "-print_format", "json"]
+    def to_record(self) -> dict:
+        return {
+            "size": self.size,
+            "length": self.length,
+            "v_streams": [v_stream.to_dict() for v_stream in self.getVideoStreams()],
+            "a_streams": [a_stream.to_dict() for a_stream in self.getAudioStreams()],
+            "s_streams": [s_stream.to_dict() for s_stream in self.getSubtitleStreams()],
+            "probe_stage": self.probe_stage,
+            "probe_window": self.probe_window,
+            "start_time": self.start_time,
+            "format_bitrate": self.format_bitrate,
+        }
+
+    def load_record(self, record: dict):
+        self.size = record["size"]
+        self.length = record["length"]
+        self.v_streams = [VideoStream.from_dict(v_stream) for v_stream in record["v_streams"]]
+        self.a_streams = [AudioStream.from_dict(a_stream) for a_stream in record["a_streams"]]
+        self.s_streams = [SubtitleStream.from_dict(s_stream) for s_stream in record["s_streams"]]
+        self.probe_stage = record.get("probe_stage")
+        self.probe_window = (None if record.get("probe_window") == None else tuple(record["probe_window"]))
+        self.start_time = record.get("start_time", 0.0)
+        self.format_bitrate = record.get("format_bitrate", 0)
+        self.__info_populated = True
 
-        if ".vob" in self.name:
-            args.extend(["-analyzeduration", "500M", "-probesize", "500M"])
+    def __populate_file_info(self):
+        identity, found = self.__lookup_file_info()
+        if found:
+            return True, "Success"
+        failure = self.__lookup_failure(identity)
+        if failure != None:
+            return False, failure
+
+        # Get file info from ffprobe, starting with a small probe window
+        result, txt = self.__parse_probe(self.prober.probe(self.name, self.log))
+        if result == True:
+            self.__store_file_info(identity)
         else:
-            args.extend(["-analyzeduration", "250M", "-probesize", "250M"])
-
-        args.extend(["-i",  self.name])
-
-        # Get file info from ffprobe
-        info_json = None
-        try :
-            pipe = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            info_json, err = pipe.communicate()
-        except:
+            self.__store_failure(identity, txt)
+        return result, txt
+
+    def __lookup_file_info(self):
+        identity = None
+        if self.cache != None or self.registry != None:
+            try:
+                identity = FileIdentity.from_path(self.name)
+            except OSError:
+                identity = None
+
+        # Look up the file in the process wide registry, then in the probe cache
+        if identity != None and self.registry != None:
+            record = self.registry.get(identity)
+            if record != None:
+                self.load_record(record)
+                return identity, True
+        if identity != None and self.cache != None:
+            record = self.cache.get(identity)
+            if record != None:
+                self.load_record(record)
+                if self.registry != None:
+                    self.registry.put(identity, record)
+                return identity, True
+        return identity, False
+
+    def __lookup_failure(self, identity):
+        # Files that failed before are not probed again until the retry time has passed
+        if identity == None or self.cache == None:
+            return None
+        reason = self.cache.get_failure(identity)
+        if reason != None:
+            txt = "File: {} failed to probe before, skipping until retry: {}".format(self.name, reason)
+            self.log.debug(txt)
+        return reason
+
+    def __store_failure(self, identity, reason):
+        if identity != None and self.cache != None:
+            self.cache.put_failure(identity, reason)
+
+    def __store_file_info(self, identity):
+        if identity == None:
+            return
+        record = self.to_record()
+        if self.registry != None:
+            self.registry.put(identity, record)
+        if self.cache != None:
+            self.cache.put(identity, record)
+
+    def __parse_probe(self, result):
+        if result == None:
             txt = "File: {} was unreadable, skipping.".format(self.name)
             self.log.error(txt)
             return False, txt
-
-        data = info_json.decode('utf8')
-        # self.log.warning(data)
-        json_data = json.loads(data)
+        json_data = result.data
+        self.probe_stage = result.stage
+        self.probe_window = result.window
 
         # Get file size
         self.size = int(json_data["format"]["size"])
@@ -142,6 +220,7 @@ class MediaFile(BaseFile):
         self.length = 0.0
         if "duration" in json_data["format"]:
             self.length = float(json_data["format"]["duration"])
+        self.start_time = float(json_data["format"].get("start_time", 0.0))
 
         # Search for video and audio info
         for item in json_data["streams"]:
@@ -152,15 +231,25 @@ class MediaFile(BaseFile):
                 if v_codec in ["mjpeg"]:
                     continue
                 v_bitrate = 0
+                v_max_bitrate = 0
                 v_height = 0
                 v_width = 0
                 if "bit_rate" in item:
                     v_bitrate = int(item["bit_rate"])
+                if "max_bit_rate" in item:
+                    v_max_bitrate = int(item["max_bit_rate"])
+                v_frame_rate = 0.0
+                if "avg_frame_rate" in item:
+                    num, _, den = str(item["avg_frame_rate"]).partition("/")
+                    if den.isdigit() and int(den) != 0:
+                        v_frame_rate = int(num) / int(den)
                 if "height" in item:
                     v_height = int(item["height"])
                 if "width" in item:
                     v_width = int(item["width"])
-                v_stream = VideoStream(v_index, v_codec, v_bitrate, v_width, v_height)
+                v_stream = VideoStream(v_index, v_codec, v_bitrate, v_width, v_height, v_max_bitrate, v_frame_rate,
+                                       estimate_pending = ("bit_rate" not in item))
+                v_stream.stream_id = item.get("id")
                 self.appendVideoStream(v_stream)
                 continue
             # Audio
@@ -220,6 +309,7 @@ class MediaFile(BaseFile):
 
                 # Append stream
                 a_stream = AudioStream(a_index, a_codec, a_bitrate, a_channels, a_channel_layout)
+                a_stream.stream_id = item.get("id")
                 self.appendAudioStream(a_stream)
                 continue
             # Subtitle
@@ -228,6 +318,7 @@ class MediaFile(BaseFile):
                 if "tags" in item and "language" in item["tags"]:
                     language = item["tags"]["language"]
                 s_stream = SubtitleStream(item["index"], item["codec_name"], language)
+                s_stream.stream_id = item.get("id")
                 self.appendSubtitleStream(s_stream)
                 continue
 
@@ -238,6 +329,7 @@ class MediaFile(BaseFile):
 
         # Special calculation for vido bitrate if missing from stream
         f_bitrate = int(json_data["format"]["bit_rate"])
+        self.format_bitrate = f_bitrate
         a_bitrate_total = 0
         v_bitrate_total = 0
         v_bitrate_missing = 0
@@ -260,25 +352,33 @@ class MediaFile(BaseFile):
             elif a_bitrate < 96000:
                 a_stream.bitrate = 96000
 
-        # Video sanity (transparency level)
-        for v_stream in self.getVideoStreams():
-            if v_stream.width == None:
-                txt = "Unknown video width for: {}".format(self.name)
-                self.log.warning(txt)
-            elif v_stream.width <= 544:
-                v_stream.bitrate = min(v_stream.bitrate, 1352000)
-            elif v_stream.width <= 720:
-                v_stream.bitrate = min(v_stream.bitrate, 1789000)
-            elif v_stream.width <= 1280:
-                v_stream.bitrate = min(v_stream.bitrate, 3977000)
-            elif v_stream.width <= 1920:
-                v_stream.bitrate = min(v_stream.bitrate, 8948000)
-            elif v_stream.width <= 3840:
-                v_stream.bitrate = min(v_stream.bitrate, 35795000)
-
         self.__info_populated = True
         return True, "Success"
 
+    def estimate_video_bitrates(self):
+        """
+        Replace the video bit rates derived from the format bit rate by estimates from sampled packet sizes. The
+        estimate costs an ffprobe run, so it is only made when a caller needs the bit rate, and it is stored with
+        the probe result so an unchanged file is estimated once.
+        """
+        self.getInfo()
+        pending = [v_stream for v_stream in self.getVideoStreams() if v_stream.estimate_pending]
+        if pending == []:
+            return
+        for v_stream in pending:
+            estimate = self.prober.estimate_bitrate(self.name, v_stream, self.length, self.format_bitrate,
+                                                    self.start_time, self.log)
+            v_stream.estimate_pending = False
+            if estimate == None:
+                continue
+            v_stream.max_bitrate = estimate.peak
+            v_stream.bitrate = estimate.average
+        try:
+            identity = FileIdentity.from_path(self.name)
+        except OSError:
+            return
+        self.__store_file_info(identity)
+
     def get_media_info(self):
         m_type = self.__get_type(self.name)
         if m_type == None:
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    opusencoder.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     19 Oct 2026, (03:20)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+
+from typing import List, Optional
+
+# Bitrate per channel of the opus encodes and the transparency limits MediaFile holds audio bitrates in
+BITRATE_PER_CHANNEL = 64000
+MIN_BITRATE = 96000
+MAX_BITRATE = 320000
+
+def opus_bitrate(channels) -> int:
+    """
+    Bitrate the opus plugin encodes a PCM stream with, the same for a stream decoded or normalized on the way.
+    """
+    return min(max(BITRATE_PER_CHANNEL * channels, MIN_BITRATE), MAX_BITRATE)
+
+def opus_layout(channel_layout) -> str:
+    """
+    Channel layout a stream is encoded to opus with, side and wide channels are mapped to the plain layout.
+    """
+    return re.search(r'^[^\(]+', channel_layout).group(0)
+
+def opus_args(a_stream, a_index, filters = None, channelmap: Optional[str] = None, bitrate = None) -> List[str]:
+    """
+    libopus encoder options of one audio stream with the channel layout and bitrate rules of the opus plugin. The
+    filters run before the channel map, channelmap replaces the map to the layout of the stream and bitrate the
+    per channel bitrate of opus_bitrate.
+    """
+    filters = ([] if filters == None else list(filters))
+    if channelmap == None:
+        channelmap = "channelmap=channel_layout={}".format(opus_layout(a_stream.channel_layout))
+    filters.append(channelmap)
+    bitrate = (opus_bitrate(a_stream.channels) if bitrate == None else bitrate)
+    args = ["-c:a:{}".format(a_index), "libopus", "-filter:a:{}".format(a_index), ",".join(filters)]
+    # Set compression level to "lossless" and the bitrate
+    args.extend(["-compression_level", "10", "-b:a:{}".format(a_index), "{}".format(bitrate)])
+    return args
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    probe.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (13:40)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import subprocess
+import threading
+import time
+
+from typing import Iterable, List, Optional, Tuple
+
+from . import bitrate
+from . import matroska
+from . import mp4
+from . import mpegps
+
+# Probe windows (analyzeduration in microseconds, probesize in bytes) tried in order
+PROBE_STAGES = [(5000000, 5000000), (250000000, 250000000)]
+# Only used when the program stream scanner can not read a VOB
+PROBE_STAGES_VOB = [(5000000, 5000000), (500000000, 500000000)]
+
+# Containers that never store a per stream bit rate, a missing bit_rate is not a reason to escalate
+NO_STREAM_BITRATE_FORMATS = ["matroska", "webm"]
+
+# Containers without a stream header, streams are only found when their first packet is read
+NO_HEADER_FORMATS = ["mpeg"]
+
+# Subtitles that are pictures, ffmpeg needs their size from a packet before it can map them
+BITMAP_SUBTITLE_CODECS = ["dvd_subtitle", "dvb_subtitle", "hdmv_pgs_subtitle"]
+
+# The only entries read from a probe, everything else ffprobe knows is left out of the output
+SHOW_ENTRIES = (
+    "format=format_name,size,start_time,duration,bit_rate"
+    ":stream=index,id,codec_type,codec_name,bit_rate,max_bit_rate,width,height,avg_frame_rate,channels,channel_layout"
+    ":stream_tags=language"
+)
+
+# Native readers tried before ffprobe, (stage name, file extensions, probe function)
+NATIVE_PROBERS = [
+    ("matroska", [".mkv", ".mka", ".mks", ".webm"], matroska.probe),
+    ("mp4", [".mp4", ".m4v", ".mov"], mp4.probe),
+    ("mpegps", [".vob"], mpegps.probe),
+]
+
+# Backslash escapes used by the flat writer for string values
+FLAT_ESCAPE = re.compile(r"\\(.)")
+FLAT_ESCAPE_CHARS = {"n": "\n", "r": "\r"}
+
+def ffprobe_args(name, window: Tuple[int, int]) -> List[str]:
+    analyzeduration, probesize = window
+    args = ["ffprobe", "-v", "quiet", "-hide_banner", "-show_entries", SHOW_ENTRIES, "-print_format", "flat"]
+    args.extend(["-analyzeduration", str(analyzeduration), "-probesize", str(probesize)])
+    args.extend(["-i", name])
+    return args
+
+def parse_flat(lines: Iterable[str]) -> Optional[dict]:
+    """
+    Parse the output of the ffprobe flat writer line by line into the layout of the json writer.
+
+    Lines look like 'streams.stream.1.tags.language="eng"' or 'format.size="1024"', fields that ffprobe
+    could not determine are printed as "N/A" and left out like the json writer does.
+    """
+    data = {"format": {}, "streams": []}
+    streams = {}
+    for line in lines:
+        key, sep, value = line.rstrip("\r\n").partition("=")
+        if sep == "":
+            continue
+        if value.startswith('"') and value.endswith('"') and len(value) >= 2:
+            value = FLAT_ESCAPE.sub(lambda m: FLAT_ESCAPE_CHARS.get(m.group(1), m.group(1)), value[1:-1])
+            if value == "N/A":
+                continue
+        elif value.lstrip("-").isdigit():
+            value = int(value)
+        parts = key.split(".")
+        if parts[0] == "format" and len(parts) == 2:
+            data["format"][parts[1]] = value
+        elif parts[0] == "streams" and len(parts) >= 4 and parts[2].isdigit():
+            item = streams.setdefault(int(parts[2]), {})
+            if len(parts) == 4:
+                item[parts[3]] = value
+            elif len(parts) == 5 and parts[3] == "tags":
+                item.setdefault("tags", {})[parts[4]] = value
+    if data["format"] == {}:
+        return None
+    data["streams"] = [streams[i] for i in sorted(streams)]
+    return data
+
+def ffprobe(name, window: Tuple[int, int]) -> Optional[dict]:
+    try:
+        pipe = subprocess.Popen(ffprobe_args(name, window), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, encoding='utf8', errors='replace')
+        with pipe.stdout:
+            data = parse_flat(pipe.stdout)
+        pipe.wait()
+    except:
+        return None
+    return data
+
+class ProbeResult(object):
+    def __init__(self, data, stage, window, elapsed):
+        self.data = data
+        self.stage = stage
+        self.window = window
+        self.elapsed = elapsed
+
+class AdaptiveProber(object):
+    """
+    Probe with a small window first and only escalate to the next window when the result is incomplete.
+
+    Counts which stage resolved each file and why files were escalated so the windows can be tuned.
+    Files with a native reader are read without ffprobe first, that stage is counted by the reader name.
+    Bit rate estimates of video streams are made on request by MediaFile, their cost is counted here as well.
+    """
+    def __init__(self, stages: List[Tuple[int, int]] = None, stages_vob: List[Tuple[int, int]] = None, native = True):
+        self.stages = (PROBE_STAGES if stages == None else stages)
+        self.stages_vob = (PROBE_STAGES_VOB if stages_vob == None else stages_vob)
+        self.native = native
+        self.resolved = {}
+        self.escalations = {}
+        self.estimates = {"streams": 0, "failed": 0, "bytes": 0, "seconds": 0.0}
+        self.__lock = threading.Lock()
+
+    def probe(self, name, log = None) -> Optional[ProbeResult]:
+        stages = (self.stages_vob if ".vob" in name else self.stages)
+        start = time.monotonic()
+        result = self.__probe_native(name, stages, start, log)
+        if result == None:
+            for stage, window in enumerate(stages):
+                done, result = self.__check(name, stages, stage, ffprobe(name, window), start, log)
+                if done:
+                    break
+        return result
+
+    def __probe_native(self, name, stages, start, log):
+        if not self.native:
+            return None
+        ext = os.path.splitext(name)[1].lower()
+        for stage, extensions, native_probe in NATIVE_PROBERS:
+            if ext not in extensions:
+                continue
+            data = native_probe(name)
+            # A stream first seen past the last window is left to ffprobe, the commands never read further
+            if data != None and "window" in data and (data["window"][0] > stages[-1][0] or
+                                                      data["window"][1] > stages[-1][1]):
+                reason = "{} window past last stage".format(stage)
+                data = None
+            elif data == None:
+                reason = "{} fallback".format(stage)
+            if data == None:
+                with self.__lock:
+                    self.escalations[reason] = self.escalations.get(reason, 0) + 1
+                if log != None:
+                    txt = "File: {} could not be read natively, using ffprobe".format(name)
+                    log.debug(txt)
+                return None
+            elapsed = time.monotonic() - start
+            with self.__lock:
+                self.resolved[stage] = self.resolved.get(stage, 0) + 1
+            if log != None:
+                txt = "File: {} read by the {} reader in {:.3f}s".format(name, stage, elapsed)
+                log.debug(txt)
+            # ffmpeg only needs the smallest window to find streams the native reader could see in the header,
+            # readers of header less containers tell where the last stream was first seen, which covers the first
+            # packet of bitmap subtitles as well. Bitmap subtitle sizes are only in their packets which the header
+            # readers do not decode, ffmpeg gets the largest window for them.
+            window = stages[0]
+            if "window" in data:
+                needed = data.pop("window")
+                window = (max(window[0], needed[0]), max(window[1], needed[1]))
+            elif any(item.get("codec_name") in BITMAP_SUBTITLE_CODECS for item in data["streams"]):
+                window = stages[-1]
+            return ProbeResult(data, stage, window, elapsed)
+        return None
+
+    def __check(self, name, stages, stage, data, start, log):
+        window = stages[stage]
+        last = (stage == len(stages) - 1)
+        if data == None:
+            reason = "unreadable"
+            if last:
+                return True, None
+        else:
+            reason = self.incomplete_reason(data, window)
+            if reason == None or last:
+                elapsed = time.monotonic() - start
+                with self.__lock:
+                    self.resolved[stage] = self.resolved.get(stage, 0) + 1
+                if log != None:
+                    txt = "File: {} probed at stage {} (analyzeduration {}, probesize {}) in {:.3f}s".format(
+                        name, stage, window[0], window[1], elapsed)
+                    log.debug(txt)
+                return True, ProbeResult(data, stage, window, elapsed)
+        with self.__lock:
+            self.escalations[reason] = self.escalations.get(reason, 0) + 1
+        if log != None:
+            txt = "File: {} escalating probe after stage {}: {}".format(name, stage, reason)
+            log.debug(txt)
+        return False, None
+
+    def estimate_bitrate(self, name, v_stream, duration, format_bit_rate = 0, start_time = 0.0,
+                         log = None) -> Optional[bitrate.BitrateEstimate]:
+        """
+        Estimate the bit rate of a video stream from sampled packet sizes, None when it could not be estimated.
+        """
+        estimate = (None if duration <= 0 else
+                    bitrate.estimate(name, v_stream.specifier(), duration, format_bit_rate, start_time))
+        with self.__lock:
+            if estimate == None:
+                self.estimates["failed"] += 1
+            else:
+                self.estimates["streams"] += 1
+                self.estimates["bytes"] += estimate.bytes
+                self.estimates["seconds"] += estimate.elapsed
+        if log != None:
+            if estimate == None:
+                txt = "File: {} video bit rate of stream {} could not be estimated".format(name, v_stream.index)
+            else:
+                txt = "File: {} video bit rate of stream {} estimated at {} (peak {}) from {} bytes in {:.3f}s".format(
+                    name, v_stream.index, estimate.average, estimate.peak, estimate.bytes, estimate.elapsed)
+            log.debug(txt)
+        return estimate
+
+    @staticmethod
+    def incomplete_reason(data, window: Tuple[int, int]) -> Optional[str]:
+        format_names = data["format"].get("format_name", "").split(",")
+        check_bitrate = not any(f in NO_STREAM_BITRATE_FORMATS for f in format_names)
+
+        # Streams of header less containers can start past the probed window
+        if any(f in NO_HEADER_FORMATS for f in format_names):
+            if int(data["format"].get("size", 0)) > window[1]:
+                return "stream count may be short"
+
+        # The commands reuse the window, every stream type they map has to be complete in it
+        for item in data["streams"]:
+            codec_type = item.get("codec_type")
+            if codec_type not in ["video", "audio", "subtitle"]:
+                continue
+            if "codec_name" not in item:
+                return "missing {} codec".format(codec_type)
+            if codec_type == "subtitle":
+                if item["codec_name"] in BITMAP_SUBTITLE_CODECS and ("width" not in item or "height" not in item):
+                    return "missing subtitle size"
+                continue
+            if codec_type == "video" and item["codec_name"] in ["mjpeg"]:
+                continue
+            if codec_type == "video" and ("width" not in item or "height" not in item):
+                return "missing video width"
+            if codec_type == "audio" and "channels" not in item:
+                return "missing audio channels"
+            if check_bitrate and "bit_rate" not in item:
+                return "missing {} bit_rate".format(codec_type)
+        return None
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "resolved": dict(self.resolved),
+                "escalations": dict(self.escalations),
+                "estimates": dict(self.estimates),
+            }
+
+# Prober used by MediaFile unless one is given
+default_prober = AdaptiveProber()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    provenance.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (22:05)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from collections import namedtuple
+
+from typing import List, Optional
+
+from . import matroska
+
+# One global tag per plugin, ffmpeg copies global tags so a file keeps the tags of every plugin that processed it
+TAG_PREFIX = "PROVENANCE_"
+
+class Provenance(namedtuple("Provenance", ["plugin_id", "version", "settings_hash"])):
+    """
+    How an output file was made, the plugin, its version and settings hash.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def tag_name(plugin_id):
+        return TAG_PREFIX + plugin_id.upper()
+
+    def to_tag(self):
+        return "version={};settings={}".format(self.version, self.settings_hash)
+
+    @classmethod
+    def from_tag(cls, plugin_id, value) -> Optional["Provenance"]:
+        # Fields other than these, like those of older tags, are ignored
+        fields = dict(f.partition("=")[::2] for f in value.split(";"))
+        try:
+            return cls(plugin_id, fields["version"], fields["settings"])
+        except KeyError:
+            return None
+
+    def matches(self, other: "Provenance") -> bool:
+        """
+        Whether the file was made by the same plugin version with the same settings.
+        """
+        return (self.plugin_id == other.plugin_id and self.version == other.version and
+                self.settings_hash == other.settings_hash)
+
+    def getInfo(self):
+        return "Plugin: {}, Version: {}, Settings: {}".format(self.plugin_id, self.version, self.settings_hash)
+
+def provenance_args(provenance: Provenance) -> List[str]:
+    """
+    ffmpeg output options writing the provenance tag.
+    """
+    return ["-metadata", "{}={}".format(Provenance.tag_name(provenance.plugin_id), provenance.to_tag())]
+
+def read_provenance(name, plugin_id) -> Optional[Provenance]:
+    """
+    Read the provenance tag of a plugin from the Matroska header, None when the file was not made by the plugin.
+    """
+    tags = matroska.read_tags(name)
+    if tags == None:
+        return None
+    value = tags[0].get(Provenance.tag_name(plugin_id))
+    if value == None:
+        return None
+    return Provenance.from_tag(plugin_id, value)
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    r128.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (23:10)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import math
+import os
+import subprocess
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# EBU R128 gates, the relative gates are below the mean of the blocks above the absolute gate
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+LRA_RELATIVE_GATE = -20.0
+LRA_LOW = 0.10
+LRA_HIGH = 0.95
+
+# Histogram bins per LU, the ebur128 metadata has three decimals so every block value has its own bin
+BINS_PER_LU = 1000
+
+# Blocks are 400 ms (gating) and 3 s (short-term) long and start every 100 ms
+BLOCK_STEP = 0.1
+SHORT_TERM_SECONDS = 3.0
+
+# Decoded before a chunk so that its first short-term block is complete and the decoder has settled
+CHUNK_PREROLL = SHORT_TERM_SECONDS
+
+DEFAULT_CHUNK_SECONDS = 300
+
+# Sampled estimation, window length and the two sided 95 % quantile of the confidence bound
+DEFAULT_WINDOW_SECONDS = 30
+CONFIDENCE_Z = 1.96
+
+def block_energy(loudness):
+    return 10 ** ((loudness + 0.691) / 10)
+
+def energy_loudness(energy):
+    return -0.691 + 10 * math.log10(energy)
+
+class LoudnessHistogram(object):
+    """
+    Loudness of a stream, or of a part of one, as histograms of the gating block and short-term block loudness
+    above the absolute gate, and the true peak.
+
+    Histograms of the parts of a stream are merged by adding the counts. The gates only depend on the merged
+    counts, so the merged histogram gives the same integrated loudness, loudness range and true peak as one
+    histogram filled with the same blocks in a single pass.
+    """
+    def __init__(self, blocks = None, short_term = None, true_peak = 0.0):
+        self.blocks = (Counter() if blocks == None else blocks)
+        self.short_term = (Counter() if short_term == None else short_term)
+        self.true_peak = true_peak
+
+    def add_block(self, loudness):
+        if loudness > ABSOLUTE_GATE:
+            self.blocks[int(round(loudness * BINS_PER_LU))] += 1
+
+    def add_short_term(self, loudness):
+        if loudness > ABSOLUTE_GATE:
+            self.short_term[int(round(loudness * BINS_PER_LU))] += 1
+
+    def add_peak(self, peak):
+        """
+        Linear sample peak of the oversampled signal.
+        """
+        self.true_peak = max(self.true_peak, peak)
+
+    def merge(self, other: "LoudnessHistogram") -> "LoudnessHistogram":
+        self.blocks.update(other.blocks)
+        self.short_term.update(other.short_term)
+        self.true_peak = max(self.true_peak, other.true_peak)
+        return self
+
+    @staticmethod
+    def __gate(hist: Counter, relative_gate) -> Optional[float]:
+        n = sum(hist.values())
+        if n == 0:
+            return None
+        energy = sum(count * block_energy(key / BINS_PER_LU) for key, count in hist.items())
+        return energy_loudness(energy / n) + relative_gate
+
+    def threshold(self) -> float:
+        """
+        Relative gate of the integrated loudness.
+        """
+        threshold = self.__gate(self.blocks, RELATIVE_GATE)
+        return (ABSOLUTE_GATE if threshold == None else threshold)
+
+    def integrated(self) -> float:
+        n, energy = self.gated(self.threshold())
+        return (ABSOLUTE_GATE if n == 0 else energy_loudness(energy / n))
+
+    def loudness_range(self) -> float:
+        threshold = self.__gate(self.short_term, LRA_RELATIVE_GATE)
+        if threshold == None:
+            return 0.0
+        keys = sorted(key for key in self.short_term if key / BINS_PER_LU > threshold)
+        n = sum(self.short_term[key] for key in keys)
+        if n == 0:
+            return 0.0
+        # Same percentile rule as the ffmpeg ebur128 filter, the first value with more blocks below it
+        low = high = None
+        seen = 0
+        for key in keys:
+            seen += self.short_term[key]
+            if low == None and seen > int(n * LRA_LOW):
+                low = key
+            if seen > int(n * LRA_HIGH):
+                high = key
+                break
+        return (high - low) / BINS_PER_LU
+
+    def gated(self, threshold) -> Tuple[int, float]:
+        """
+        Number and summed energy of the blocks above a relative gate, the gate of a sampled stream is the gate of
+        all of its windows together.
+        """
+        n = 0
+        energy = 0.0
+        for key, count in self.blocks.items():
+            if key / BINS_PER_LU > threshold:
+                n += count
+                energy += count * block_energy(key / BINS_PER_LU)
+        return n, energy
+
+    def true_peak_db(self) -> float:
+        return (-math.inf if self.true_peak <= 0 else 20 * math.log10(self.true_peak))
+
+    def to_measured(self) -> dict:
+        """
+        Pass 1 values in the layout of the loudnorm json output. The target offset is only used by loudnorm when
+        it can not correct linearly, it is left at 0.
+        """
+        true_peak = max(self.true_peak_db(), -99.0)
+        return {
+            "input_i": "{:.2f}".format(self.integrated()),
+            "input_tp": "{:.2f}".format(true_peak),
+            "input_lra": "{:.2f}".format(self.loudness_range()),
+            "input_thresh": "{:.2f}".format(self.threshold()),
+            "target_offset": "0.00",
+        }
+
+def chunk_args(name, specifier, start, end = None) -> List[str]:
+    """
+    ffmpeg command printing the ebur128 values of every 100 ms of a stream between start and end in seconds.
+    """
+    args = ["ffmpeg", "-hide_banner", "-nostdin", "-nostats", "-v", "error"]
+    if start > 0:
+        args.extend(["-ss", "{:.1f}".format(start)])
+    args.extend(["-i", name])
+    if end != None:
+        args.extend(["-t", "{:.1f}".format(end - start)])
+    args.extend(["-map", "0:{}".format(specifier), "-vn", "-sn", "-dn"])
+    args.extend(["-af", "ebur128=metadata=1:peak=true,ametadata=mode=print:file=-", "-f", "null", "-"])
+    return args
+
+class ChunkParser(object):
+    """
+    Fill a histogram from the ametadata output of an ebur128 run decoding from start, lines look like
+    'frame:12 pts:57600 pts_time:1.2' followed by 'lavfi.r128.M=-23.456'.
+
+    Only blocks ending after keep_from and up to keep_to are added, blocks that started in the preroll belong to
+    the chunk before. Block ends are compared in whole 100 ms steps so the chunks fit together exactly.
+    """
+    def __init__(self, start, keep_from, keep_to = None):
+        self.start = start
+        self.keep_from = int(round(keep_from / BLOCK_STEP))
+        self.keep_to = (None if keep_to == None else int(round(keep_to / BLOCK_STEP)))
+        self.histogram = LoudnessHistogram()
+        self.__keep = False
+
+    def feed(self, line):
+        line = line.strip()
+        if line.startswith("frame:"):
+            fields = dict(f.partition(":")[::2] for f in line.split())
+            try:
+                end = int(round((self.start + float(fields["pts_time"])) / BLOCK_STEP)) + 1
+            except (KeyError, ValueError):
+                self.__keep = False
+                return
+            self.__keep = end > self.keep_from and (self.keep_to == None or end <= self.keep_to)
+            return
+        if not self.__keep:
+            return
+        key, _, value = line.partition("=")
+        try:
+            if key == "lavfi.r128.M":
+                self.histogram.add_block(float(value))
+            elif key == "lavfi.r128.S":
+                self.histogram.add_short_term(float(value))
+            elif key.startswith("lavfi.r128.true_peaks_ch"):
+                self.histogram.add_peak(float(value))
+        except ValueError:
+            pass
+
+    def feed_lines(self, lines: Iterable[str]):
+        for line in lines:
+            self.feed(line)
+
+def measure_chunk(name, specifier, keep_from, keep_to = None, channels = 2, channel_layout = None) -> LoudnessHistogram:
+    """
+    Histogram of the blocks of a stream ending between keep_from and keep_to in seconds, None for the end. ebur128
+    handles any channel layout itself, the channels are only used by the numpy meter.
+    """
+    start = max(0.0, keep_from - CHUNK_PREROLL)
+    parser = ChunkParser(start, keep_from, keep_to)
+    pipe = subprocess.Popen(chunk_args(name, specifier, start, keep_to), stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, universal_newlines=True, encoding='utf8', errors='replace')
+    with pipe.stdout:
+        parser.feed_lines(pipe.stdout)
+    if pipe.wait() != 0:
+        raise RuntimeError("ebur128 failed on stream {} of {} from {}s".format(specifier, name, keep_from))
+    return parser.histogram
+
+def chunk_bounds(duration, chunk_seconds = DEFAULT_CHUNK_SECONDS) -> List[Tuple[float, Optional[float]]]:
+    """
+    Chunks (keep_from, keep_to) of equal length on the 100 ms block grid, the last one runs to the end.
+    """
+    steps = int(math.ceil(duration / BLOCK_STEP))
+    chunk_steps = max(1, int(round(chunk_seconds / BLOCK_STEP)))
+    chunks = max(1, int(math.ceil(steps / chunk_steps)))
+    chunk_steps = int(math.ceil(steps / chunks))
+    bounds = []
+    for i in range(chunks):
+        keep_to = (None if i == chunks - 1 else (i + 1) * chunk_steps * BLOCK_STEP)
+        bounds.append((i * chunk_steps * BLOCK_STEP, keep_to))
+    return bounds
+
+def sample_bounds(duration, windows, window_seconds = DEFAULT_WINDOW_SECONDS) -> Optional[List[Tuple[float, float]]]:
+    """
+    Windows (keep_from, keep_to) of window_seconds evenly spaced over the stream on the 100 ms block grid, each one
+    centered in its share of the duration. None when the windows would cover the whole stream.
+    """
+    if windows < 1 or windows * window_seconds >= duration:
+        return None
+    window_steps = max(1, int(round(window_seconds / BLOCK_STEP)))
+    bounds = []
+    for i in range(windows):
+        center = (i + 0.5) * duration / windows
+        keep_from = max(0, int(round(center / BLOCK_STEP)) - window_steps // 2)
+        bounds.append((keep_from * BLOCK_STEP, (keep_from + window_steps) * BLOCK_STEP))
+    return bounds
+
+def estimate_bound(histograms: List[LoudnessHistogram], z = CONFIDENCE_Z) -> Tuple[LoudnessHistogram, float]:
+    """
+    Merged histogram of the windows of a stream and the confidence bound in LU of its integrated loudness.
+
+    The integrated loudness is the gated energy of the windows over their gated blocks, a ratio estimate. Its
+    standard error comes from how much the windows disagree, the bound is the larger distance in LU from the
+    estimate to the ends of the interval. It is infinite with fewer than two windows or a silent stream.
+    """
+    merged = LoudnessHistogram()
+    for histogram in histograms:
+        merged.merge(histogram)
+    k = len(histograms)
+    threshold = merged.threshold()
+    gated = [histogram.gated(threshold) for histogram in histograms]
+    n = sum(count for count, _ in gated)
+    if k < 2 or n == 0:
+        return merged, math.inf
+    ratio = sum(energy for _, energy in gated) / n
+    if ratio <= 0:
+        return merged, math.inf
+    mean_n = n / k
+    variance = sum((energy - ratio * count) ** 2 for count, energy in gated) / (k * (k - 1) * mean_n ** 2)
+    error = z * math.sqrt(variance)
+    if error >= ratio:
+        return merged, math.inf
+    return merged, max(10 * math.log10((ratio + error) / ratio), -10 * math.log10((ratio - error) / ratio))
+
+class ParallelMeter(object):
+    """
+    Measure the loudness of several audio streams of a file at once, every stream is split in chunks in time and
+    each chunk is measured by its own ebur128 run in a process pool. The histograms of the chunks of a stream are
+    merged, the result is the same as measuring the stream in one pass.
+
+    Chunks are cut by seeking, which is only as exact as the timestamps of the container, and codecs that dither,
+    like AC-3, do not decode the same samples after a seek. The integrated loudness matches a single pass at the
+    precision loudnorm prints, the loudness range and true peak can differ in the last decimal.
+
+    Chunks are measured by the numpy meter when numpy is installed, otherwise by the ffmpeg ebur128 filter.
+    """
+    def __init__(self, workers = None, chunk_seconds = DEFAULT_CHUNK_SECONDS, log = None):
+        self.workers = ((os.cpu_count() or 1) if workers == None else workers)
+        self.chunk_seconds = chunk_seconds
+        self.log = log
+
+    def measure(self, mediafile, streams) -> Dict[int, LoudnessHistogram]:
+        """
+        Histograms of the streams by stream index, raises when a chunk can not be measured.
+        """
+        bounds = chunk_bounds(mediafile.length, self.chunk_seconds)
+        windows = self.measure_windows(mediafile, streams, bounds)
+        histograms = {}
+        for index, chunks in windows.items():
+            histograms[index] = LoudnessHistogram()
+            for histogram in chunks:
+                histograms[index].merge(histogram)
+        return histograms
+
+    def measure_windows(self, mediafile, streams, bounds) -> Dict[int, List[LoudnessHistogram]]:
+        """
+        Histograms of every window (keep_from, keep_to) of the streams by stream index, in the order of bounds.
+        """
+        start = time.monotonic()
+        chunk = (measure_chunk if pcm_meter == None else pcm_meter.measure_chunk)
+        if self.log != None:
+            txt = "Measuring {} streams in {} chunks with {} workers".format(len(streams), len(bounds), self.workers)
+            self.log.debug(txt)
+        histograms = {a_stream.index: [] for a_stream in streams}
+        with ProcessPoolExecutor(max_workers = self.workers) as pool:
+            futures = []
+            for a_stream in streams:
+                for keep_from, keep_to in bounds:
+                    future = pool.submit(chunk, mediafile.name, a_stream.specifier(), keep_from, keep_to,
+                                         a_stream.channels, a_stream.channel_layout)
+                    futures.append((a_stream.index, future))
+            for index, future in futures:
+                histograms[index].append(future.result())
+        if self.log != None:
+            elapsed = time.monotonic() - start
+            seconds = sum(((mediafile.length if keep_to == None else keep_to) - keep_from)
+                          for keep_from, keep_to in bounds) * len(streams)
+            txt = "Measured {:.0f}s of audio in {:.1f}s, {:.1f}x realtime".format(
+                seconds, elapsed, seconds / max(elapsed, 0.001))
+            self.log.debug(txt)
+        return histograms
+
+class SampledMeter(ParallelMeter):
+    """
+    Estimate the loudness of long streams from evenly spaced windows instead of decoding all of them.
+
+    Each window is decoded from an input seek, ffmpeg seeks to the index entry before it, the keyframe the demuxer
+    can start from, and decodes the preroll up to the window. The integrated loudness is gated over all windows
+    together, with a confidence bound from the spread between the windows. The true peak is the peak of the
+    windows, a peak outside them is missed.
+    """
+    def __init__(self, windows, window_seconds = DEFAULT_WINDOW_SECONDS, workers = None, log = None):
+        ParallelMeter.__init__(self, workers = workers, log = log)
+        self.windows = windows
+        self.window_seconds = window_seconds
+
+    def estimate(self, mediafile, streams) -> Optional[Dict[int, Tuple[LoudnessHistogram, float]]]:
+        """
+        Merged histogram and confidence bound in LU by stream index, None when the windows would cover the whole
+        stream and a full measurement is as fast.
+        """
+        bounds = sample_bounds(mediafile.length, self.windows, self.window_seconds)
+        if bounds == None:
+            return None
+        windows = self.measure_windows(mediafile, streams, bounds)
+        return {index: estimate_bound(histograms) for index, histograms in windows.items()}
+
+# The numpy meter measures the chunks when numpy is installed, it imports this module so it is imported last
+try:
+    from . import loudnessmeter as pcm_meter
+except ImportError:
+    pcm_meter = None
@@ -21,9 +21,11 @@
         If not, see <https://www.gnu.org/licenses/>.
 """
 
-import re
+from typing import List
 
+from .loudness import LoudnessTarget
 from .mediafile import MediaFile
+from .opusencoder import opus_args
 
 class TranscodeResult(object):
     def __init__(self, status = True, string = None):
@@ -94,8 +96,11 @@ class TranscodeJob(object):
         # Use ffmpeg
         self.args = ["ffmpeg", "-hide_banner", "-loglevel", "info", "-vsync", "0"]
 
-        # Extend stream scan for VOB
-        if ".vob" in self.mediafile.name:
+        # Reuse the probe window that resolved the file, extend stream scan for VOB when unknown
+        if self.mediafile.probe_window != None:
+            analyzeduration, probesize = self.mediafile.probe_window
+            self.args.extend(["-analyzeduration", str(analyzeduration), "-probesize", str(probesize)])
+        elif ".vob" in self.mediafile.name:
             self.args.extend(["-analyzeduration", "500M", "-probesize", "500M"])
         else :
             self.args.extend(["-analyzeduration", "250M", "-probesize", "250M"])
@@ -127,16 +132,16 @@ class TranscodeJob(object):
 
         # Loop over video steams
         for v_stream in self.mediafile.getVideoStreams():
-            self.args.extend(["-map", "0:{}".format(v_stream.index)])
+            self.args.extend(["-map", "0:{}".format(v_stream.specifier())])
 
         # Loop over audio streams
         for a_stream in self.mediafile.getAudioStreams():
-            self.args.extend(["-map", "0:{}".format(a_stream.index)])
+            self.args.extend(["-map", "0:{}".format(a_stream.specifier())])
 
         # Loop over subtitle streams
         for s_stream in self.mediafile.getSubtitleStreams():
             if s_stream.codec in ["subrip", "ass", "dvd_subtitle", "dvb_subtitle", "pgssub", "hdmv_pgs_subtitle"]:
-                self.args.extend(["-map", "0:{}".format(s_stream.index)])
+                self.args.extend(["-map", "0:{}".format(s_stream.specifier())])
 
         # Loop over subtitle files
         for i in range(1, m_index):
@@ -155,10 +160,11 @@ class TranscodeJob(object):
             self.args.extend(["-g", "250"])
             # Quality Min - Max
             self.args.extend(["-qmin", "0", "-qmax", "34"])
-            # Set bitrate targets, bitrate=0 maxrate=input_bitrate
-            self.args.extend(["-b:v:{}".format(v_index), "0", "-maxrate", str(v_stream.bitrate)])
-            # Set buffer to 2 * maxrate
-            self.args.extend(["-bufsize", str(v_stream.bitrate * 2)])
+            # Set bitrate targets, bitrate=0 maxrate=input_bitrate capped by frame width
+            v_bitrate, v_max_bitrate = v_stream.target_bitrates()
+            self.args.extend(["-b:v:{}".format(v_index), "0", "-maxrate", str(v_bitrate)])
+            # Set buffer to 2 * maxrate, or the measured peak of the source when it is higher
+            self.args.extend(["-bufsize", str(max(v_bitrate * 2, v_max_bitrate))])
             # Use spatial aq
             self.args.extend(["-spatial_aq", "1", "-aq-strength", "15"])
             v_index += 1
@@ -181,3 +187,118 @@ class TranscodeJob(object):
         # Set output filename
         self.args.extend(["-f", "matroska", self.new_file.name])
         return
+
+
+class MeasureJob(TranscodeJob):
+    """
+    First loudness pass as a single ffmpeg command, the given audio streams are decoded once and each is measured
+    by its own loudnorm instance. Nothing is written, the values are printed as json when the input ends.
+
+    The n:th stream is measured by Parsed_loudnorm_<n>, see LoudnormParser.
+    """
+    def __init__(self, mediafile, log, target: LoudnessTarget, streams, args = None, result = None):
+        TranscodeJob.__init__(self, mediafile, log, args, result)
+        self.target = target
+        self.streams = streams
+
+    def create_cmd(self, print_debug = False):
+        txt = self.mediafile.getInfo()
+        if print_debug == True:
+            self.log.debug(txt)
+        if txt == "":
+            self.log.error("Info could not be generated")
+            raise Exception(txt)
+
+        # Use ffmpeg
+        self.args = ["ffmpeg", "-hide_banner", "-loglevel", "info", "-nostdin"]
+
+        # Reuse the probe window that resolved the file
+        if self.mediafile.probe_window != None:
+            analyzeduration, probesize = self.mediafile.probe_window
+            self.args.extend(["-analyzeduration", str(analyzeduration), "-probesize", str(probesize)])
+
+        # Add main input file
+        self.args.extend(["-i", self.mediafile.name])
+
+        # One loudnorm per stream, only loudnorm filters so their position is the order of the streams
+        graph = []
+        for a_index, a_stream in enumerate(self.streams):
+            graph.append("[0:{}]{}[m{}]".format(a_stream.specifier(), self.target.measure_filter(), a_index))
+        self.args.extend(["-filter_complex", ";".join(graph)])
+        for a_index in range(len(self.streams)):
+            self.args.extend(["-map", "[m{}]".format(a_index)])
+
+        # Discard the output
+        self.args.extend(["-f", "null", "-"])
+        return
+
+
+class NormalizeJob(TranscodeJob):
+    """
+    Second loudness pass as a single ffmpeg command, every measured audio stream is corrected with loudnorm and
+    encoded to PCM, or straight to opus with the channel layout and bitrate rules of the opus plugin.
+
+    measured holds the loudnorm pass 1 values by stream index, streams without them are copied.
+    """
+    def __init__(self, mediafile, log, target: LoudnessTarget, measured, args = None, result = None, new_file = None,
+                 tag_args = None, codec = "libopus"):
+        TranscodeJob.__init__(self, mediafile, log, args, result, new_file)
+        self.target = target
+        self.measured = measured
+        self.tag_args = ([] if tag_args == None else tag_args)
+        self.codec = codec
+
+    def audio_args(self, a_stream, a_index) -> List[str]:
+        """
+        Encoder options of one audio stream, corrected with its pass 1 values or copied without them.
+        """
+        measured = self.measured.get(a_stream.index)
+        if measured == None:
+            return ["-c:a:{}".format(a_index), "copy"]
+        if self.codec != "libopus":
+            return ["-c:a:{}".format(a_index), self.codec, "-filter:a:{}".format(a_index),
+                    self.target.loudnorm_filter(measured)]
+        return opus_args(a_stream, a_index, [self.target.loudnorm_filter(measured)])
+
+    def create_cmd(self, print_debug = False):
+        txt = self.mediafile.getInfo()
+        if print_debug == True:
+            self.log.debug(txt)
+        if txt == "":
+            self.log.error("Info could not be generated")
+            raise Exception(txt)
+
+        # Use ffmpeg
+        self.args = ["ffmpeg", "-hide_banner", "-loglevel", "info", "-vsync", "0"]
+
+        # Reuse the probe window that resolved the file
+        if self.mediafile.probe_window != None:
+            analyzeduration, probesize = self.mediafile.probe_window
+            self.args.extend(["-analyzeduration", str(analyzeduration), "-probesize", str(probesize)])
+
+        # Add main input file
+        self.args.extend(["-i", self.mediafile.name])
+
+        # Map video, audio and subtitle streams
+        for v_stream in self.mediafile.getVideoStreams():
+            self.args.extend(["-map", "0:{}".format(v_stream.specifier())])
+        for a_stream in self.mediafile.getAudioStreams():
+            self.args.extend(["-map", "0:{}".format(a_stream.specifier())])
+        for s_stream in self.mediafile.getSubtitleStreams():
+            if s_stream.codec in ["subrip", "ass", "dvd_subtitle", "dvb_subtitle", "pgssub", "hdmv_pgs_subtitle"]:
+                self.args.extend(["-map", "0:{}".format(s_stream.specifier())])
+
+        # Copy video and subtitle streams
+        self.args.extend(["-c:v", "copy", "-c:s", "copy"])
+
+        # Config audio streams
+        a_index = 0
+        for a_stream in self.mediafile.getAudioStreams():
+            self.args.extend(self.audio_args(a_stream, a_index))
+            a_index += 1
+
+        self.args.extend(self.tag_args)
+
+        # Set output filename
+        self.args.extend(["-f", "matroska", self.new_file.name])
+        return
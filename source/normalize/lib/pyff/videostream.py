@@ -21,13 +21,23 @@
         If not, see <https://www.gnu.org/licenses/>.
 """
 
+from typing import Tuple
+
 from .mediastream import MediaStream
 
+# Highest bit rate an encode is given by frame width (transparency level)
+BITRATE_CAPS = [(544, 1352000), (720, 1789000), (1280, 3977000), (1920, 8948000), (3840, 35795000)]
+
 class VideoStream(MediaStream):
-    def __init__(self, index, codec, bitrate, width, height):
+    def __init__(self, index, codec, bitrate, width, height, max_bitrate = 0, frame_rate = 0.0,
+                 estimate_pending = False):
         MediaStream.__init__(self, index, codec, bitrate)
         self.__height = height
         self.__width = width
+        self.__max_bitrate = max_bitrate
+        self.__frame_rate = frame_rate
+        # The bit rate is derived from the format bit rate until MediaFile estimates it
+        self.estimate_pending = estimate_pending
 
     @property
     def height(self):
@@ -53,8 +63,53 @@ class VideoStream(MediaStream):
             raise ValueError("Width should be a positive number over zero")
         self.__width = width
 
+    @property
+    def max_bitrate(self):
+        return self.__max_bitrate
+
+    @max_bitrate.setter
+    def max_bitrate(self, max_bitrate):
+        if type(max_bitrate) is not int:
+            raise TypeError("Max bitrate is not integer")
+        self.__max_bitrate = max_bitrate
+
+    @property
+    def frame_rate(self):
+        return self.__frame_rate
+
+    @frame_rate.setter
+    def frame_rate(self, frame_rate):
+        if type(frame_rate) is not float:
+            raise TypeError("Frame rate is not float")
+        self.__frame_rate = frame_rate
+
+    def target_bitrates(self) -> Tuple[int, int]:
+        """
+        Bit rate and peak bit rate an encode of the stream is given, the bit rate of the source capped by frame
+        width with the measured peak kept in proportion.
+        """
+        bitrate = self.bitrate
+        if self.width != None:
+            for width, cap in BITRATE_CAPS:
+                if self.width <= width:
+                    bitrate = min(bitrate, cap)
+                    break
+        max_bitrate = self.max_bitrate
+        if max_bitrate != 0 and bitrate < self.bitrate:
+            max_bitrate = int(max_bitrate * bitrate / self.bitrate)
+        return bitrate, max_bitrate
+
     def getInfo(self):
         txt = ""
         txt += MediaStream.getInfo(self) + ", "
         txt += "Width: {}, Heigth {}".format(self.width, self.height)
         return txt
+
+    def to_dict(self):
+        data = MediaStream.to_dict(self)
+        data["width"] = self.width
+        data["height"] = self.height
+        data["max_bitrate"] = self.max_bitrate
+        data["frame_rate"] = self.frame_rate
+        data["estimate_pending"] = self.estimate_pending
+        return data
@@ -43,11 +43,15 @@
 import logging
 import os
 import re
+from typing import Dict, List, Optional, Tuple
 
 from unmanic.libs.unplugins.settings import PluginSettings
 from unmanic.libs.system import System
 
-from normalize.lib.pyff import MediaFile
+from normalize.lib.pyff import DecisionMemo, FileIdentity, LoudnessTarget, LoudnormParser, MediaFile, MeasureJob
+from normalize.lib.pyff import NormalizeJob, ParallelMeter, ProbeCache, ProbeRegistry, SampledMeter
+from normalize.lib.pyff import format_measured, marker_args, read_marker, read_version, settings_hash
+from normalize.lib.pyff.loudness import ANALYZER, ESTIMATE_ANALYZER
 
 # Configure plugin logger
 logger = logging.getLogger("Unmanic.Plugin.normalize")
@@ -68,19 +72,240 @@ class Settings(PluginSettings):
 
     """
     settings = {
+        "probe_cache_max_entries": 100000,
+        "probe_failure_retry_hours": 24,
+        "target_loudness": -23.0,
+        "target_true_peak": -2.0,
+        "target_loudness_range": 7.0,
+        "normalize_to_opus": False,
+        "loudness_tolerance": 1.0,
+        "parallel_measure_workers": 0,
+        "parallel_measure_chunk_seconds": 300,
+        "estimate_windows": 0,
+        "estimate_window_seconds": 30,
+        "estimate_max_uncertainty": 0.5,
     }
 
 
-def check_run(m_file: MediaFile) -> bool:
+# Probe cache shared by all runners of this plugin, opened on first use
+probe_cache = None
+
+# Decisions of earlier scans, opened on first use
+decision_memo = None
+
+# Version from info.json, read on first use
+plugin_version = None
+
+# Probe results shared with the other plugins running in this process
+probe_registry = ProbeRegistry()
+
+# Pass 1 commands by input file, the measured streams, the identity of the file and the parser of the command.
+# The repeat pass takes the entry, stores the measurements and encodes
+pending_measurements = {}
+
+
+def get_probe_cache(settings: Settings) -> ProbeCache:
+    global probe_cache
+    if probe_cache == None:
+        db_file = os.path.join(settings.get_profile_directory(), "probe_cache.db")
+        max_entries = int(settings.get_setting("probe_cache_max_entries"))
+        failure_ttl = float(settings.get_setting("probe_failure_retry_hours")) * 3600
+        probe_cache = ProbeCache(db_file, max_entries = max_entries, failure_ttl = failure_ttl, log = logger)
+    return probe_cache
+
+
+def get_plugin_version() -> str:
+    global plugin_version
+    if plugin_version == None:
+        plugin_version = read_version(os.path.join(os.path.dirname(os.path.abspath(__file__)), "info.json"))
+    return plugin_version
+
+
+def get_decision_memo(settings: Settings) -> DecisionMemo:
+    global decision_memo
+    if decision_memo == None:
+        db_file = os.path.join(settings.get_profile_directory(), "decision_memo.db")
+        max_entries = int(settings.get_setting("probe_cache_max_entries"))
+        decision_memo = DecisionMemo(db_file, "normalize", get_plugin_version(), settings_hash(settings.get_setting()),
+                                     max_entries = max_entries, log = logger)
+    return decision_memo
+
+
+def get_target(settings: Settings) -> LoudnessTarget:
+    return LoudnessTarget(
+        float(settings.get_setting("target_loudness")),
+        float(settings.get_setting("target_true_peak")),
+        float(settings.get_setting("target_loudness_range")),
+    )
+
+
+def get_tool_version() -> str:
+    return "normalize {}, ffmpeg loudnorm".format(get_plugin_version())
+
+
+def take_pending(in_abs) -> Optional[tuple]:
+    """
+    Streams and parser of the pass 1 command run on the file, None when there is none to use. The entry of a
+    command that failed or was cancelled has no values for its streams and one of a file changed since no longer
+    applies, both are dropped and the file is decided again.
+    """
+    pending = pending_measurements.pop(in_abs, None)
+    if pending == None:
+        return None
+    streams, identity, parser = pending
+    if len(parser.collector.results) < len(streams):
+        logger.debug("{}: Measure pass did not finish, measuring again".format(in_abs))
+        return None
+    try:
+        if FileIdentity.from_path(in_abs) != identity:
+            logger.debug("{}: Changed since the measure pass, measuring again".format(in_abs))
+            return None
+    except OSError:
+        return None
+    return streams, parser
+
+
+def get_measurements(cache: ProbeCache, identity: FileIdentity, streams, target: LoudnessTarget) -> Dict[int, dict]:
+    """
+    Pass 1 values of the streams measured before, by stream index. The values depend on the target through the
+    offset so they are stored per target.
+    """
+    measured = {}
+    for a_stream in streams:
+        values = cache.get_analysis(identity, a_stream.index, ANALYZER, target.to_tag())
+        if values != None:
+            measured[a_stream.index] = values
+    return measured
+
+
+def store_measurements(cache: ProbeCache, identity: FileIdentity, streams, target: LoudnessTarget,
+                       parser: LoudnormParser) -> List[int]:
+    """
+    Store the pass 1 values of a finished measure command, returns the indexes of the streams that were measured.
+    """
+    stored = []
+    for position, a_stream in enumerate(streams):
+        values = parser.results.get(position)
+        if values == None:
+            continue
+        cache.put_analysis(identity, a_stream.index, ANALYZER, values, target.to_tag())
+        stored.append(a_stream.index)
+    return stored
+
+
+def measure_parallel(settings: Settings, cache: ProbeCache, identity: FileIdentity, m_file: MediaFile, streams,
+                     target: LoudnessTarget) -> Dict[int, dict]:
+    """
+    Measure the streams in this process with the parallel meter and store the values. Streams loudnorm can not
+    correct linearly are left out, as is everything when the meter failed, those are measured by a loudnorm command.
+    """
+    meter = ParallelMeter(workers = int(settings.get_setting("parallel_measure_workers")),
+                          chunk_seconds = float(settings.get_setting("parallel_measure_chunk_seconds")), log = logger)
+    try:
+        histograms = meter.measure(m_file, streams)
+    except Exception as e:
+        logger.warning("{}: Parallel loudness measurement failed, {}".format(m_file.name, e))
+        return {}
+    measured = {}
+    for index, histogram in histograms.items():
+        values = histogram.to_measured()
+        if not target.linear(values):
+            logger.debug("{}: Stream {} needs dynamic correction".format(m_file.name, index))
+            continue
+        measured[index] = values
+        cache.put_analysis(identity, index, ANALYZER, values, target.to_tag())
+    return measured
+
+
+def estimate_loudness(settings: Settings, cache: ProbeCache, identity: FileIdentity, m_file: MediaFile,
+                      streams) -> Dict[int, dict]:
+    """
+    Values of the streams estimated from sampled windows by stream index, the confidence bound in LU under bound.
+    The estimates are stored under their own analyzer name with the windows as params, they only tell whether a
+    stream can be left alone and are never used as pass 1 values.
+    """
+    windows = int(settings.get_setting("estimate_windows"))
+    window_seconds = float(settings.get_setting("estimate_window_seconds"))
+    params = "windows={}x{:.1f}".format(windows, window_seconds)
+    estimated = {}
+    for a_stream in streams:
+        values = cache.get_analysis(identity, a_stream.index, ESTIMATE_ANALYZER, params)
+        if values != None:
+            estimated[a_stream.index] = values
+    streams = [a_stream for a_stream in streams if a_stream.index not in estimated]
+    if len(streams) == 0:
+        return estimated
+
+    workers = int(settings.get_setting("parallel_measure_workers"))
+    meter = SampledMeter(windows, window_seconds = window_seconds, workers = (None if workers == 0 else workers),
+                         log = logger)
+    try:
+        estimates = meter.estimate(m_file, streams)
+    except Exception as e:
+        logger.warning("{}: Loudness estimation failed, {}".format(m_file.name, e))
+        return estimated
+    if estimates == None:
+        logger.debug("{}: Too short to estimate loudness from windows".format(m_file.name))
+        return estimated
+    for index, (histogram, bound) in estimates.items():
+        values = histogram.to_measured()
+        values["bound"] = "{:.2f}".format(bound)
+        logger.debug("{}: Stream {} estimated at {} LUFS +/- {} LU".format(m_file.name, index, values["input_i"],
+                                                                         values["bound"]))
+        estimated[index] = values
+        cache.put_analysis(identity, index, ESTIMATE_ANALYZER, values, params)
+    return estimated
+
+
+def decide(m_file: MediaFile, target: LoudnessTarget, cache: Optional[ProbeCache] = None,
+           tolerance = 0.0) -> Tuple[bool, str]:
+    # Files marked by an earlier run are recognized from the Matroska tags alone, without probing
+    marker = read_marker(m_file.name)
+    if marker != None:
+        if marker["target"] == target.to_tag():
+            return False, "Audio is already normalized to {}".format(marker["target"])
+        logger.debug("{}: Normalized to {}, target is {}".format(m_file.name, marker["target"], target.to_tag()))
+
+    # Probe, raises when the file can not be probed
+    m_file.getInfo()
     normalize = True
+    reason = "Audio can be normalized"
     for a_stream in m_file.getAudioStreams():
         logger.debug("Stream codec   : {}".format(a_stream.codec))
         logger.debug("Stream channels: {}".format(a_stream.channels))
         logger.debug("Stream layout  : {}".format(a_stream.channel_layout))
         if a_stream.codec == "opus" or a_stream.codec == "pcm_s16le":
             normalize = False
+            reason = "Audio is already {}".format(a_stream.codec)
+
+    # Files measured before are left alone when every stream is already close enough to the target
+    a_streams = m_file.getAudioStreams()
+    if normalize and cache != None and len(a_streams) > 0:
+        measured = get_measurements(cache, FileIdentity.from_path(m_file.name), a_streams, target)
+        if len(measured) == len(a_streams) and all(target.within(values, tolerance) for values in measured.values()):
+            normalize = False
+            reason = "Audio streams are within {} LU of the target".format(tolerance)
 
-    return normalize
+    return normalize, reason
+
+
+def check_run(m_file: MediaFile, target: LoudnessTarget, memo: Optional[DecisionMemo] = None,
+              cache: Optional[ProbeCache] = None, tolerance = 0.0) -> Tuple[bool, str]:
+    """
+    Returns whether the file should be normalized and the reason, from the memo when the file was decided before
+    by this plugin version with the same settings.
+    """
+    identity = None
+    if memo != None:
+        identity, memoized = memo.lookup(m_file.name)
+        if memoized != None:
+            logger.debug("{}: {} (memoized)".format(m_file.name, memoized[1]))
+            return memoized
+
+    normalize, reason = decide(m_file, target, cache, tolerance)
+    if memo != None:
+        memo.put(identity, normalize, reason)
+    return normalize, reason
 
 def on_worker_process(data):
     """
@@ -104,95 +329,123 @@ def on_worker_process(data):
     in_abs = os.path.abspath(data.get('file_in'))
     out_abs = os.path.abspath(data.get('file_out'))
 
-    m_file = MediaFile(name = in_abs, log = logger)
-    m_file.getInfo()
-    run_norm = check_run(m_file)
-
-    if run_norm:
-        cmd = [
-            'ffmpeg-normalize',
-            in_abs,
-            '-o', out_abs,
-            '-v',
-            '-pr',
-        ]
-
-        # Set exec cmd
-        data['exec_command'] = cmd
+    target = get_target(settings)
+    cache = get_probe_cache(settings)
+    tolerance = float(settings.get_setting("loudness_tolerance"))
+    m_file = MediaFile(name = in_abs, log = logger, cache = cache, registry = probe_registry)
 
-        # Create parser
-        parser = Parser(logger)
+    # Repeat pass after measuring, the file was decided on the first pass
+    pending = take_pending(in_abs)
+    if pending == None:
+        run_norm, reason = check_run(m_file, target, get_decision_memo(settings), cache, tolerance)
+        logger.debug("Probe cache: {}".format(cache.stats()))
+        logger.debug("Decision memo: {}".format(decision_memo.stats()))
+        if not run_norm:
+            return data
 
-        # Set the parser
+    m_file.getInfo()
+    a_streams = m_file.getAudioStreams()
+    if len(a_streams) == 0:
+        logger.debug("{}: No audio streams".format(in_abs))
+        return data
+    try:
+        identity = FileIdentity.from_path(in_abs)
+    except OSError as e:
+        logger.error("{}: {}".format(in_abs, e))
+        return data
+
+    if pending != None:
+        streams, parser = pending
+        stored = store_measurements(cache, identity, streams, target, parser.collector)
+        logger.debug("{}: Measured streams {}".format(in_abs, stored))
+
+    # Streams measured by an earlier run, or an earlier attempt at this one, go straight to pass 2
+    measured = get_measurements(cache, identity, a_streams, target)
+    missing = [a_stream for a_stream in a_streams if a_stream.index not in measured]
+    close = []
+    if len(missing) > 0 and int(settings.get_setting("estimate_windows")) > 0:
+        # Long streams are estimated from a few windows, those within tolerance even at the edge of the confidence
+        # bound are copied, the others still get a full measurement before they are corrected. The repeat pass
+        # finds the estimates in the cache
+        max_uncertainty = float(settings.get_setting("estimate_max_uncertainty"))
+        estimated = estimate_loudness(settings, cache, identity, m_file, missing)
+        close = sorted(index for index, values in estimated.items() if float(values["bound"]) <= max_uncertainty
+                       and target.within(values, tolerance - float(values["bound"])))
+        missing = [a_stream for a_stream in missing if a_stream.index not in close]
+    if len(missing) > 0 and pending == None and int(settings.get_setting("parallel_measure_workers")) > 0:
+        # Fan out over streams and chunks of time instead of one loudnorm command decoding every stream
+        measured.update(measure_parallel(settings, cache, identity, m_file, missing, target))
+        missing = [a_stream for a_stream in missing if a_stream.index not in measured]
+    if len(missing) > 0 and pending != None:
+        logger.error("{}: Loudness could not be measured for streams {}".format(
+            in_abs, [a_stream.index for a_stream in missing]))
+        return data
+
+    if len(missing) > 0:
+        # Pass 1, measure the missing streams without writing anything and run again on the same file
+        t_job = MeasureJob(m_file, logger, target, missing)
+        t_job.create_cmd()
+        logger.debug("Executing: {}".format(" ".join(t_job.args)))
+
+        data['exec_command'] = t_job.args
+        # Nothing is written, Unmanic accepts a command without an output file and runs the repeat pass on file_in
+        data['file_out'] = None
+        parser = EncodeParser(logger, m_file.length, LoudnormParser())
         data['command_progress_parser'] = parser.parse
-
+        pending_measurements[in_abs] = (missing, identity, parser)
+        data['repeat'] = True
+        return data
+
+    # Streams already within tolerance are copied, only the others are corrected and encoded
+    correct = {index: values for index, values in measured.items() if not target.within(values, tolerance)}
+    if len(correct) == 0:
+        reason = "Audio streams are within {} LU of the target".format(tolerance)
+        logger.info("{}: {}".format(in_abs, reason))
+        get_decision_memo(settings).put(identity, False, reason)
+        return data
+    if len(correct) < len(measured) + len(close):
+        copied = sorted((set(measured) | set(close)) - set(correct))
+        logger.debug("{}: Copying streams {} within tolerance".format(in_abs, copied))
+
+    # Pass 2, correct the loudness with the measured values in one command
+    codec = ("libopus" if settings.get_setting("normalize_to_opus") else "pcm_s16le")
+    marker = marker_args(target, get_tool_version(), format_measured(measured))
+    t_job = NormalizeJob(m_file, logger, target, correct, new_file = MediaFile(out_abs, log = logger),
+                         tag_args = marker, codec = codec)
+    t_job.create_cmd()
+    logger.debug("Executing: {}".format(" ".join(t_job.args)))
+
+    data['exec_command'] = t_job.args
+    probe_registry.invalidate(out_abs)
+    data['command_progress_parser'] = EncodeParser(logger, m_file.length).parse
     return data
 
 
-class Parser(object):
+class EncodeParser(object):
     data = {
         'percent': 0
     }
     percent = 0
-    pass_nr = 0
-    streams = None
-    stream = None
-    steps = 0
-    step = 0
 
-    def __init__(self, logger):
+    def __init__(self, logger, length = 0, collector = None):
         self.logger = logger
+        self.length = length
+        self.collector = collector
 
     def parse(self, line_text):
-        # Count streams
-        if self.streams == None:
-            streams_re = re.compile(r"Stream [0-9]{1,}\/([0-9]{1,})", re.I)
-            streams_res = streams_re.search(line_text)
-            if streams_res != None:
-                self.streams = int(streams_res.group(1))
-                self.steps = self.streams + 1
-                self.logger.debug("Streams: {}".format(streams_res.group(1)))
-
-        if self.pass_nr == 0:
-            # Search for first pass
-            pass_re = re.compile(r"first pass", re.I)
-            pass_res = pass_re.search(line_text)
-            if pass_res != None:
-                self.logger.debug("First pass")
-                self.pass_nr = 1
-                self.step = 1
-
-        if self.pass_nr == 1:
-            # Search for start of second pass
-            pass_re = re.compile(r"Second Pass", re.I)
-            pass_res = pass_re.search(line_text)
-            if pass_res != None:
-                self.logger.debug("Second pass")
-                self.pass_nr = 2
-                self.step = self.steps - 1
-
-            # Set current stream
-            stream_re = re.compile(r"Stream ([0-9]{1,})\/[0-9]{1,}", re.I)
-            stream_res = stream_re.search(line_text)
-            if stream_res != None:
-                self.stream = int(stream_res.group(1))
-                self.step = self.stream
-                self.logger.debug(f"Stream: {self.step}")
-
-        # Search for percent in the progress bar line output
-        percent_re = re.compile(r"[0-9]{1,3}%")
-        re_result = percent_re.search(line_text)
-        percent_new = None
-        if re_result != None:
-            percent_new = int(re_result[0][:-1])
-
-        if percent_new != None and self.steps != None and self.steps > 0:
-            offset = 100 / self.steps
-            percent_calc = (percent_new / self.steps) + (offset * self.step) - offset
-            self.percent = round(percent_calc)
+        # Loudness values are printed when a measure command ends
+        if self.collector != None:
+            self.collector.feed(line_text)
+
+        # Search for time in the ffmpeg progress line output
+        time_re = re.compile(r"time=([0-9:.]{1,})")
+        re_result = time_re.search(line_text)
+        if re_result != None and self.length > 0:
+            h, m, s = re_result.group(1).split(':')
+            time = int(h) * 3600 + int(m) * 60 + float(s)
+            self.percent = round((time / self.length) * 100)
 
         self.data = {
             'percent': self.percent
         }
-
         return self.data
@@ -26,6 +26,14 @@ import warnings
 
 from .transcode import TranscodeJob, TranscodeResult
 from .mediafile import MediaFile
+from .probe import AdaptiveProber
+from .decisionmemo import DecisionMemo, read_version, settings_hash
+from .provenance import Provenance, provenance_args, read_provenance
+from .probecache import ProbeCache
+from .registry import ProbeRegistry
+from .opusencoder import opus_args, opus_bitrate, opus_layout
+from .audiopipeline import Analyzer, AudioPipeline, sample_windows
+from .channels import ChannelAnalyzer, Downmix, downmix_layout
 
 __author__ = 'Bregell (johan@bregell.se)'
 
@@ -33,4 +41,22 @@ __all__ = (
     'TranscodeJob',
     'TranscodeResult',
     'MediaFile',
+    'AdaptiveProber',
+    'DecisionMemo',
+    'read_version',
+    'settings_hash',
+    'Provenance',
+    'provenance_args',
+    'read_provenance',
+    'ProbeCache',
+    'ProbeRegistry',
+    'opus_args',
+    'opus_bitrate',
+    'opus_layout',
+    'Analyzer',
+    'AudioPipeline',
+    'sample_windows',
+    'ChannelAnalyzer',
+    'Downmix',
+    'downmix_layout',
 )
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    audiopipeline.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     19 Oct 2026, (00:40)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import queue
+import subprocess
+import threading
+import time
+
+from typing import Dict, List, Optional, Tuple
+
+from .fileidentity import FileIdentity
+
+# Streams are decoded to 48 kHz float samples and handed to the analyzers one second at a time
+SAMPLE_RATE = 48000
+BLOCK_FRAMES = SAMPLE_RATE
+
+# Blocks an analyzer may fall behind the decoder before the decoder waits for it
+QUEUE_BLOCKS = 16
+
+def decode_args(name, specifier, channels, start = 0.0, end = None) -> List[str]:
+    """
+    ffmpeg command writing a stream between start and end in seconds as 48 kHz interleaved float samples to stdout.
+    """
+    args = ["ffmpeg", "-hide_banner", "-nostdin", "-nostats", "-v", "error"]
+    if start > 0:
+        args.extend(["-ss", "{:.1f}".format(start)])
+    args.extend(["-i", name])
+    if end != None:
+        args.extend(["-t", "{:.1f}".format(end - start)])
+    args.extend(["-map", "0:{}".format(specifier), "-vn", "-sn", "-dn"])
+    args.extend(["-c:a", "pcm_f32le", "-ar", str(SAMPLE_RATE), "-ac", str(channels), "-f", "f32le", "-"])
+    return args
+
+def sample_windows(duration, windows, window_seconds) -> Optional[List[Tuple[float, float]]]:
+    """
+    Windows (start, end) of window_seconds evenly spaced over a stream, each one centered in its share of the
+    duration. None when the windows would cover the whole stream, which is then decoded in one go.
+    """
+    if windows < 1 or windows * window_seconds >= duration:
+        return None
+    bounds = []
+    for i in range(windows):
+        start = max(0.0, (i + 0.5) * duration / windows - window_seconds / 2)
+        bounds.append((round(start, 1), round(start + window_seconds, 1)))
+    return bounds
+
+class Analyzer(object):
+    """
+    Base of the analyzers of an AudioPipeline.
+
+    An analyzer gets the interleaved float samples of one stream as bytes, whole blocks of BLOCK_FRAMES frames
+    except for the last one of every window, and returns a json serializable result. The result is stored in the
+    probe cache under name and params, params holds the options the result depends on.
+    """
+    name = None
+
+    def params(self) -> str:
+        return ""
+
+    def start(self, channels, sample_rate):
+        self.channels = channels
+        self.sample_rate = sample_rate
+
+    def process(self, block: bytes):
+        raise NotImplementedError
+
+    def result(self) -> dict:
+        raise NotImplementedError
+
+class AudioPipeline(object):
+    """
+    Decode an audio stream once and fan the blocks out to several analyzers.
+
+    Every analyzer runs in its own thread behind a queue of queue_blocks blocks, the decoder waits when a queue is
+    full so a slow analyzer holds back the decoder instead of the blocks piling up in memory. The analyzers run in
+    this process, numpy analyzers release the GIL while they work on a block.
+
+    With a cache the results are stored in the analysis table of the probe cache next to the probed stream, and
+    analyzers with a stored result for the unchanged file are not run again.
+    """
+    def __init__(self, mediafile, log = None, cache = None, queue_blocks = QUEUE_BLOCKS):
+        self.mediafile = mediafile
+        self.log = log
+        self.cache = cache
+        self.queue_blocks = queue_blocks
+
+    def run(self, a_stream, analyzers: List[Analyzer],
+            windows: Optional[List[Tuple[float, Optional[float]]]] = None) -> Dict[str, dict]:
+        """
+        Results of the analyzers by analyzer name. windows (start, end) in seconds restricts the decode to parts of
+        the stream, each window is decoded from its own seek and the analyzers see them one after the other.
+        Raises when decoding or an analyzer fails.
+        """
+        results = {}
+        identity = None
+        if self.cache != None:
+            identity = FileIdentity.from_path(self.mediafile.name)
+            for analyzer in analyzers:
+                result = self.cache.get_analysis(identity, a_stream.index, analyzer.name,
+                                                 self.__params(analyzer, windows))
+                if result != None:
+                    results[analyzer.name] = result
+        pending = [analyzer for analyzer in analyzers if analyzer.name not in results]
+        if len(pending) == 0:
+            return results
+
+        start = time.monotonic()
+        seconds = self.__decode(a_stream, pending, ([(0.0, None)] if windows == None else windows))
+        for analyzer in pending:
+            results[analyzer.name] = analyzer.result()
+            if identity != None:
+                self.cache.put_analysis(identity, a_stream.index, analyzer.name, results[analyzer.name],
+                                        self.__params(analyzer, windows))
+        if self.log != None:
+            elapsed = time.monotonic() - start
+            txt = "Analyzed {:.0f}s of stream {} with {} in {:.1f}s".format(
+                seconds, a_stream.index, ", ".join(analyzer.name for analyzer in pending), elapsed)
+            self.log.debug(txt)
+        return results
+
+    @staticmethod
+    def __params(analyzer: Analyzer, windows) -> str:
+        # Results of parts of a stream are stored apart from those of the whole stream
+        if windows == None:
+            return analyzer.params()
+        parts = ",".join("{:.1f}-{}".format(start, ("" if end == None else "{:.1f}".format(end)))
+                         for start, end in windows)
+        return "{};windows={}".format(analyzer.params(), parts)
+
+    def __decode(self, a_stream, analyzers: List[Analyzer], windows) -> float:
+        channels = a_stream.channels
+        queues = [queue.Queue(maxsize = self.queue_blocks) for _ in analyzers]
+        errors = []
+        threads = []
+        for analyzer, blocks in zip(analyzers, queues):
+            analyzer.start(channels, SAMPLE_RATE)
+            thread = threading.Thread(target = self.__consume, args = (analyzer, blocks, errors), daemon = True)
+            thread.start()
+            threads.append(thread)
+
+        block_bytes = BLOCK_FRAMES * channels * 4
+        frames = 0
+        try:
+            for window_start, window_end in windows:
+                args = decode_args(self.mediafile.name, a_stream.specifier(), channels, window_start, window_end)
+                pipe = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                with pipe.stdout:
+                    while len(errors) == 0:
+                        block = pipe.stdout.read(block_bytes)
+                        if not block:
+                            break
+                        block = block[:len(block) - len(block) % (channels * 4)]
+                        frames += len(block) // (channels * 4)
+                        for blocks in queues:
+                            blocks.put(block)
+                if len(errors) > 0:
+                    pipe.kill()
+                if pipe.wait() != 0 and len(errors) == 0:
+                    raise RuntimeError("Decoding stream {} of {} failed".format(a_stream.specifier(),
+                                                                                self.mediafile.name))
+        finally:
+            for blocks in queues:
+                blocks.put(None)
+            for thread in threads:
+                thread.join()
+        if len(errors) > 0:
+            raise errors[0]
+        return frames / SAMPLE_RATE
+
+    @staticmethod
+    def __consume(analyzer: Analyzer, blocks: queue.Queue, errors: list):
+        # Keeps draining after a failure so that the decoder never waits on a dead analyzer
+        failed = False
+        while True:
+            block = blocks.get()
+            if block is None:
+                return
+            if failed:
+                continue
+            try:
+                analyzer.process(block)
+            except Exception as e:
+                failed = True
+                errors.append(e)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    bitrate.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (19:00)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import subprocess
+import time
+from collections import namedtuple
+
+from typing import Iterable, List, Optional, Tuple
+
+# Number of windows spread over the file and the longest window read
+ESTIMATE_WINDOWS = 5
+ESTIMATE_WINDOW_SECONDS = 4.0
+ESTIMATE_MIN_WINDOW_SECONDS = 0.5
+
+# Bytes of packets of the estimated stream read for the estimate, ffprobe is stopped when they are used up
+ESTIMATE_BYTE_BUDGET = 32 * 1024 * 1024
+
+BitrateEstimate = namedtuple("BitrateEstimate", ["average", "peak", "bytes", "elapsed"])
+
+def sample_windows(duration, format_bit_rate, start_time = 0.0, windows = ESTIMATE_WINDOWS,
+                   window_seconds = ESTIMATE_WINDOW_SECONDS,
+                   byte_budget = ESTIMATE_BYTE_BUDGET) -> List[Tuple[float, float]]:
+    """
+    Windows (start, length) in seconds centered in equal parts of the file, on the timestamps of the file which
+    begin at start_time.
+
+    The window length is shortened so that the windows hold at most the budget at the format bit rate. That rate
+    includes every stream, so the packets of the estimated stream alone normally stay within the budget.
+    """
+    if format_bit_rate > 0:
+        window_seconds = min(window_seconds, byte_budget * 8 / (windows * format_bit_rate))
+    window_seconds = max(window_seconds, ESTIMATE_MIN_WINDOW_SECONDS)
+    if duration <= windows * window_seconds:
+        return [(start_time, duration)]
+    part = duration / windows
+    return [(start_time + part * i + (part - window_seconds) / 2, window_seconds) for i in range(windows)]
+
+def estimate_args(name, index, windows: List[Tuple[float, float]]) -> List[str]:
+    intervals = ",".join("{:.3f}%+{:.3f}".format(start, length) for start, length in windows)
+    args = ["ffprobe", "-v", "quiet", "-hide_banner", "-select_streams", str(index)]
+    args.extend(["-show_entries", "packet=pts_time,size", "-read_intervals", intervals])
+    args.extend(["-print_format", "compact=p=0", "-i", name])
+    return args
+
+class PacketSampler(object):
+    """
+    Sum packet sizes per window from the compact ffprobe packet output, lines look like 'pts_time=1.2|size=5120'.
+    Only the packets of the estimated stream are printed, the budget counts their bytes.
+    """
+    def __init__(self, windows: List[Tuple[float, float]], byte_budget = ESTIMATE_BYTE_BUDGET):
+        self.windows = windows
+        self.byte_budget = byte_budget
+        self.total = 0
+        self.bytes = [0] * len(windows)
+        self.count = [0] * len(windows)
+        self.first = [None] * len(windows)
+        self.last = [None] * len(windows)
+
+    def feed(self, line) -> bool:
+        """
+        Add one packet, returns False when the byte budget is used up.
+        """
+        fields = dict(f.partition("=")[::2] for f in line.strip().split("|"))
+        try:
+            pts = float(fields["pts_time"])
+            size = int(fields["size"])
+        except (KeyError, ValueError):
+            return True
+        # The packets of a window can start at the key frame before it, split the gaps between windows in half
+        window = 0
+        for i in range(1, len(self.windows)):
+            start, length = self.windows[i - 1]
+            if pts >= (start + length + self.windows[i][0]) / 2:
+                window = i
+        self.bytes[window] += size
+        self.count[window] += 1
+        self.first[window] = (pts if self.first[window] == None else min(self.first[window], pts))
+        self.last[window] = (pts if self.last[window] == None else max(self.last[window], pts))
+        self.total += size
+        return self.total < self.byte_budget
+
+    def feed_lines(self, lines: Iterable[str]):
+        for line in lines:
+            if not self.feed(line):
+                break
+
+    def result(self) -> Optional[Tuple[int, int]]:
+        """
+        Returns the (average, peak) bit rate over the windows, None if no window had enough packets.
+        """
+        total_bytes = 0
+        total_span = 0.0
+        peak = 0
+        for i in range(len(self.windows)):
+            if self.count[i] < 2 or self.last[i] <= self.first[i]:
+                continue
+            # The span between the first and last packet misses the duration of the last packet
+            span = (self.last[i] - self.first[i]) * self.count[i] / (self.count[i] - 1)
+            total_bytes += self.bytes[i]
+            total_span += span
+            peak = max(peak, int(self.bytes[i] * 8 / span))
+        if total_span == 0:
+            return None
+        return int(total_bytes * 8 / total_span), peak
+
+def estimate(name, index, duration, format_bit_rate = 0, start_time = 0.0,
+             byte_budget = ESTIMATE_BYTE_BUDGET) -> Optional[BitrateEstimate]:
+    """
+    Estimate the bit rate of a stream from the packet sizes in a few short windows spread over the file.
+    """
+    start = time.monotonic()
+    windows = sample_windows(duration, format_bit_rate, start_time, byte_budget = byte_budget)
+    sampler = PacketSampler(windows, byte_budget)
+    try:
+        pipe = subprocess.Popen(estimate_args(name, index, windows), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, encoding='utf8', errors='replace')
+        with pipe.stdout:
+            sampler.feed_lines(pipe.stdout)
+        # Stop ffprobe when the budget ran out before it finished
+        if pipe.poll() == None:
+            pipe.kill()
+        pipe.wait()
+    except:
+        return None
+    result = sampler.result()
+    if result == None:
+        return None
+    return BitrateEstimate(result[0], result[1], sampler.total, time.monotonic() - start)
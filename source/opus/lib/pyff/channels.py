@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    channels.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     19 Oct 2026, (01:35)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from typing import List, Optional
+
+from .audiopipeline import Analyzer
+
+# Channel order of the ffmpeg layouts
+LAYOUT_CHANNELS = {
+    "mono": ["FC"],
+    "stereo": ["FL", "FR"],
+    "2.1": ["FL", "FR", "LFE"],
+    "3.0": ["FL", "FR", "FC"],
+    "3.0(back)": ["FL", "FR", "BC"],
+    "4.0": ["FL", "FR", "FC", "BC"],
+    "quad": ["FL", "FR", "BL", "BR"],
+    "quad(side)": ["FL", "FR", "SL", "SR"],
+    "3.1": ["FL", "FR", "FC", "LFE"],
+    "5.0": ["FL", "FR", "FC", "BL", "BR"],
+    "5.0(side)": ["FL", "FR", "FC", "SL", "SR"],
+    "4.1": ["FL", "FR", "FC", "LFE", "BC"],
+    "5.1": ["FL", "FR", "FC", "LFE", "BL", "BR"],
+    "5.1(side)": ["FL", "FR", "FC", "LFE", "SL", "SR"],
+    "6.0": ["FL", "FR", "FC", "BC", "SL", "SR"],
+    "6.1": ["FL", "FR", "FC", "LFE", "BC", "SL", "SR"],
+    "7.0": ["FL", "FR", "FC", "BL", "BR", "SL", "SR"],
+    "7.1": ["FL", "FR", "FC", "LFE", "BL", "BR", "SL", "SR"],
+    "7.1(wide)": ["FL", "FR", "FC", "LFE", "BL", "BR", "FLC", "FRC"],
+}
+FRONT_CHANNELS = ["FL", "FR"]
+
+# A channel this far below the loudest one, or below the floor, carries nothing
+SILENCE_DB = -60.0
+SILENCE_FLOOR_DB = -90.0
+
+# Correlation above which a channel is taken as a copy of the front channels, upmixers pan or copy them
+CORRELATION = 0.98
+
+class Downmix(namedtuple("Downmix", ["layout", "sources"])):
+    """
+    Channels of a stream to keep, the source channel names in the order of the output layout, mono or stereo.
+    """
+    __slots__ = ()
+
+    @property
+    def channels(self):
+        return len(self.sources)
+
+    def channelmap(self):
+        """
+        ffmpeg channelmap filter picking the kept channels, the others are dropped without being mixed in.
+        """
+        mapping = "|".join("{}-{}".format(source, target)
+                           for source, target in zip(self.sources, LAYOUT_CHANNELS[self.layout]))
+        return "channelmap=map={}:channel_layout={}".format(mapping, self.layout)
+
+class ChannelAnalyzer(Analyzer):
+    """
+    Mean products of every pair of channels, the power of every channel on the diagonal. The correlation of a
+    channel with any mix of the others follows from them, so the classification is left to downmix_layout.
+    """
+    name = "channels"
+
+    def start(self, channels, sample_rate):
+        Analyzer.start(self, channels, sample_rate)
+        self.products = np.zeros((channels, channels))
+        self.frames = 0
+
+    def process(self, block: bytes):
+        x = np.frombuffer(block, dtype = np.float32).reshape(-1, self.channels).astype(np.float64)
+        self.products += x.T @ x
+        self.frames += x.shape[0]
+
+    def result(self) -> dict:
+        return {
+            "frames": self.frames,
+            "products": (self.products / max(self.frames, 1)).tolist(),
+        }
+
+def correlation(products: np.ndarray, channel, weights: np.ndarray) -> float:
+    """
+    Correlation of a channel with a mix of the channels, the weights of the mix by channel.
+    """
+    power = products[channel, channel] * (weights @ products @ weights)
+    if power <= 0:
+        return 0.0
+    return float(products[channel] @ weights / np.sqrt(power))
+
+def downmix_layout(products: List[List[float]], channel_layout, threshold = CORRELATION) -> Optional[Downmix]:
+    """
+    Mono or stereo channels that carry the whole stream, None when the stream needs its own layout.
+
+    Silent channels are redundant, and so are channels other than LFE that correlate with the left or the right
+    front channel or their sum, the copies and phantom center of an upmix. LFE only counts as redundant when it
+    is silent. What is left is kept when it is the front pair, mono when the pair correlates, or the center alone.
+    """
+    names = LAYOUT_CHANNELS.get(channel_layout)
+    products = np.asarray(products, dtype = np.float64)
+    if names == None or len(names) != products.shape[0]:
+        return None
+    power = np.diag(products)
+    loudest = power.max(initial = 0.0)
+    if loudest <= 10 ** (SILENCE_FLOOR_DB / 10):
+        return None
+    silent = (power < loudest * 10 ** (SILENCE_DB / 10)) | (power < 10 ** (SILENCE_FLOOR_DB / 10))
+
+    fronts = [names.index(name) for name in FRONT_CHANNELS if name in names]
+    mixes = []
+    for front in fronts:
+        weights = np.zeros(len(names))
+        weights[front] = 1.0
+        mixes.append(weights)
+    if len(fronts) == 2:
+        mixes.append(mixes[0] + mixes[1])
+
+    keep = []
+    for channel, name in enumerate(names):
+        if silent[channel]:
+            continue
+        if name not in FRONT_CHANNELS and name != "LFE":
+            if any(correlation(products, channel, weights) >= threshold for weights in mixes):
+                continue
+        keep.append(name)
+
+    if keep == FRONT_CHANNELS:
+        left = np.zeros(len(names))
+        left[names.index("FL")] = 1.0
+        if correlation(products, names.index("FR"), left) >= threshold:
+            downmix = Downmix("mono", ["FL"])
+        else:
+            downmix = Downmix("stereo", FRONT_CHANNELS)
+    elif len(keep) == 1 and keep[0] in FRONT_CHANNELS + ["FC"]:
+        downmix = Downmix("mono", keep)
+    else:
+        return None
+    if downmix.layout == channel_layout:
+        return None
+    return downmix
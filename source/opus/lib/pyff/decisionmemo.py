@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    decisionmemo.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (20:50)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from typing import Optional, Tuple
+
+from .fileidentity import FileIdentity
+
+def settings_hash(settings: dict) -> str:
+    """
+    Short stable hash of the plugin settings, decisions made with other settings are not reused.
+    """
+    txt = json.dumps(settings, sort_keys = True, default = str)
+    return hashlib.sha1(txt.encode("utf8")).hexdigest()[:16]
+
+def read_version(info_file) -> str:
+    """
+    Version of a plugin from its info.json.
+    """
+    with open(info_file, encoding = "utf8") as f:
+        return str(json.load(f)["version"])
+
+class DecisionMemo(object):
+    """
+    Persistent memo of the decision a plugin made for a file and the reason for it.
+
+    Rows are keyed on file identity (path, size, mtime_ns, inode) and plugin id, a row is only used when it was
+    written by the same plugin version with the same settings hash. Rows of other versions of the plugin are
+    removed when the memo is opened, rows of other plugins sharing the database are left alone.
+
+    The number of rows of the plugin is bounded by max_entries, the least recently used rows are evicted first.
+    """
+    def __init__(self, path, plugin_id, version, settings_hash, max_entries = 100000, log = None):
+        self.path = path
+        self.plugin_id = plugin_id
+        self.version = version
+        self.settings_hash = settings_hash
+        self.max_entries = max_entries
+        self.log = log
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        with self.__lock, self.__conn:
+            self.__conn.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in self.__conn.execute("PRAGMA table_info(decision)")]
+            if len(columns) > 0 and "last_access" not in columns:
+                # Memo written without access times, the decisions are made again
+                self.__conn.execute("DROP TABLE decision")
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS decision ("
+                "path TEXT NOT NULL, plugin TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                "inode INTEGER NOT NULL, version TEXT NOT NULL, settings TEXT NOT NULL, encode INTEGER NOT NULL, "
+                "reason TEXT NOT NULL, decided_at REAL NOT NULL, last_access REAL NOT NULL, "
+                "PRIMARY KEY (path, plugin))"
+            )
+            self.__conn.execute("CREATE INDEX IF NOT EXISTS decision_last_access ON decision (plugin, last_access)")
+            cursor = self.__conn.execute(
+                "DELETE FROM decision WHERE plugin = ? AND version != ?", (plugin_id, version)
+            )
+            self.__count = self.__conn.execute(
+                "SELECT COUNT(*) FROM decision WHERE plugin = ?", (plugin_id,)
+            ).fetchone()[0]
+        if cursor.rowcount > 0 and self.log != None:
+            txt = "Decision memo dropped {} entries of other {} versions".format(cursor.rowcount, plugin_id)
+            self.log.debug(txt)
+
+    def lookup(self, name) -> Tuple[Optional[FileIdentity], Optional[Tuple[bool, str]]]:
+        """
+        Returns the identity of the file and the memoized (decision, reason), None when the file must be decided.
+        """
+        try:
+            identity = FileIdentity.from_path(name)
+        except OSError:
+            return None, None
+        return identity, self.get(identity)
+
+    def get(self, identity: FileIdentity) -> Optional[Tuple[bool, str]]:
+        with self.__lock, self.__conn:
+            row = self.__conn.execute(
+                "SELECT size, mtime_ns, inode, version, settings, encode, reason FROM decision "
+                "WHERE path = ? AND plugin = ?", (identity.path, self.plugin_id)
+            ).fetchone()
+            if row == None:
+                self.misses += 1
+                return None
+            size, mtime_ns, inode, version, settings, encode, reason = row
+            if not identity.matches(size, mtime_ns, inode):
+                # File changed on disk since it was decided
+                self.__conn.execute(
+                    "DELETE FROM decision WHERE path = ? AND plugin = ?", (identity.path, self.plugin_id)
+                )
+                self.__count -= 1
+                self.misses += 1
+                return None
+            if version != self.version or settings != self.settings_hash:
+                # Replaced when the file is decided again
+                self.misses += 1
+                return None
+            self.__conn.execute(
+                "UPDATE decision SET last_access = ? WHERE path = ? AND plugin = ?",
+                (time.time(), identity.path, self.plugin_id)
+            )
+            self.hits += 1
+        return bool(encode), reason
+
+    def put(self, identity: Optional[FileIdentity], encode: bool, reason):
+        if identity == None:
+            return
+        with self.__lock, self.__conn:
+            exists = self.__conn.execute(
+                "SELECT 1 FROM decision WHERE path = ? AND plugin = ?", (identity.path, self.plugin_id)
+            ).fetchone()
+            now = time.time()
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO decision "
+                "(path, plugin, size, mtime_ns, inode, version, settings, encode, reason, decided_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (identity.path, self.plugin_id, identity.size, identity.mtime_ns, identity.inode, self.version,
+                 self.settings_hash, int(encode), reason, now, now)
+            )
+            if exists == None:
+                self.__count += 1
+            if self.__count > self.max_entries:
+                self.__evict()
+
+    def invalidate(self, path):
+        with self.__lock, self.__conn:
+            cursor = self.__conn.execute(
+                "DELETE FROM decision WHERE path = ? AND plugin = ?", (path, self.plugin_id)
+            )
+            self.__count -= cursor.rowcount
+
+    def stats(self) -> dict:
+        return {
+            "entries": self.__count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __evict(self):
+        # Evict down to 90% of the limit so that a full memo does not evict on every insert
+        n_evict = self.__count - int(self.max_entries * 0.9)
+        cursor = self.__conn.execute(
+            "DELETE FROM decision WHERE plugin = ? AND path IN "
+            "(SELECT path FROM decision WHERE plugin = ? ORDER BY last_access LIMIT ?)",
+            (self.plugin_id, self.plugin_id, n_evict)
+        )
+        self.__count -= cursor.rowcount
+        self.evictions += cursor.rowcount
+        if self.log != None:
+            txt = "Decision memo evicted {} entries".format(cursor.rowcount)
+            self.log.debug(txt)
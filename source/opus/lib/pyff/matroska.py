@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    matroska.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (15:20)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import mmap
+import os
+import struct
+
+from typing import Optional
+
+from . import audioheader
+
+# EBML element ids
+EBML = 0x1A45DFA3
+DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMESTAMP_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_UID = 0x73C5
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+LANGUAGE = 0x22B59C
+DEFAULT_DURATION = 0x23E383
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+AUDIO = 0xE1
+SAMPLING_FREQUENCY = 0xB5
+CHANNELS = 0x9F
+BIT_DEPTH = 0x6264
+TAGS = 0x1254C367
+TAG = 0x7373
+TARGETS = 0x63C0
+TAG_TRACK_UID = 0x63C5
+SIMPLE_TAG = 0x67C8
+TAG_NAME = 0x45A3
+TAG_STRING = 0x4487
+CLUSTER = 0x1F43B675
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+
+TRACK_TYPES = {1: "video", 2: "audio", 0x11: "subtitle"}
+
+# Matroska codec ids mapped to ffmpeg codec names, ids ending with / match as a prefix
+CODECS = {
+    "V_MPEG4/ISO/AVC": "h264",
+    "V_MPEGH/ISO/HEVC": "hevc",
+    "V_MPEGI/ISO/VVC": "vvc",
+    "V_AV1": "av1",
+    "V_VP8": "vp8",
+    "V_VP9": "vp9",
+    "V_MPEG1": "mpeg1video",
+    "V_MPEG2": "mpeg2video",
+    "V_MPEG4/ISO/": "mpeg4",
+    "V_THEORA": "theora",
+    "V_MJPEG": "mjpeg",
+    "A_AAC": "aac",
+    "A_AAC/": "aac",
+    "A_AC3": "ac3",
+    "A_EAC3": "eac3",
+    "A_DTS": "dts",
+    "A_DTS/": "dts",
+    "A_TRUEHD": "truehd",
+    "A_OPUS": "opus",
+    "A_VORBIS": "vorbis",
+    "A_FLAC": "flac",
+    "A_ALAC": "alac",
+    "A_MPEG/L3": "mp3",
+    "A_MPEG/L2": "mp2",
+    "S_TEXT/UTF8": "subrip",
+    "S_TEXT/ASS": "ass",
+    "S_TEXT/SSA": "ass",
+    "S_ASS": "ass",
+    "S_SSA": "ass",
+    "S_TEXT/WEBVTT": "webvtt",
+    "S_HDMV/PGS": "hdmv_pgs_subtitle",
+    "S_HDMV/TEXTST": "hdmv_text_subtitle",
+    "S_VOBSUB": "dvd_subtitle",
+    "S_DVBSUB": "dvb_subtitle",
+}
+
+# Audio codecs ffprobe reads a bit rate for from the bitstream, without a BPS tag the first frame header is read
+HEADER_BITRATE_CODECS = ["ac3", "eac3", "dts", "mp2", "mp3"]
+
+# Bytes of cluster data searched for the first frame of those tracks
+FRAME_SCAN_BUDGET = 1024 * 1024
+
+# Probe results read without ffprobe use the same format name as ffmpeg
+FORMAT_NAME = "matroska,webm"
+
+class MatroskaError(Exception):
+    pass
+
+def read_vint(buf, pos, keep_marker = False):
+    first = buf[pos]
+    if first == 0:
+        raise MatroskaError("Invalid variable size integer at {}".format(pos))
+    length = 1
+    mask = 0x80
+    while not first & mask:
+        mask >>= 1
+        length += 1
+    value = (first if keep_marker else first & (mask - 1))
+    for i in range(1, length):
+        value = (value << 8) | buf[pos + i]
+    unknown = (not keep_marker and value == (1 << (7 * length)) - 1)
+    return value, length, unknown
+
+def read_element(buf, pos, end):
+    """
+    Read the element header at pos, returns (id, data start, data size).
+    """
+    e_id, id_len, _ = read_vint(buf, pos, keep_marker = True)
+    size, size_len, unknown = read_vint(buf, pos + id_len)
+    start = pos + id_len + size_len
+    if unknown or start + size > end:
+        size = end - start
+    return e_id, start, size
+
+def iter_elements(buf, start, end):
+    pos = start
+    while pos < end:
+        e_id, data_start, size = read_element(buf, pos, end)
+        yield e_id, data_start, size
+        pos = data_start + size
+
+def read_uint(buf, start, size):
+    return int.from_bytes(buf[start:start + size], "big")
+
+def read_float(buf, start, size):
+    if size == 4:
+        return struct.unpack(">f", buf[start:start + 4])[0]
+    if size == 8:
+        return struct.unpack(">d", buf[start:start + 8])[0]
+    return 0.0
+
+def read_string(buf, start, size):
+    return bytes(buf[start:start + size]).rstrip(b"\x00").decode("utf8", errors = "replace")
+
+def codec_name(codec_id, bit_depth):
+    if codec_id.startswith("A_PCM/"):
+        if codec_id == "A_PCM/FLOAT/IEEE":
+            return ("pcm_f64le" if bit_depth == 64 else "pcm_f32le")
+        if bit_depth == 8:
+            return "pcm_u8"
+        return "pcm_s{}{}".format(bit_depth, ("be" if codec_id == "A_PCM/INT/BIG" else "le"))
+    if codec_id in CODECS:
+        return CODECS[codec_id]
+    for prefix, name in CODECS.items():
+        if prefix.endswith("/") and codec_id.startswith(prefix):
+            return name
+    return None
+
+class MatroskaReader(object):
+    """
+    Reads the stream model from the Segment Info, Tracks and Tags elements of a memory mapped Matroska file.
+
+    Only the pages holding those elements are touched, the clusters are never read.
+    """
+    def __init__(self, buf):
+        self.buf = buf
+        self.segment_start = None
+        self.segment_end = None
+        self.first_cluster = None
+        self.elements = {}
+
+    def read_header(self):
+        buf = self.buf
+        e_id, start, size = read_element(buf, 0, len(buf))
+        if e_id != EBML:
+            raise MatroskaError("Not an EBML file")
+        doc_type = None
+        for c_id, c_start, c_size in iter_elements(buf, start, start + size):
+            if c_id == DOC_TYPE:
+                doc_type = read_string(buf, c_start, c_size)
+        if doc_type not in ["matroska", "webm"]:
+            raise MatroskaError("Unsupported doc type {}".format(doc_type))
+
+        e_id, self.segment_start, size = read_element(buf, start + size, len(buf))
+        if e_id != SEGMENT:
+            raise MatroskaError("Segment not found")
+        self.segment_end = self.segment_start + size
+
+        # Level 1 elements up to the first cluster, anything after is located through the seek head
+        seek = {}
+        seek_heads = []
+        for e_id, e_start, e_size in iter_elements(buf, self.segment_start, self.segment_end):
+            if e_id == CLUSTER:
+                self.first_cluster = (e_start, e_size)
+                break
+            if e_id in [INFO, TRACKS, TAGS]:
+                self.elements.setdefault(e_id, (e_start, e_size))
+            elif e_id == SEEK_HEAD:
+                seek_heads.append(e_start)
+                for s_id, s_pos in self.__read_seek_head(e_start, e_size).items():
+                    seek.setdefault(s_id, s_pos)
+
+        # A seek head can point to a second seek head, usually at the end of the file
+        if SEEK_HEAD in seek:
+            element = self.__element_at(seek[SEEK_HEAD], SEEK_HEAD)
+            if element != None and element[0] not in seek_heads:
+                for s_id, s_pos in self.__read_seek_head(*element).items():
+                    seek.setdefault(s_id, s_pos)
+
+        for e_id in [INFO, TRACKS, TAGS]:
+            if e_id not in self.elements and e_id in seek:
+                element = self.__element_at(seek[e_id], e_id)
+                if element != None:
+                    self.elements[e_id] = element
+
+    def __element_at(self, position, e_id):
+        pos = self.segment_start + position
+        if pos >= self.segment_end:
+            return None
+        s_id, s_start, s_size = read_element(self.buf, pos, self.segment_end)
+        if s_id != e_id:
+            return None
+        return s_start, s_size
+
+    def __read_seek_head(self, start, size):
+        buf = self.buf
+        seek = {}
+        for e_id, e_start, e_size in iter_elements(buf, start, start + size):
+            if e_id != SEEK:
+                continue
+            s_id = None
+            s_pos = None
+            for c_id, c_start, c_size in iter_elements(buf, e_start, e_start + e_size):
+                if c_id == SEEK_ID:
+                    s_id = read_uint(buf, c_start, c_size)
+                elif c_id == SEEK_POSITION:
+                    s_pos = read_uint(buf, c_start, c_size)
+            if s_id != None and s_pos != None:
+                seek.setdefault(s_id, s_pos)
+        return seek
+
+    def read_duration(self) -> Optional[float]:
+        if INFO not in self.elements:
+            return None
+        buf = self.buf
+        start, size = self.elements[INFO]
+        scale = 1000000
+        duration = None
+        for e_id, e_start, e_size in iter_elements(buf, start, start + size):
+            if e_id == TIMESTAMP_SCALE:
+                scale = read_uint(buf, e_start, e_size)
+            elif e_id == DURATION:
+                duration = read_float(buf, e_start, e_size)
+        if duration == None:
+            return None
+        return duration * scale / 1000000000.0
+
+    def read_tracks(self) -> Optional[list]:
+        if TRACKS not in self.elements:
+            return None
+        buf = self.buf
+        start, size = self.elements[TRACKS]
+        tracks = []
+        for e_id, e_start, e_size in iter_elements(buf, start, start + size):
+            if e_id != TRACK_ENTRY:
+                continue
+            track = {"language": "eng", "channels": 1, "bit_depth": 0}
+            for c_id, c_start, c_size in iter_elements(buf, e_start, e_start + e_size):
+                if c_id == TRACK_NUMBER:
+                    track["number"] = read_uint(buf, c_start, c_size)
+                elif c_id == TRACK_UID:
+                    track["uid"] = read_uint(buf, c_start, c_size)
+                elif c_id == TRACK_TYPE:
+                    track["type"] = read_uint(buf, c_start, c_size)
+                elif c_id == CODEC_ID:
+                    track["codec_id"] = read_string(buf, c_start, c_size)
+                elif c_id == LANGUAGE:
+                    track["language"] = read_string(buf, c_start, c_size)
+                elif c_id == DEFAULT_DURATION:
+                    track["default_duration"] = read_uint(buf, c_start, c_size)
+                elif c_id == VIDEO:
+                    for v_id, v_start, v_size in iter_elements(buf, c_start, c_start + c_size):
+                        if v_id == PIXEL_WIDTH:
+                            track["width"] = read_uint(buf, v_start, v_size)
+                        elif v_id == PIXEL_HEIGHT:
+                            track["height"] = read_uint(buf, v_start, v_size)
+                elif c_id == AUDIO:
+                    for a_id, a_start, a_size in iter_elements(buf, c_start, c_start + c_size):
+                        if a_id == SAMPLING_FREQUENCY:
+                            track["sample_rate"] = int(read_float(buf, a_start, a_size))
+                        elif a_id == CHANNELS:
+                            track["channels"] = read_uint(buf, a_start, a_size)
+                        elif a_id == BIT_DEPTH:
+                            track["bit_depth"] = read_uint(buf, a_start, a_size)
+            tracks.append(track)
+        return tracks
+
+    def read_first_frames(self, numbers, budget = FRAME_SCAN_BUDGET):
+        """
+        Returns the first bytes of the first frame for each of the given track numbers found within the budget.
+        """
+        frames = {}
+        if self.first_cluster == None or numbers == []:
+            return frames
+        buf = self.buf
+        e_id = CLUSTER
+        start, size = self.first_cluster
+        end = min(self.segment_end, start + budget)
+        while start < end:
+            if e_id == CLUSTER:
+                for c_id, c_start, c_size in iter_elements(buf, start, min(start + size, end)):
+                    if c_id == SIMPLE_BLOCK:
+                        self.__read_block(c_start, c_size, numbers, frames)
+                    elif c_id == BLOCK_GROUP:
+                        for b_id, b_start, b_size in iter_elements(buf, c_start, c_start + c_size):
+                            if b_id == BLOCK:
+                                self.__read_block(b_start, b_size, numbers, frames)
+                    if len(frames) == len(numbers):
+                        return frames
+            if start + size >= end:
+                break
+            e_id, start, size = read_element(buf, start + size, self.segment_end)
+        return frames
+
+    def __read_block(self, start, size, numbers, frames):
+        buf = self.buf
+        number, n, _ = read_vint(buf, start)
+        if number not in numbers or number in frames:
+            return
+        flags = buf[start + n + 2]
+        pos = start + n + 3
+        lacing = (flags >> 1) & 3
+        if lacing != 0:
+            count = buf[pos] + 1
+            pos += 1
+            if lacing == 1:
+                # Xiph lacing
+                for _ in range(count - 1):
+                    while buf[pos] == 255:
+                        pos += 1
+                    pos += 1
+            elif lacing == 3:
+                # EBML lacing
+                for _ in range(count - 1):
+                    _, length, _ = read_vint(buf, pos)
+                    pos += length
+        frames[number] = bytes(buf[pos:min(pos + audioheader.HEADER_SIZE, start + size)])
+
+    def __iter_simple_tags(self):
+        """
+        Yields (track uids, tag name, value start, value size) of every simple tag, global tags have no uids.
+        """
+        if TAGS not in self.elements:
+            return
+        buf = self.buf
+        start, size = self.elements[TAGS]
+        for e_id, e_start, e_size in iter_elements(buf, start, start + size):
+            if e_id != TAG:
+                continue
+            uids = []
+            values = []
+            for c_id, c_start, c_size in iter_elements(buf, e_start, e_start + e_size):
+                if c_id == TARGETS:
+                    for t_id, t_start, t_size in iter_elements(buf, c_start, c_start + c_size):
+                        if t_id == TAG_TRACK_UID:
+                            uid = read_uint(buf, t_start, t_size)
+                            if uid != 0:
+                                uids.append(uid)
+                elif c_id == SIMPLE_TAG:
+                    name = None
+                    value = None
+                    for s_id, s_start, s_size in iter_elements(buf, c_start, c_start + c_size):
+                        if s_id == TAG_NAME:
+                            name = read_string(buf, s_start, s_size)
+                        elif s_id == TAG_STRING:
+                            value = (s_start, s_size)
+                    if name != None and value != None:
+                        values.append((name, value))
+            for name, value in values:
+                yield uids, name, value[0], value[1]
+
+    def read_tags(self):
+        """
+        Returns (global tags, tags per track uid) as dicts of tag name to value.
+        """
+        global_tags = {}
+        track_tags = {}
+        for uids, name, start, size in self.__iter_simple_tags():
+            value = read_string(self.buf, start, size)
+            if uids == []:
+                global_tags[name] = value
+            for uid in uids:
+                track_tags.setdefault(uid, {})[name] = value
+        return global_tags, track_tags
+
+def open_mmap(name):
+    with open(name, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise MatroskaError("Empty file")
+        return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+def read_tags(name):
+    """
+    Read only the global and track tags of a Matroska file, returns None if the file can not be read.
+    """
+    try:
+        buf = open_mmap(name)
+    except (OSError, ValueError, MatroskaError):
+        return None
+    try:
+        reader = MatroskaReader(buf)
+        reader.read_header()
+        return reader.read_tags()
+    except (IndexError, MatroskaError, struct.error):
+        return None
+    finally:
+        buf.close()
+
+def probe(name) -> Optional[dict]:
+    """
+    Probe a Matroska file without ffprobe, the result has the layout of the ffprobe json output.
+
+    Returns None when the file is not Matroska or a field needed by MediaFile is missing, the caller should then
+    fall back to ffprobe.
+    """
+    try:
+        buf = open_mmap(name)
+    except (OSError, ValueError, MatroskaError):
+        return None
+    try:
+        reader = MatroskaReader(buf)
+        reader.read_header()
+        duration = reader.read_duration()
+        tracks = reader.read_tracks()
+        global_tags, track_tags = reader.read_tags()
+        if tracks != None:
+            # Tracks that need their bit rate from the first frame header
+            numbers = []
+            for track in tracks:
+                tags = track_tags.get(track.get("uid"), {})
+                codec = codec_name(track.get("codec_id", ""), track["bit_depth"])
+                if codec in HEADER_BITRATE_CODECS and "BPS" not in tags and "BPS-eng" not in tags:
+                    numbers.append(track.get("number"))
+            frames = reader.read_first_frames(numbers)
+    except (IndexError, MatroskaError, struct.error):
+        return None
+    finally:
+        size = len(buf)
+        buf.close()
+    if duration == None or duration <= 0 or tracks == None:
+        return None
+
+    streams = []
+    for index, track in enumerate(tracks):
+        codec_type = TRACK_TYPES.get(track.get("type"))
+        codec = codec_name(track.get("codec_id", ""), track["bit_depth"])
+        if codec_type == None or codec == None:
+            return None
+        item = {"index": index, "codec_type": codec_type, "codec_name": codec}
+        tags = track_tags.get(track.get("uid"), {})
+        bps = tags.get("BPS", tags.get("BPS-eng"))
+        if bps != None and bps.isdigit():
+            item["bit_rate"] = bps
+        if codec_type == "video":
+            if "width" not in track or "height" not in track:
+                return None
+            item["width"] = track["width"]
+            item["height"] = track["height"]
+            if track.get("default_duration", 0) > 0:
+                item["avg_frame_rate"] = "1000000000/{}".format(track["default_duration"])
+        elif codec_type == "audio":
+            item["channels"] = track["channels"]
+            if track["channels"] in audioheader.DEFAULT_LAYOUTS:
+                item["channel_layout"] = audioheader.DEFAULT_LAYOUTS[track["channels"]]
+            if "sample_rate" in track:
+                item["sample_rate"] = track["sample_rate"]
+            if codec.startswith("pcm_") and "sample_rate" in track and "bit_rate" not in item:
+                item["bit_rate"] = str(track["sample_rate"] * track["bit_depth"] * track["channels"])
+            if codec in HEADER_BITRATE_CODECS and "bit_rate" not in item:
+                info = audioheader.frame_info(codec, frames.get(track.get("number"), b""))
+                if info == None:
+                    return None
+                item["bit_rate"] = str(info.bit_rate)
+        if track["language"] != "und":
+            item["tags"] = {"language": track["language"]}
+        streams.append(item)
+
+    return {
+        "format": {
+            "format_name": FORMAT_NAME,
+            "size": str(size),
+            "duration": "{:.6f}".format(duration),
+            "bit_rate": str(int(size * 8 / duration)),
+        },
+        "streams": streams,
+    }
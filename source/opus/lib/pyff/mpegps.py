@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    mpegps.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (18:10)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import struct
+
+from typing import Optional
+
+from . import audioheader
+
+# Bytes read from the start of the file and from each of the samples spread over the rest of it
+HEAD_SIZE = 4 * 1024 * 1024
+SAMPLE_SIZE = 1024 * 1024
+SAMPLE_COUNT = 16
+
+# Payload bytes kept per stream while looking for a frame or sequence header
+HEADER_BUDGET = 64 * 1024
+
+# Extra window given to ffmpeg past the point where the last stream was first seen
+WINDOW_MARGIN_BYTES = 2 * 1024 * 1024
+WINDOW_MARGIN_SECONDS = 1
+
+PACK_START = b"\x00\x00\x01\xba"
+SEQUENCE_HEADER = b"\x00\x00\x01\xb3"
+PRIVATE_STREAM_1 = 0xBD
+SCR_CLOCK = 90000
+
+# Frame rates by the sequence header frame_rate_code
+FRAME_RATES = {
+    1: "24000/1001",
+    2: "24/1",
+    3: "25/1",
+    4: "30000/1001",
+    5: "30/1",
+    6: "50/1",
+    7: "60000/1001",
+    8: "60/1",
+}
+
+# Probe results read without ffprobe use the same format name as ffmpeg
+FORMAT_NAME = "mpeg"
+
+class MpegPsError(Exception):
+    pass
+
+def substream_codec(stream_id):
+    """
+    Codec of a private stream 1 substream on a DVD, None when unknown.
+    """
+    if 0x20 <= stream_id <= 0x3F:
+        return "subtitle", "dvd_subtitle"
+    if 0x80 <= stream_id <= 0x87:
+        return "audio", "ac3"
+    if 0x88 <= stream_id <= 0x8F or 0x98 <= stream_id <= 0x9F:
+        return "audio", "dts"
+    if 0xA0 <= stream_id <= 0xA7:
+        return "audio", "pcm_dvd"
+    return None
+
+def stream_codec(stream_id):
+    """
+    Codec of a stream by the id ffmpeg gives it, substreams of private stream 1 use the substream id.
+    """
+    if stream_id < 0x100:
+        return substream_codec(stream_id)
+    if 0x1C0 <= stream_id <= 0x1DF:
+        return "audio", "mpeg_audio"
+    if 0x1E0 <= stream_id <= 0x1EF:
+        return "video", "mpeg2video"
+    return None
+
+def read_scr(data, pos):
+    """
+    System clock reference of an MPEG-2 pack header in seconds.
+    """
+    b = data[pos + 4:pos + 9]
+    if b[0] >> 6 != 1:
+        raise MpegPsError("Not an MPEG-2 pack header")
+    base = ((b[0] >> 3) & 7) << 30 | (b[0] & 3) << 28 | b[1] << 20 | (b[2] >> 3) << 15 | (b[2] & 3) << 13
+    base |= b[3] << 5 | b[4] >> 3
+    return base / SCR_CLOCK
+
+def lpcm_info(data) -> Optional[audioheader.FrameInfo]:
+    """
+    DVD LPCM audio frame header following the substream id.
+    """
+    if len(data) < 6:
+        return None
+    quantization = data[5] >> 6
+    if quantization == 3:
+        return None
+    bits = [16, 20, 24][quantization]
+    sample_rate = [48000, 96000, 44100, 32000][(data[5] >> 4) & 3]
+    channels = (data[5] & 7) + 1
+    return audioheader.FrameInfo(sample_rate * bits * channels, channels, sample_rate)
+
+def find_frame(codec, data):
+    """
+    Search the start of a stream for the first frame header ffprobe would read the stream parameters from.
+    """
+    syncs = {"ac3": b"\x0b\x77", "dts": b"\x7f\xfe\x80\x01", "mpeg_audio": b"\xff"}
+    pos = data.find(syncs[codec])
+    while pos != -1:
+        name = codec
+        if codec == "mpeg_audio":
+            layer = (data[pos + 1] >> 1) & 3 if pos + 1 < len(data) else 0
+            name = {2: "mp2", 1: "mp3"}.get(layer)
+        info = (None if name == None else audioheader.frame_info(name, data[pos:pos + audioheader.HEADER_SIZE]))
+        if info != None:
+            return name, info
+        pos = data.find(syncs[codec], pos + 1)
+    return None, None
+
+class ProgramStreamScanner(object):
+    """
+    Find the streams of an MPEG program stream (DVD VOB) by reading packs at a few offsets across the file.
+
+    Streams in a program stream have no header, they are only found by reading their packets. Instead of reading
+    hundreds of MB from the start of the file the packs of a few samples are parsed, every stream is recorded with
+    the file offset and clock reference where it was first seen.
+    """
+    def __init__(self, f, size):
+        self.f = f
+        self.size = size
+        self.streams = {}
+        self.order = []
+        self.first_scr = None
+        self.last_scr = None
+
+    def scan(self, samples = SAMPLE_COUNT):
+        offsets = [0]
+        if self.size > HEAD_SIZE:
+            step = (self.size - HEAD_SIZE) // samples
+            offsets.extend(HEAD_SIZE + step * i for i in range(1, samples))
+            offsets.append(max(HEAD_SIZE, self.size - SAMPLE_SIZE))
+        for offset in offsets:
+            self.f.seek(offset)
+            data = self.f.read(HEAD_SIZE if offset == 0 else SAMPLE_SIZE)
+            self.__scan_packs(data, offset)
+        if self.first_scr == None:
+            raise MpegPsError("No pack headers")
+
+    def __scan_packs(self, data, offset):
+        pos = data.find(PACK_START)
+        if offset == 0 and pos != 0:
+            raise MpegPsError("Not a program stream")
+        while pos != -1 and pos + 14 <= len(data):
+            scr = read_scr(data, pos)
+            if self.first_scr == None:
+                self.first_scr = scr
+            self.last_scr = scr
+            pos += 14 + (data[pos + 13] & 7)
+            # PES packets until the next pack header
+            while pos + 6 <= len(data) and data[pos:pos + 3] == b"\x00\x00\x01" and data[pos + 3] != 0xBA:
+                sid = data[pos + 3]
+                length, = struct.unpack_from(">H", data, pos + 4)
+                end = pos + 6 + length
+                if end > len(data):
+                    return
+                if sid == PRIVATE_STREAM_1 or 0xC0 <= sid <= 0xEF:
+                    payload = pos + 9 + data[pos + 8]
+                    if sid == PRIVATE_STREAM_1:
+                        stream_id = data[payload]
+                    else:
+                        stream_id = 0x100 | sid
+                    self.__add_packet(stream_id, data[payload:end], offset + pos, scr)
+                pos = end
+            pos = data.find(PACK_START, pos)
+
+    def __add_packet(self, stream_id, payload, offset, scr):
+        stream = self.streams.get(stream_id)
+        if stream == None:
+            stream = {"id": stream_id, "offset": offset, "scr": scr, "data": b""}
+            self.streams[stream_id] = stream
+            self.order.append(stream_id)
+        # LPCM has its frame header at the start of every packet, the others are searched for a sync word
+        if 0xA0 <= stream_id <= 0xA7 and stream["data"] != b"":
+            return
+        if len(stream["data"]) < HEADER_BUDGET:
+            stream["data"] += payload
+
+    def to_probe(self) -> Optional[dict]:
+        """
+        Returns the streams in the layout of the ffprobe json output, None if a stream can not be described.
+        """
+        duration = self.last_scr - self.first_scr
+        if duration <= 0:
+            return None
+        streams = []
+        last_offset = 0
+        last_time = 0.0
+        for index, stream_id in enumerate(self.order):
+            stream = self.streams[stream_id]
+            codec = stream_codec(stream_id)
+            if codec == None:
+                return None
+            codec_type, codec_name = codec
+            item = {"index": index, "id": "0x{:x}".format(stream_id), "codec_type": codec_type}
+            data = stream["data"]
+            if codec_type == "video":
+                pos = data.find(SEQUENCE_HEADER)
+                if pos == -1 or pos + 8 > len(data):
+                    return None
+                item["codec_name"] = codec_name
+                item["width"] = (data[pos + 4] << 4) | (data[pos + 5] >> 4)
+                item["height"] = ((data[pos + 5] & 0x0F) << 8) | data[pos + 6]
+                if data[pos + 7] & 0x0F in FRAME_RATES:
+                    item["avg_frame_rate"] = FRAME_RATES[data[pos + 7] & 0x0F]
+            elif codec_type == "audio":
+                if codec_name == "pcm_dvd":
+                    info = lpcm_info(data)
+                else:
+                    # Skip the substream id, frame count and first access unit pointer
+                    codec_name, info = find_frame(codec_name, data[4:] if stream_id < 0x100 else data)
+                if info == None:
+                    return None
+                item["codec_name"] = codec_name
+                item["bit_rate"] = str(info.bit_rate)
+                item["channels"] = info.channels
+                if info.channels in audioheader.DEFAULT_LAYOUTS:
+                    item["channel_layout"] = audioheader.DEFAULT_LAYOUTS[info.channels]
+                item["sample_rate"] = info.sample_rate
+            else:
+                item["codec_name"] = codec_name
+            streams.append(item)
+            last_offset = max(last_offset, stream["offset"])
+            last_time = max(last_time, stream["scr"] - self.first_scr)
+
+        return {
+            "format": {
+                "format_name": FORMAT_NAME,
+                "size": str(self.size),
+                "start_time": "{:.6f}".format(self.first_scr),
+                "duration": "{:.6f}".format(duration),
+                "bit_rate": str(int(self.size * 8 / duration)),
+            },
+            "streams": streams,
+            # Smallest window where ffmpeg still finds every stream
+            "window": (
+                int((last_time + WINDOW_MARGIN_SECONDS) * 1000000),
+                min(self.size, last_offset + WINDOW_MARGIN_BYTES),
+            ),
+        }
+
+def probe(name) -> Optional[dict]:
+    """
+    Probe an MPEG program stream without ffprobe, the result has the layout of the ffprobe json output.
+
+    Each stream carries its program stream id so it can be mapped without depending on the order ffmpeg finds the
+    streams in, and the result has the probe window ffmpeg needs to find all of them. Returns None when the file
+    is not an MPEG-2 program stream or a stream can not be described, the caller should then fall back to ffprobe.
+    """
+    try:
+        with open(name, "rb") as f:
+            scanner = ProgramStreamScanner(f, os.fstat(f.fileno()).st_size)
+            scanner.scan()
+        return scanner.to_probe()
+    except (OSError, IndexError, MpegPsError, struct.error):
+        return None
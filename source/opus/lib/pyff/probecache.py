@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    probecache.py
+
+    Written by:               Johan Oñate Bregell <johan@bregell.se>
+    Date:                     18 Oct 2026, (10:12)
+
+    Copyright:
+        Copyright (C) 2026 Johan Oñate Bregell
+
+        This program is free software: you can redistribute it and/or modify it under the terms of the GNU General
+        Public License as published by the Free Software Foundation, version 3.
+
+        This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+        implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+        for more details.
+
+        You should have received a copy of the GNU General Public License along with this program.
+        If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from typing import Optional
+
+from .fileidentity import FileIdentity
+
+# Bump when the layout of the stored stream model changes, older rows are then treated as misses
+PROBE_SCHEMA = 6
+
+class ProbeCache(object):
+    """
+    Persistent cache of parsed probe results keyed on file identity (path, size, mtime_ns, inode).
+
+    The number of rows is bounded by max_entries, the least recently used rows are evicted first.
+    Files that could not be probed are remembered as failures and rejected until failure_ttl seconds have passed,
+    a failure_ttl of 0 disables the failure cache.
+
+    Results of analyses that decode a stream, like loudness measurements, are stored per stream next to the probe
+    result. They are keyed on the analyzer and its parameters and are dropped when the probe row of the file is
+    evicted, invalidated or replaced for a changed file.
+    """
+    def __init__(self, path, max_entries = 100000, failure_ttl = 86400, log = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.failure_ttl = failure_ttl
+        self.log = log
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        with self.__lock, self.__conn:
+            self.__conn.execute("PRAGMA journal_mode=WAL")
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS probe ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+                "schema INTEGER NOT NULL, record TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.__conn.execute("CREATE INDEX IF NOT EXISTS probe_last_access ON probe (last_access)")
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS failure ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+                "reason TEXT NOT NULL, attempts INTEGER NOT NULL, failed_at REAL NOT NULL)"
+            )
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis ("
+                "path TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+                "stream INTEGER NOT NULL, analyzer TEXT NOT NULL, params TEXT NOT NULL, result TEXT NOT NULL, "
+                "analyzed_at REAL NOT NULL, PRIMARY KEY (path, stream, analyzer, params))"
+            )
+            self.__count = self.__conn.execute("SELECT COUNT(*) FROM probe").fetchone()[0]
+
+    def get(self, identity: FileIdentity) -> Optional[dict]:
+        with self.__lock, self.__conn:
+            row = self.__conn.execute(
+                "SELECT size, mtime_ns, inode, schema, record FROM probe WHERE path = ?", (identity.path,)
+            ).fetchone()
+            if row == None:
+                self.misses += 1
+                return None
+            size, mtime_ns, inode, schema, record = row
+            if schema != PROBE_SCHEMA or not identity.matches(size, mtime_ns, inode):
+                # File changed on disk since it was probed
+                self.__conn.execute("DELETE FROM probe WHERE path = ?", (identity.path,))
+                self.__drop_stale_analyses(identity)
+                self.__count -= 1
+                self.misses += 1
+                return None
+            self.__conn.execute("UPDATE probe SET last_access = ? WHERE path = ?", (time.time(), identity.path))
+            self.hits += 1
+        return json.loads(record)
+
+    def put(self, identity: FileIdentity, record: dict):
+        with self.__lock, self.__conn:
+            exists = self.__conn.execute("SELECT 1 FROM probe WHERE path = ?", (identity.path,)).fetchone()
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO probe (path, size, mtime_ns, inode, schema, record, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (identity.path, identity.size, identity.mtime_ns, identity.inode, PROBE_SCHEMA,
+                 json.dumps(record), time.time())
+            )
+            self.__drop_stale_analyses(identity)
+            if exists == None:
+                self.__count += 1
+            if self.__count > self.max_entries:
+                self.__evict()
+
+    def get_failure(self, identity: FileIdentity) -> Optional[str]:
+        """
+        Returns the reason the unchanged file could not be probed, None when it should be probed (again).
+        """
+        if self.failure_ttl <= 0:
+            return None
+        with self.__lock, self.__conn:
+            row = self.__conn.execute(
+                "SELECT size, mtime_ns, inode, reason, failed_at FROM failure WHERE path = ?", (identity.path,)
+            ).fetchone()
+            if row == None:
+                return None
+            size, mtime_ns, inode, reason, failed_at = row
+            if not identity.matches(size, mtime_ns, inode):
+                # File changed on disk since it failed
+                self.__conn.execute("DELETE FROM failure WHERE path = ?", (identity.path,))
+                return None
+            if time.time() - failed_at >= self.failure_ttl:
+                return None
+            self.rejections += 1
+        return reason
+
+    def put_failure(self, identity: FileIdentity, reason):
+        if self.failure_ttl <= 0:
+            return
+        with self.__lock, self.__conn:
+            row = self.__conn.execute(
+                "SELECT size, mtime_ns, inode, attempts FROM failure WHERE path = ?", (identity.path,)
+            ).fetchone()
+            attempts = 1
+            if row != None and identity.matches(row[0], row[1], row[2]):
+                attempts = row[3] + 1
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO failure (path, size, mtime_ns, inode, reason, attempts, failed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (identity.path, identity.size, identity.mtime_ns, identity.inode, reason, attempts, time.time())
+            )
+            # Rows of files that were removed or fixed long ago
+            self.__conn.execute("DELETE FROM failure WHERE failed_at < ?", (time.time() - 10 * self.failure_ttl,))
+
+    def get_analysis(self, identity: FileIdentity, stream, analyzer, params = "") -> Optional[dict]:
+        """
+        Returns the stored result of an analyzer for a stream of the unchanged file, None when it must be analyzed.
+        """
+        with self.__lock, self.__conn:
+            row = self.__conn.execute(
+                "SELECT size, mtime_ns, inode, result FROM analysis "
+                "WHERE path = ? AND stream = ? AND analyzer = ? AND params = ?",
+                (identity.path, stream, analyzer, params)
+            ).fetchone()
+            if row == None:
+                return None
+            size, mtime_ns, inode, result = row
+            if not identity.matches(size, mtime_ns, inode):
+                # File changed on disk since it was analyzed, the results of every stream are stale
+                self.__conn.execute("DELETE FROM analysis WHERE path = ?", (identity.path,))
+                return None
+        return json.loads(result)
+
+    def put_analysis(self, identity: FileIdentity, stream, analyzer, result: dict, params = ""):
+        with self.__lock, self.__conn:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO analysis "
+                "(path, size, mtime_ns, inode, stream, analyzer, params, result, analyzed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (identity.path, identity.size, identity.mtime_ns, identity.inode, stream, analyzer, params,
+                 json.dumps(result), time.time())
+            )
+
+    def invalidate(self, path):
+        with self.__lock, self.__conn:
+            cursor = self.__conn.execute("DELETE FROM probe WHERE path = ?", (path,))
+            self.__count -= cursor.rowcount
+            self.__conn.execute("DELETE FROM failure WHERE path = ?", (path,))
+            self.__conn.execute("DELETE FROM analysis WHERE path = ?", (path,))
+
+    def stats(self) -> dict:
+        with self.__lock:
+            failures = self.__conn.execute("SELECT COUNT(*) FROM failure").fetchone()[0]
+            analyses = self.__conn.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+        return {
+            "entries": self.__count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "failures": failures,
+            "rejections": self.rejections,
+            "analyses": analyses,
+        }
+
+    def __drop_stale_analyses(self, identity: FileIdentity):
+        # Analyses of an earlier version of the file
+        self.__conn.execute(
+            "DELETE FROM analysis WHERE path = ? AND NOT (size = ? AND mtime_ns = ? AND inode = ?)",
+            (identity.path, identity.size, identity.mtime_ns, identity.inode)
+        )
+
+    def __evict(self):
+        # Evict down to 90% of the limit so that a full cache does not evict on every insert
+        n_evict = self.__count - int(self.max_entries * 0.9)
+        cursor = self.__conn.execute(
+            "DELETE FROM probe WHERE path IN (SELECT path FROM probe ORDER BY last_access LIMIT ?)", (n_evict,)
+        )
+        self.__count -= cursor.rowcount
+        self.evictions += cursor.rowcount
+        self.__conn.execute("DELETE FROM analysis WHERE path NOT IN (SELECT path FROM probe)")
+        if self.log != None:
+            txt = "Probe cache evicted {} entries".format(cursor.rowcount)
+            self.log.debug(txt)
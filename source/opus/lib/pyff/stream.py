@@ -25,6 +25,7 @@ class Stream(object):
     def __init__(self, index, codec):
         self.index = index
         self.codec = "" if codec == None else codec
+        self.stream_id = None
 
     @property
     def index(self):
@@ -46,7 +47,38 @@ class Stream(object):
             raise TypeError("Codec is not string")
         self.__codec = codec
 
+    @property
+    def stream_id(self):
+        return self.__stream_id
+
+    @stream_id.setter
+    def stream_id(self, stream_id):
+        if stream_id != None and type(stream_id) is not str:
+            raise TypeError("Stream id is not string")
+        self.__stream_id = stream_id
+
+    def specifier(self):
+        """
+        Stream specifier for -map, by stream id when the container has one that does not depend on probe order.
+        """
+        if self.stream_id != None:
+            return "i:{}".format(self.stream_id)
+        return str(self.index)
 
     def getInfo(self):
         txt = "Index: {}, Codec: {}".format(self.index, self.codec)
-        return txt
\ No newline at end of file
+        return txt
+
+    def to_dict(self):
+        data = {"index": self.index, "codec": self.codec}
+        if self.stream_id != None:
+            data["stream_id"] = self.stream_id
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        stream_id = data.pop("stream_id", None)
+        stream = cls(**data)
+        stream.stream_id = stream_id
+        return stream
\ No newline at end of file
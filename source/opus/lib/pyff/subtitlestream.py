@@ -44,4 +44,9 @@ class SubtitleStream(Stream):
         txt = ""
         txt += Stream.getInfo(self) + ", "
         txt += "Language: {}".format(self.language)
-        return txt
\ No newline at end of file
+        return txt
+
+    def to_dict(self):
+        data = Stream.to_dict(self)
+        data["language"] = self.language
+        return data
\ No newline at end of file
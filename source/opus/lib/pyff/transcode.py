@@ -21,9 +21,14 @@
         If not, see <https://www.gnu.org/licenses/>.
 """
 
-import re
+from typing import List
 
 from .mediafile import MediaFile
+from .opusencoder import BITRATE_PER_CHANNEL, opus_args, opus_bitrate
+from .provenance import provenance_args
+
+# Audio codecs encoded to opus, every other audio stream is copied
+OPUS_SOURCE_CODECS = ["pcm_s16le", "pcm_s32le"]
 
 class TranscodeResult(object):
     def __init__(self, status = True, string = None):
@@ -52,8 +57,11 @@ class TranscodeResult(object):
 
 
 class TranscodeJob(object):
-    def __init__(self, mediafile, log, args = None, result = None, new_file = None):
+    def __init__(self, mediafile, log, args = None, result = None, new_file = None, provenance = None,
+                 downmix = None):
         self.log = log
+        self.provenance = provenance
+        self.downmix = ({} if downmix == None else downmix)
         self.mediafile = mediafile
         self.args = ([] if args == None else args)
         self.result = (TranscodeResult() if result == None else result)
@@ -83,6 +91,38 @@ class TranscodeJob(object):
     def new_file(self, new_file):
         self.__new_file = new_file
 
+    @staticmethod
+    def audio_encoder(a_stream) -> str:
+        if a_stream.codec in OPUS_SOURCE_CODECS:
+            return "libopus"
+        return "copy"
+
+    def audio_args(self, a_stream, a_index, filters = None, force = False) -> List[str]:
+        """
+        Encoder options of one audio stream. The filters run before the channel map, force encodes a stream that
+        would be copied, its samples are changed by the filters. Streams with a downmix by stream index are encoded
+        with only its channels.
+        """
+        a_encoder = ("libopus" if force else self.audio_encoder(a_stream))
+        if a_encoder == "copy":
+            return ["-c:a:{}".format(a_index), a_encoder]
+
+        downmix = self.downmix.get(a_stream.index)
+        if downmix != None:
+            # Keep only the channels that carry the stream, same bitrate per channel
+            return opus_args(a_stream, a_index, filters, downmix.channelmap(),
+                             min(opus_bitrate(a_stream.channels), BITRATE_PER_CHANNEL * downmix.channels))
+        return opus_args(a_stream, a_index, filters)
+
+    def encodes_audio(self) -> bool:
+        """
+        True if create_cmd would encode at least one audio stream, the command is only a remux otherwise.
+        """
+        for a_stream in self.mediafile.getAudioStreams():
+            if self.audio_encoder(a_stream) != "copy":
+                return True
+        return False
+
     def create_cmd(self, print_debug = False):
         txt = self.mediafile.getInfo()
         if print_debug == True:
@@ -94,8 +134,11 @@ class TranscodeJob(object):
         # Use ffmpeg
         self.args = ["ffmpeg", "-hide_banner", "-loglevel", "info", "-vsync", "0"]
 
-        # Extend stream scan for VOB
-        if ".vob" in self.mediafile.name:
+        # Reuse the probe window that resolved the file, extend stream scan for VOB when unknown
+        if self.mediafile.probe_window != None:
+            analyzeduration, probesize = self.mediafile.probe_window
+            self.args.extend(["-analyzeduration", str(analyzeduration), "-probesize", str(probesize)])
+        elif ".vob" in self.mediafile.name:
             self.args.extend(["-analyzeduration", "500M", "-probesize", "500M"])
         else :
             self.args.extend(["-analyzeduration", "250M", "-probesize", "250M"])
@@ -105,16 +148,16 @@ class TranscodeJob(object):
 
         # Loop over video steams
         for v_stream in self.mediafile.getVideoStreams():
-            self.args.extend(["-map", "0:{}".format(v_stream.index)])
+            self.args.extend(["-map", "0:{}".format(v_stream.specifier())])
 
         # Loop over audio streams
         for a_stream in self.mediafile.getAudioStreams():
-            self.args.extend(["-map", "0:{}".format(a_stream.index)])
+            self.args.extend(["-map", "0:{}".format(a_stream.specifier())])
 
         # Loop over subtitle streams
         for s_stream in self.mediafile.getSubtitleStreams():
             if s_stream.codec in ["subrip", "ass", "dvd_subtitle", "dvb_subtitle", "pgssub", "hdmv_pgs_subtitle"]:
-                self.args.extend(["-map", "0:{}".format(s_stream.index)])
+                self.args.extend(["-map", "0:{}".format(s_stream.specifier())])
 
         # Video encoder settings
         v_index = 0
@@ -127,25 +170,7 @@ class TranscodeJob(object):
         # Config audio streams
         a_index = 0
         for a_stream in self.mediafile.getAudioStreams():
-            # Set audio encoder
-            if a_stream.codec == 'pcm_s16le' or a_stream.codec == 'pcm_s32le':
-                a_encoder = "libopus"
-            else:
-                a_encoder = "copy"
-
-            # Audio encoder settings
-            self.args.extend(["-c:a:{}".format(a_index), a_encoder])
-
-            # If audio is not copy add channelmap and encoder settings
-            if a_encoder != "copy":
-                # Remove side and wide channels
-                a_stream.channel_layout = re.search(r'^[^\(]+', a_stream.channel_layout).group(0)
-                # Set channel_layout
-                channel_config = "channelmap=channel_layout={}".format(a_stream.channel_layout)
-                # Set compression level to "lossless"
-                self.args.extend(["-filter:a:{}".format(a_index), channel_config, "-compression_level", "10"])
-                # Set bitrate
-                self.args.extend(["-b:a:{}".format(a_index), "{}".format(a_stream.bitrate)])
+            self.args.extend(self.audio_args(a_stream, a_index))
             a_index += 1
 
         # Config subtitle streams
@@ -155,6 +180,10 @@ class TranscodeJob(object):
                 self.args.extend(["-c:s:{}".format(s_index), "copy"])
             s_index += 1
 
+        # Tag the output with how it was made, later scans trust the tag instead of probing
+        if self.provenance != None:
+            self.args.extend(provenance_args(self.provenance))
+
         # Set output filename
         self.args.extend(["-f", "matroska", self.new_file.name])
         return
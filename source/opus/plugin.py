@@ -36,6 +36,9 @@
 
     THIS EXAMPLE:
 
+        > The Library Management File Test runner
+            :param data     - Dictionary object of data about the file being tested for the pending tasks queue.
+
         > The Worker Process Plugin runner
             :param data     - Dictionary object of data that will configure how the FFMPEG process is executed.
 
@@ -44,11 +47,14 @@ from logging import Logger
 import logging
 import os
 import re
+from typing import Dict, Optional, Tuple
 
 from unmanic.libs.unplugins.settings import PluginSettings
 from unmanic.libs.system import System
 
-from opus.lib.pyff import MediaFile, TranscodeJob
+from opus.lib.pyff import AudioPipeline, ChannelAnalyzer, DecisionMemo, Downmix, MediaFile, ProbeCache, ProbeRegistry
+from opus.lib.pyff import Provenance, TranscodeJob, downmix_layout, read_provenance, read_version, sample_windows
+from opus.lib.pyff import settings_hash
 
 # Configure plugin logger
 logger = logging.getLogger("Unmanic.Plugin.opus")
@@ -69,20 +75,179 @@ class Settings(PluginSettings):
 
     """
     settings = {
+        "probe_cache_max_entries": 100000,
+        "probe_failure_retry_hours": 24,
+        "downmix_upmixed_channels": True,
+        "channel_analysis_windows": 8,
+        "channel_analysis_window_seconds": 10,
+        "channel_correlation": 0.98,
     }
 
-def check_run(m_file: MediaFile) -> bool:
-    normalize = True
 
+# Probe cache shared by all runners of this plugin, opened on first use
+probe_cache = None
+
+# Decisions of earlier scans, opened on first use
+decision_memo = None
+
+# Version from info.json, read on first use
+plugin_version = None
+
+# Probe results shared with the other plugins running in this process
+probe_registry = ProbeRegistry()
+
+
+def get_probe_cache(settings: Settings) -> ProbeCache:
+    global probe_cache
+    if probe_cache == None:
+        db_file = os.path.join(settings.get_profile_directory(), "probe_cache.db")
+        max_entries = int(settings.get_setting("probe_cache_max_entries"))
+        failure_ttl = float(settings.get_setting("probe_failure_retry_hours")) * 3600
+        probe_cache = ProbeCache(db_file, max_entries = max_entries, failure_ttl = failure_ttl, log = logger)
+    return probe_cache
+
+
+def get_plugin_version() -> str:
+    global plugin_version
+    if plugin_version == None:
+        plugin_version = read_version(os.path.join(os.path.dirname(os.path.abspath(__file__)), "info.json"))
+    return plugin_version
+
+
+def get_decision_memo(settings: Settings) -> DecisionMemo:
+    global decision_memo
+    if decision_memo == None:
+        db_file = os.path.join(settings.get_profile_directory(), "decision_memo.db")
+        max_entries = int(settings.get_setting("probe_cache_max_entries"))
+        decision_memo = DecisionMemo(db_file, "opus", get_plugin_version(), settings_hash(settings.get_setting()),
+                                     max_entries = max_entries, log = logger)
+    return decision_memo
+
+
+def get_provenance(settings: Settings) -> Provenance:
+    return Provenance("opus", get_plugin_version(), settings_hash(settings.get_setting()))
+
+
+def plan_downmix(settings: Settings, m_file: MediaFile) -> Dict[int, Downmix]:
+    """
+    Downmix of the streams to encode whose extra channels are silent or copies of the front channels, by stream
+    index. The channels are analyzed over sampled windows and the results kept in the probe cache.
+    """
+    downmix = {}
+    if not settings.get_setting("downmix_upmixed_channels"):
+        return downmix
+    m_file.getInfo()
+    pipeline = AudioPipeline(m_file, log = logger, cache = get_probe_cache(settings))
+    windows = sample_windows(m_file.length, int(settings.get_setting("channel_analysis_windows")),
+                             float(settings.get_setting("channel_analysis_window_seconds")))
+    threshold = float(settings.get_setting("channel_correlation"))
+    for a_stream in m_file.getAudioStreams():
+        if TranscodeJob.audio_encoder(a_stream) == "copy" or a_stream.channels < 2:
+            continue
+        try:
+            result = pipeline.run(a_stream, [ChannelAnalyzer()], windows)[ChannelAnalyzer.name]
+        except Exception as e:
+            logger.warning("{}: Channel analysis of stream {} failed, {}".format(m_file.name, a_stream.index, e))
+            continue
+        layout = downmix_layout(result["products"], a_stream.channel_layout, threshold)
+        if layout != None:
+            logger.info("{}: Stream {} is effectively {}, {} channels kept of {}".format(
+                m_file.name, a_stream.index, layout.layout, "/".join(layout.sources), a_stream.channel_layout))
+            downmix[a_stream.index] = layout
+    return downmix
+
+
+def check_provenance(m_file: MediaFile, expected: Provenance) -> Optional[str]:
+    """
+    Files this plugin made carry a provenance tag, read from the Matroska header without probing. The tag is only
+    trusted when it matches the expected provenance of this version and settings, other files are probed and decided.
+    Returns the reason to skip the file or None.
+    """
+    provenance = read_provenance(m_file.name, "opus")
+    if provenance == None:
+        return None
+    m_file.log.debug("{}: {}".format(m_file.name, provenance.getInfo()))
+    if not provenance.matches(expected):
+        return None
+    return "File was processed by opus {}".format(provenance.version)
+
+
+def decide(m_file: MediaFile) -> bool:
+    # Probe, raises when the file can not be probed
+    m_file.getInfo()
     for a_stream in m_file.getAudioStreams():
         logger.debug("Stream codec: {}".format(a_stream.codec))
         logger.debug("Stream channels: {}".format(a_stream.channels))
         logger.debug("Stream layout: {}".format(a_stream.channel_layout))
-        if a_stream.codec == "opus":
-            normalize = False
+        logger.debug("Stream encoder: {}".format(TranscodeJob.audio_encoder(a_stream)))
+
+    # Same per stream rule as the command, a file where every stream would be copied is not worth a remux
+    encode = TranscodeJob(m_file, logger).encodes_audio()
+
+    logger.debug("Opus encode: {}".format(str(encode)))
+    return encode
+
+
+def check_run(m_file: MediaFile, expected: Provenance, memo: Optional[DecisionMemo] = None) -> Tuple[bool, str]:
+    """
+    Returns whether the file has audio to encode and the reason, from the memo when the file was decided before
+    by this plugin version with the same settings.
+    """
+    identity = None
+    if memo != None:
+        identity, memoized = memo.lookup(m_file.name)
+        if memoized != None:
+            logger.debug("{}: {} (memoized)".format(m_file.name, memoized[1]))
+            return memoized
+
+    reason = check_provenance(m_file, expected)
+    if reason != None:
+        encode = False
+    else:
+        encode = decide(m_file)
+        reason = ("Audio stream to encode to opus" if encode else "No audio stream to encode to opus")
+    if memo != None:
+        memo.put(identity, encode, reason)
+    return encode, reason
+
+
+def on_library_management_file_test(data):
+    """
+    Runner function - enables additional actions during the library management file tests.
+
+    The 'data' object argument includes:
+        path                            - String containing the full path to the file being tested.
+        issues                          - List of currently found issues for not processing the file.
+        add_file_to_pending_tasks       - Boolean, is the file currently marked to be added to the queue for processing.
+
+    :param data:
+    :return:
+    """
+    settings = Settings()
+
+    abspath = os.path.abspath(data.get('path'))
 
-    logger.debug("Opus encode: {}".format(str(normalize)))
-    return normalize
+    # Decisions come from the memo and probe results from the registry or cache when the file is unchanged
+    m_file = MediaFile(name = abspath, log = logger, cache = get_probe_cache(settings), registry = probe_registry)
+    try:
+        encode, reason = check_run(m_file, get_provenance(settings), get_decision_memo(settings))
+    except Exception as e:
+        txt = str(e)
+    else:
+        txt = (None if encode else "{}: {}".format(abspath, reason))
+
+    if txt != None:
+        logger.debug(txt)
+        data['issues'].append({
+            'id':      'opus',
+            'message': txt,
+        })
+        return data
+
+    logger.debug("{}: Add to pending tasks".format(abspath))
+    data['add_file_to_pending_tasks'] = True
+
+    return data
 
 
 
@@ -108,14 +273,16 @@ def on_worker_process(data):
     in_abs = os.path.abspath(data.get('file_in'))
     out_abs = os.path.abspath(data.get('file_out'))
 
-    m_file = MediaFile(name = in_abs, log = logger)
-    m_file.getInfo()
-
-    run_opus = check_run(m_file)
+    m_file = MediaFile(name = in_abs, log = logger, cache = get_probe_cache(settings), registry = probe_registry)
+    provenance = get_provenance(settings)
+    run_opus, reason = check_run(m_file, provenance, get_decision_memo(settings))
+    logger.debug("Probe cache: {}".format(probe_cache.stats()))
+    logger.debug("Decision memo: {}".format(decision_memo.stats()))
 
     if run_opus:
         m_file_new = MediaFile(out_abs, log = logger)
-        t_job = TranscodeJob(m_file, logger, new_file = m_file_new)
+        t_job = TranscodeJob(m_file, logger, new_file = m_file_new, provenance = provenance,
+                             downmix = plan_downmix(settings, m_file))
 
         t_job.create_cmd()
 
@@ -124,6 +291,7 @@ def on_worker_process(data):
 
         # Set exec cmd
         data['exec_command'] = t_job.args
+        probe_registry.invalidate(out_abs)
 
         # Create parser
         parser = Parser(logger, m_file.length)
@@ -0,0 +1,11 @@
+"""
+    Tests of the pyff library vendored with the plugins, run with pytest from the project root.
+
+    Each plugin carries its own copy of pyff, the shared modules are tested through the hevc_nvenc copy and the
+    modules only one plugin has through that plugin. Requires the plugin requirements (guessit, humanize, numpy).
+"""
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(project_root, 'source'))
@@ -0,0 +1,67 @@
+"""
+    downmix_layout on the channel products of generated signals.
+"""
+import numpy as np
+
+from opus.lib.pyff.channels import Downmix, downmix_layout
+
+
+def products(*channels):
+    x = np.stack(channels, axis = 1)
+    return (x.T @ x / x.shape[0]).tolist()
+
+
+def noise(seed):
+    return np.random.default_rng(seed).standard_normal(48000)
+
+
+def test_upmixed_stereo():
+    left, right = noise(1), noise(2)
+    silent = np.zeros(48000)
+    # Phantom center, surrounds copied from the fronts and a silent LFE
+    downmix = downmix_layout(products(left, right, (left + right) / 2, silent, 0.5 * left, 0.5 * right), "5.1")
+    assert downmix == Downmix("stereo", ["FL", "FR"])
+    assert downmix.channels == 2
+    assert downmix.channelmap() == "channelmap=map=FL-FL|FR-FR:channel_layout=stereo"
+
+
+def test_dual_mono():
+    left = noise(1)
+    silent = np.zeros(48000)
+    assert downmix_layout(products(left, left), "stereo") == Downmix("mono", ["FL"])
+    assert downmix_layout(products(left, left, left, silent, left, left), "5.1") == Downmix("mono", ["FL"])
+
+
+def test_center_only():
+    center = noise(3)
+    silent = np.zeros(48000)
+    downmix = downmix_layout(products(silent, silent, center, silent, silent, silent), "5.1(side)")
+    assert downmix == Downmix("mono", ["FC"])
+    assert downmix.channelmap() == "channelmap=map=FC-FC:channel_layout=mono"
+
+
+def test_real_layouts_are_kept():
+    left, right = noise(1), noise(2)
+    silent = np.zeros(48000)
+    # Stereo is already the layout
+    assert downmix_layout(products(left, right), "stereo") == None
+    # Independent surrounds
+    assert downmix_layout(products(left, right, silent, silent, noise(4), noise(5)), "5.1") == None
+    # LFE carries sound
+    assert downmix_layout(products(left, right, silent, noise(6), silent, silent), "5.1") == None
+
+
+def test_threshold():
+    left, right = noise(1), noise(2)
+    silent = np.zeros(48000)
+    center = left + 0.5 * noise(7)
+    channels = products(left, right, center, silent, silent, silent)
+    assert downmix_layout(channels, "5.1", threshold = 0.98) == None
+    assert downmix_layout(channels, "5.1", threshold = 0.8) == Downmix("stereo", ["FL", "FR"])
+
+
+def test_unusable_input():
+    silent = np.zeros(48000)
+    assert downmix_layout(products(silent, silent), "stereo") == None
+    assert downmix_layout(products(noise(1), noise(2)), "5.1") == None
+    assert downmix_layout(products(noise(1), noise(2)), "unknown") == None
@@ -0,0 +1,45 @@
+"""
+    hevc_nvenc decisions judge the bit rate of the source, the width cap only limits the bit rate of the encode.
+"""
+import pytest
+
+from hevc_nvenc.lib.pyff.decision import HEVC_SIZE_RATIO, DecisionEngine
+from hevc_nvenc.lib.pyff.videostream import VideoStream
+
+
+class ProbedFile(object):
+    """
+    The parts of a probed MediaFile a decision reads.
+    """
+    def __init__(self, v_streams, length):
+        self.v_streams = v_streams
+        self.length = length
+
+    def getVideoStreams(self):
+        return self.v_streams
+
+    def estimate_video_bitrates(self):
+        pass
+
+
+def test_target_bitrates():
+    assert VideoStream(0, "h264", 20000000, 1920, 1080, 40000000).target_bitrates() == (8948000, 17896000)
+    assert VideoStream(0, "h264", 5000000, 1920, 1080, 9000000).target_bitrates() == (5000000, 9000000)
+    assert VideoStream(0, "mpeg2video", 6000000, 720, 576).target_bitrates() == (1789000, 0)
+    assert VideoStream(0, "h264", 80000000, 7680, 4320).target_bitrates() == (80000000, 0)
+
+
+def test_decision_uses_the_uncapped_bitrate():
+    v_stream = VideoStream(0, "h264", 20000000, 1920, 1080, 0, 25.0)
+    decision = DecisionEngine().decide(ProbedFile([v_stream], 60.0))
+    assert decision.encode
+    assert decision.bpp == pytest.approx(20000000 / (1920 * 1080 * 25))
+    assert decision.expected_savings == int(20000000 * (1 - HEVC_SIZE_RATIO["h264"]) * 60.0 / 8)
+    assert v_stream.bitrate == 20000000
+
+
+def test_bpp_floor():
+    v_stream = VideoStream(0, "h264", 500000, 1920, 1080, 0, 25.0)
+    decision = DecisionEngine(min_bpp = 0.05).decide(ProbedFile([v_stream], 60.0))
+    assert not decision.encode
+    assert decision.bpp == pytest.approx(500000 / (1920 * 1080 * 25))
@@ -0,0 +1,122 @@
+"""
+    DecisionMemo eviction and invalidation, with a clock that advances on every read so access order is exact.
+"""
+import itertools
+import sqlite3
+import types
+
+import pytest
+
+from hevc_nvenc.lib.pyff import decisionmemo
+from hevc_nvenc.lib.pyff.decisionmemo import DecisionMemo, settings_hash
+from hevc_nvenc.lib.pyff.fileidentity import FileIdentity
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(decisionmemo, "time", types.SimpleNamespace(time = lambda: float(next(ticks))))
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "memo.db")
+
+
+def identity(n, size = 100):
+    return FileIdentity("/media/{}.mkv".format(n), size, 1, n)
+
+
+def test_round_trip(db, clock):
+    memo = DecisionMemo(db, "opus", "1.0.0", "a")
+    assert memo.get(identity(1)) == None
+    memo.put(identity(1), True, "Audio stream to encode to opus")
+    memo.put(None, False, "Not memoized")
+    assert memo.get(identity(1)) == (True, "Audio stream to encode to opus")
+    assert memo.stats() == {"entries": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_lookup(tmp_path, db, clock):
+    memo = DecisionMemo(db, "opus", "1.0.0", "a")
+    assert memo.lookup(str(tmp_path / "missing.mkv")) == (None, None)
+    media = tmp_path / "file.mkv"
+    media.write_bytes(b"\x00" * 10)
+    found, decision = memo.lookup(str(media))
+    assert found == FileIdentity.from_path(str(media))
+    assert decision == None
+    memo.put(found, False, "No audio stream to encode to opus")
+    assert memo.lookup(str(media)) == (found, (False, "No audio stream to encode to opus"))
+
+
+def test_changed_file(db, clock):
+    memo = DecisionMemo(db, "opus", "1.0.0", "a")
+    memo.put(identity(1), True, "Encode")
+    assert memo.get(identity(1, size = 200)) == None
+    assert memo.stats()["entries"] == 0
+    assert memo.get(identity(1)) == None
+
+
+def test_settings_and_version(db, clock):
+    DecisionMemo(db, "opus", "1.0.0", "a").put(identity(1), True, "Encode")
+    DecisionMemo(db, "normalize", "2.0.0", "b").put(identity(1), False, "Within tolerance")
+
+    # Other settings do not use the row but keep it until the file is decided again
+    memo = DecisionMemo(db, "opus", "1.0.0", "c")
+    assert memo.get(identity(1)) == None
+    assert memo.stats()["entries"] == 1
+
+    # Another version removes the rows of the plugin only
+    memo = DecisionMemo(db, "opus", "1.0.1", "a")
+    assert memo.stats()["entries"] == 0
+    assert DecisionMemo(db, "normalize", "2.0.0", "b").get(identity(1)) == (False, "Within tolerance")
+
+
+def test_invalidate(db, clock):
+    memo = DecisionMemo(db, "opus", "1.0.0", "a")
+    other = DecisionMemo(db, "normalize", "1.0.0", "a")
+    memo.put(identity(1), True, "Encode")
+    other.put(identity(1), True, "Normalize")
+    memo.invalidate(identity(1).path)
+    assert memo.stats()["entries"] == 0
+    assert memo.get(identity(1)) == None
+    assert other.get(identity(1)) == (True, "Normalize")
+
+
+def test_eviction(db, clock):
+    memo = DecisionMemo(db, "opus", "1.0.0", "a", max_entries = 10)
+    other = DecisionMemo(db, "normalize", "1.0.0", "a", max_entries = 10)
+    other.put(identity(100), True, "Normalize")
+    for n in range(10):
+        memo.put(identity(n), True, "Encode")
+    # The oldest entry is used again, the next two are the least recently used
+    assert memo.get(identity(0)) == (True, "Encode")
+    memo.put(identity(10), True, "Encode")
+
+    assert memo.stats()["entries"] == 9
+    assert memo.stats()["evictions"] == 2
+    assert memo.get(identity(1)) == None
+    assert memo.get(identity(2)) == None
+    assert memo.get(identity(0)) == (True, "Encode")
+    # Rows of other plugins are not counted or evicted
+    assert other.get(identity(100)) == (True, "Normalize")
+
+
+def test_table_without_access_times(db, clock):
+    conn = sqlite3.connect(db)
+    with conn:
+        conn.execute("CREATE TABLE decision (path TEXT NOT NULL, plugin TEXT NOT NULL, size INTEGER NOT NULL, "
+                     "mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, version TEXT NOT NULL, "
+                     "settings TEXT NOT NULL, encode INTEGER NOT NULL, reason TEXT NOT NULL, "
+                     "decided_at REAL NOT NULL, PRIMARY KEY (path, plugin))")
+        conn.execute("INSERT INTO decision VALUES ('/media/1.mkv', 'opus', 100, 1, 1, '1.0.0', 'a', 1, 'Encode', 0)")
+    conn.close()
+
+    memo = DecisionMemo(db, "opus", "1.0.0", "a")
+    assert memo.stats()["entries"] == 0
+    memo.put(identity(1), False, "No audio stream to encode to opus")
+    assert memo.get(identity(1)) == (False, "No audio stream to encode to opus")
+
+
+def test_settings_hash():
+    assert settings_hash({"a": 1, "b": "x"}) == settings_hash({"b": "x", "a": 1})
+    assert settings_hash({"a": 1}) != settings_hash({"a": 2})
@@ -0,0 +1,74 @@
+"""
+    LoudnessMeter on generated sine waves.
+"""
+import numpy as np
+import pytest
+
+from normalize.lib.pyff.loudnessmeter import SAMPLE_RATE, SUB_BLOCK, LoudnessMeter, channel_weights
+from normalize.lib.pyff.r128 import ABSOLUTE_GATE
+
+
+def sine(seconds, level_db, channels = 2, frequency = 997.0):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    x = 10 ** (level_db / 20) * np.sin(2 * np.pi * frequency * t)
+    return np.repeat(x[:, None], channels, axis = 1).astype(np.float32)
+
+
+def test_sine_loudness():
+    # A stereo sine at 1 kHz reads its level in LUFS, K-weighting is close to flat there
+    meter = LoudnessMeter(2, "stereo")
+    meter.process(sine(10, -23.0))
+    assert meter.histogram.integrated() == pytest.approx(-23.0, abs = 0.1)
+    assert meter.histogram.loudness_range() == pytest.approx(0.0, abs = 0.1)
+    assert meter.histogram.true_peak_db() == pytest.approx(-23.0, abs = 0.1)
+    assert meter.samples == 10 * SAMPLE_RATE
+
+
+def test_mono_channel():
+    # One channel of a stereo pair is 3 dB below both
+    samples = sine(10, -20.0)
+    samples[:, 1] = 0
+    meter = LoudnessMeter(2, "stereo")
+    meter.process(samples)
+    assert meter.histogram.integrated() == pytest.approx(-23.0, abs = 0.1)
+
+
+def test_block_counts():
+    # 100 sub-blocks, gating blocks end from the fourth one and short-term blocks from the thirtieth
+    meter = LoudnessMeter(2)
+    meter.process(sine(10, -23.0))
+    assert sum(meter.histogram.blocks.values()) == 97
+    assert sum(meter.histogram.short_term.values()) == 71
+
+    # The skipped sub-blocks only settle the filter
+    meter = LoudnessMeter(2, skip = 10)
+    meter.process(sine(10, -23.0))
+    assert sum(meter.histogram.blocks.values()) == 90
+    assert sum(meter.histogram.short_term.values()) == 71
+
+
+def test_split_input():
+    samples = sine(10, -18.0, frequency = 440.0)
+    whole = LoudnessMeter(2)
+    whole.process(samples)
+    split = LoudnessMeter(2)
+    for start in range(0, samples.shape[0], 7 * SUB_BLOCK):
+        split.process(samples[start:start + 7 * SUB_BLOCK])
+    assert split.histogram.integrated() == pytest.approx(whole.histogram.integrated(), abs = 0.01)
+    assert sum(split.histogram.blocks.values()) == sum(whole.histogram.blocks.values())
+    assert split.histogram.true_peak == pytest.approx(whole.histogram.true_peak)
+
+
+def test_silence():
+    meter = LoudnessMeter(2)
+    meter.process(np.zeros((5 * SAMPLE_RATE, 2), dtype = np.float32))
+    assert meter.histogram.integrated() == ABSOLUTE_GATE
+    assert meter.histogram.true_peak == 0.0
+
+
+def test_channel_weights():
+    assert channel_weights(6, "5.1").tolist() == [1.0, 1.0, 1.0, 0.0, 1.41, 1.41]
+    assert channel_weights(2, "stereo").tolist() == [1.0, 1.0]
+    # Six channels with an unknown or wrong layout are weighted as 5.1, other counts equally
+    assert channel_weights(6).tolist() == [1.0, 1.0, 1.0, 0.0, 1.41, 1.41]
+    assert channel_weights(3, "stereo").tolist() == [1.0, 1.0, 1.0]
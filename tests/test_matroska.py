@@ -0,0 +1,123 @@
+"""
+    Matroska reader, files are built from EBML elements with 8 byte sizes.
+"""
+import struct
+
+from hevc_nvenc.lib.pyff import matroska
+from hevc_nvenc.lib.pyff.matroska import read_vint
+
+
+def element(e_id, *children):
+    data = b"".join(children)
+    return e_id.to_bytes((e_id.bit_length() + 7) // 8, "big") + ((1 << 56) | len(data)).to_bytes(8, "big") + data
+
+
+def uint(e_id, value):
+    return element(e_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big"))
+
+
+def string(e_id, value):
+    return element(e_id, value.encode("utf8"))
+
+
+def double(e_id, value):
+    return element(e_id, struct.pack(">d", value))
+
+
+def header(doc_type = "matroska"):
+    return element(matroska.EBML, uint(0x4286, 1), string(matroska.DOC_TYPE, doc_type))
+
+
+def info(duration = 10000.0):
+    children = [uint(matroska.TIMESTAMP_SCALE, 1000000)]
+    if duration != None:
+        children.append(double(matroska.DURATION, duration))
+    return element(matroska.INFO, *children)
+
+
+def video_track(number, codec_id = "V_MPEGH/ISO/HEVC"):
+    return element(matroska.TRACK_ENTRY, uint(matroska.TRACK_NUMBER, number), uint(matroska.TRACK_UID, 100 + number),
+                   uint(matroska.TRACK_TYPE, 1), string(matroska.CODEC_ID, codec_id),
+                   uint(matroska.DEFAULT_DURATION, 40000000),
+                   element(matroska.VIDEO, uint(matroska.PIXEL_WIDTH, 1920), uint(matroska.PIXEL_HEIGHT, 1080)))
+
+
+def audio_track(number, codec_id, channels, bit_depth = None, language = None):
+    audio = [double(matroska.SAMPLING_FREQUENCY, 48000.0), uint(matroska.CHANNELS, channels)]
+    if bit_depth != None:
+        audio.append(uint(matroska.BIT_DEPTH, bit_depth))
+    children = [uint(matroska.TRACK_NUMBER, number), uint(matroska.TRACK_UID, 100 + number),
+                uint(matroska.TRACK_TYPE, 2), string(matroska.CODEC_ID, codec_id)]
+    if language != None:
+        children.append(string(matroska.LANGUAGE, language))
+    children.append(element(matroska.AUDIO, *audio))
+    return element(matroska.TRACK_ENTRY, *children)
+
+
+def bps_tag(uid, bps):
+    return element(matroska.TAG, element(matroska.TARGETS, uint(matroska.TAG_TRACK_UID, uid)),
+                   element(matroska.SIMPLE_TAG, string(matroska.TAG_NAME, "BPS"), string(matroska.TAG_STRING, bps)))
+
+
+def seek_head(e_id, position):
+    seek = element(matroska.SEEK, uint(matroska.SEEK_ID, e_id),
+                   element(matroska.SEEK_POSITION, position.to_bytes(8, "big")))
+    return element(matroska.SEEK_HEAD, seek)
+
+
+def write(tmp_path, *level1, doc_type = "matroska"):
+    path = tmp_path / "test.mkv"
+    path.write_bytes(header(doc_type) + element(matroska.SEGMENT, *level1))
+    return str(path)
+
+
+def test_read_vint():
+    assert read_vint(b"\x81", 0) == (1, 1, False)
+    assert read_vint(b"\x40\x02", 0) == (2, 2, False)
+    assert read_vint(b"\x1a\x45\xdf\xa3", 0, keep_marker = True) == (matroska.EBML, 4, False)
+    assert read_vint(b"\xff", 0) == (127, 1, True)
+
+
+def test_probe(tmp_path):
+    tracks = element(matroska.TRACKS, video_track(1), audio_track(2, "A_OPUS", 1),
+                     audio_track(3, "A_AAC", 2, language = "swe"), audio_track(4, "A_PCM/INT/LIT", 6, bit_depth = 16))
+    tags = element(matroska.TAGS, bps_tag(101, "4000000"), bps_tag(103, "128000"))
+    data = matroska.probe(write(tmp_path, info(), tracks, tags))
+
+    assert data["format"]["format_name"] == matroska.FORMAT_NAME
+    assert data["format"]["duration"] == "10.000000"
+    video, mono, stereo, pcm = data["streams"]
+    assert video == {"index": 0, "codec_type": "video", "codec_name": "hevc", "bit_rate": "4000000", "width": 1920,
+                     "height": 1080, "avg_frame_rate": "1000000000/40000000", "tags": {"language": "eng"}}
+    assert mono["codec_name"] == "opus"
+    assert mono["channels"] == 1
+    assert mono["channel_layout"] == "mono"
+    assert mono["sample_rate"] == 48000
+    assert stereo["channel_layout"] == "stereo"
+    assert stereo["bit_rate"] == "128000"
+    assert stereo["tags"] == {"language": "swe"}
+    assert pcm["codec_name"] == "pcm_s16le"
+    assert "channel_layout" not in pcm
+    assert pcm["bit_rate"] == str(48000 * 16 * 6)
+
+
+def test_tracks_found_through_seek_head(tmp_path):
+    # The tracks follow the first cluster, only the seek head points to them
+    body = info() + element(matroska.CLUSTER, uint(0xE7, 0))
+    tracks = element(matroska.TRACKS, audio_track(1, "A_FLAC", 2))
+    position = len(seek_head(matroska.TRACKS, 0)) + len(body)
+    data = matroska.probe(write(tmp_path, seek_head(matroska.TRACKS, position), body, tracks))
+    assert [s["codec_name"] for s in data["streams"]] == ["flac"]
+
+
+def test_probe_rejects(tmp_path):
+    tracks = element(matroska.TRACKS, audio_track(1, "A_OPUS", 2))
+    assert matroska.probe(write(tmp_path, info(duration = None), tracks)) == None
+    assert matroska.probe(write(tmp_path, info(), tracks, doc_type = "other")) == None
+    assert matroska.probe(write(tmp_path, info(), element(matroska.TRACKS, audio_track(1, "A_UNKNOWN", 2)))) == None
+    empty = tmp_path / "empty.mkv"
+    empty.write_bytes(b"")
+    assert matroska.probe(str(empty)) == None
+    other = tmp_path / "other.mkv"
+    other.write_bytes(b"RIFF" + b"\x00" * 60)
+    assert matroska.probe(str(other)) == None
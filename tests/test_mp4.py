@@ -0,0 +1,96 @@
+"""
+    MP4 reader, files are built from the boxes the reader walks with the other fields left zero.
+"""
+import struct
+
+from hevc_nvenc.lib.pyff import mp4
+
+LANGUAGE_ENG = (5 << 10) | (14 << 5) | 7
+
+
+def box(box_type, *children):
+    data = b"".join(children)
+    return struct.pack(">I4s", 8 + len(data), box_type) + data
+
+
+def full_box(box_type, *fields):
+    return box(box_type, b"\x00\x00\x00\x00", *fields)
+
+
+def times(timescale, duration):
+    return struct.pack(">IIII", 0, 0, timescale, duration)
+
+
+def sample_tables(entry, samples, sample_size, delta):
+    return box(b"minf", box(b"stbl",
+                            full_box(b"stsd", struct.pack(">I", 1), entry),
+                            full_box(b"stsz", struct.pack(">II", sample_size, samples)),
+                            full_box(b"stts", struct.pack(">III", 1, samples, delta))))
+
+
+def track(handler, timescale, entry, samples, sample_size, delta, language = LANGUAGE_ENG):
+    mdhd = full_box(b"mdhd", times(timescale, samples * delta), struct.pack(">HH", language, 0))
+    hdlr = full_box(b"hdlr", struct.pack(">I4s", 0, handler), b"\x00" * 13)
+    return box(b"trak", box(b"mdia", mdhd, hdlr, sample_tables(entry, samples, sample_size, delta)))
+
+
+def video_entry(fourcc = b"avc1", width = 1280, height = 720):
+    fields = bytearray(78)
+    struct.pack_into(">HH", fields, 24, width, height)
+    return box(fourcc, bytes(fields))
+
+
+def sound_entry(fourcc, channels, sample_rate = 48000):
+    fields = bytearray(28)
+    struct.pack_into(">HH", fields, 16, channels, 16)
+    struct.pack_into(">I", fields, 24, sample_rate << 16)
+    return box(fourcc, bytes(fields))
+
+
+def moov(*tracks, extra = b""):
+    return box(b"moov", full_box(b"mvhd", times(1000, 10000)), *tracks, extra)
+
+
+def write(tmp_path, *boxes):
+    path = tmp_path / "test.mp4"
+    path.write_bytes(box(b"ftyp", b"isom") + b"".join(boxes))
+    return str(path)
+
+
+def test_probe(tmp_path):
+    video = track(b"vide", 25, video_entry(), 250, 4000, 1)
+    mono = track(b"soun", 48000, sound_entry(b"mp4a", 1), 500, 100, 960, language = mp4.LANGUAGE_UND)
+    stereo = track(b"soun", 48000, sound_entry(b"ac-3", 2), 500, 100, 960)
+    data = mp4.probe(write(tmp_path, box(b"mdat", b"\x00" * 64), moov(video, mono, stereo)))
+
+    assert data["format"]["format_name"] == mp4.FORMAT_NAME
+    assert data["format"]["duration"] == "10.000000"
+    video, mono, stereo = data["streams"]
+    assert video == {"index": 0, "codec_type": "video", "codec_name": "h264", "bit_rate": str(4000 * 8 * 25),
+                     "width": 1280, "height": 720, "avg_frame_rate": "6250/250", "tags": {"language": "eng"}}
+    assert mono == {"index": 1, "codec_type": "audio", "codec_name": "aac", "bit_rate": str(100 * 8 * 50),
+                    "channels": 1, "channel_layout": "mono", "sample_rate": 48000}
+    assert stereo["codec_name"] == "ac3"
+    assert stereo["channel_layout"] == "stereo"
+
+
+def test_multichannel_has_no_layout(tmp_path):
+    data = mp4.probe(write(tmp_path, moov(track(b"soun", 48000, sound_entry(b"Opus", 6), 500, 100, 960))))
+    assert data["streams"][0]["channels"] == 6
+    assert "channel_layout" not in data["streams"][0]
+
+
+def test_other_tracks_are_data(tmp_path):
+    tmcd = track(b"tmcd", 25, box(b"tmcd", b"\x00" * 8), 1, 4, 250)
+    data = mp4.probe(write(tmp_path, moov(track(b"vide", 25, video_entry(b"hvc1"), 250, 4000, 1), tmcd)))
+    assert data["streams"][1] == {"index": 1, "codec_type": "data"}
+
+
+def test_probe_rejects(tmp_path):
+    video = track(b"vide", 25, video_entry(), 250, 4000, 1)
+    assert mp4.probe(write(tmp_path, box(b"mdat", b"\x00" * 64))) == None
+    assert mp4.probe(write(tmp_path, moov(video, extra = box(b"mvex")))) == None
+    assert mp4.probe(write(tmp_path, moov(track(b"vide", 25, video_entry(b"xxxx"), 250, 4000, 1)))) == None
+    assert mp4.probe(write(tmp_path, moov(track(b"vide", 25, video_entry(width = 0), 250, 4000, 1)))) == None
+    truncated = box(b"moov", full_box(b"mvhd", times(1000, 10000)), video)
+    assert mp4.probe(write(tmp_path, truncated[:-10])) == None
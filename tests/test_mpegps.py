@@ -0,0 +1,107 @@
+"""
+    MPEG program stream reader, files are built from MPEG-2 pack headers and PES packets.
+"""
+import struct
+
+from hevc_nvenc.lib.pyff import mpegps
+from hevc_nvenc.lib.pyff.probe import PROBE_STAGES_VOB, AdaptiveProber
+
+# Sequence header of 720x576 at 25 fps
+SEQUENCE_HEADER = mpegps.SEQUENCE_HEADER + bytes([0x2D, 0x02, 0x40, 0x23]) + b"\x00" * 4
+
+# AC-3 sync frames, 448 kbit/s 5.1 and 192 kbit/s stereo at 48 kHz
+AC3_5_1 = bytes([0x0B, 0x77, 0x00, 0x00, 0x1E, 0x40, 0xE1, 0x00])
+AC3_STEREO = bytes([0x0B, 0x77, 0x00, 0x00, 0x14, 0x40, 0x40, 0x00])
+
+
+def pack_header(seconds):
+    base = int(round(seconds * mpegps.SCR_CLOCK))
+    scr = bytes([
+        0x44 | ((base >> 30) & 7) << 3 | (base >> 28) & 3,
+        (base >> 20) & 0xFF,
+        0x04 | ((base >> 15) & 0x1F) << 3 | (base >> 13) & 3,
+        (base >> 5) & 0xFF,
+        0x04 | (base & 0x1F) << 3,
+        0x01,
+    ])
+    return mpegps.PACK_START + scr + b"\x01\x89\xc3\xf8"
+
+
+def pes(stream_id, payload):
+    return b"\x00\x00\x01" + bytes([stream_id]) + struct.pack(">H", 3 + len(payload)) + b"\x81\x00\x00" + payload
+
+
+def private(substream_id, payload):
+    return pes(mpegps.PRIVATE_STREAM_1, bytes([substream_id, 1, 0, 1]) + payload)
+
+
+def lpcm(substream_id, info_byte):
+    # Substream id, frame count, access unit pointer, emphasis and frame number, then the quantization,
+    # sample rate and channels byte
+    return pes(mpegps.PRIVATE_STREAM_1, bytes([substream_id, 1, 0, 4, 0, info_byte, 0x80]) + b"\x00" * 16)
+
+
+def write(tmp_path, *packs):
+    path = tmp_path / "test.vob"
+    path.write_bytes(b"".join(packs))
+    return str(path)
+
+
+def test_probe(tmp_path):
+    first = pack_header(0.5) + pes(0xE0, SEQUENCE_HEADER) + private(0x80, AC3_5_1)
+    second = pack_header(1.5) + lpcm(0xA0, 0x01) + private(0x81, AC3_STEREO) + lpcm(0xA1, 0x00)
+    data = mpegps.probe(write(tmp_path, first, second, pack_header(2.5)))
+
+    assert data["format"]["format_name"] == mpegps.FORMAT_NAME
+    assert data["format"]["start_time"] == "0.500000"
+    assert data["format"]["duration"] == "2.000000"
+    video, surround, pcm, stereo, mono = data["streams"]
+    assert video == {"index": 0, "id": "0x1e0", "codec_type": "video", "codec_name": "mpeg2video", "width": 720,
+                     "height": 576, "avg_frame_rate": "25/1"}
+    assert surround == {"index": 1, "id": "0x80", "codec_type": "audio", "codec_name": "ac3", "bit_rate": "448000",
+                        "channels": 6, "sample_rate": 48000}
+    assert pcm == {"index": 2, "id": "0xa0", "codec_type": "audio", "codec_name": "pcm_dvd", "bit_rate": "1536000",
+                   "channels": 2, "channel_layout": "stereo", "sample_rate": 48000}
+    assert stereo["bit_rate"] == "192000"
+    assert stereo["channel_layout"] == "stereo"
+    assert mono["channels"] == 1
+    assert mono["channel_layout"] == "mono"
+    # ffmpeg needs to read past the second pack where the last streams start
+    assert data["window"][0] == int((1.0 + mpegps.WINDOW_MARGIN_SECONDS) * 1000000)
+
+
+def test_subpicture_window(tmp_path):
+    # DVD subtitles are found by ffmpeg in the window of the scan, not in the largest probe window
+    first = pack_header(0.5) + pes(0xE0, SEQUENCE_HEADER) + private(0x80, AC3_5_1)
+    second = pack_header(1.5) + private(0x20, b"\x00" * 16)
+    name = write(tmp_path, first, second, pack_header(2.5))
+    needed = mpegps.probe(name)["window"]
+
+    result = AdaptiveProber().probe(name)
+    assert result.stage == "mpegps"
+    assert [s["codec_name"] for s in result.data["streams"]] == ["mpeg2video", "ac3", "dvd_subtitle"]
+    assert result.window == (max(PROBE_STAGES_VOB[0][0], needed[0]), max(PROBE_STAGES_VOB[0][1], needed[1]))
+    assert result.window[0] < PROBE_STAGES_VOB[-1][0] and result.window[1] < PROBE_STAGES_VOB[-1][1]
+
+
+def test_read_scr():
+    for seconds in [0.0, 1.0, 3600.5, 95000.0]:
+        assert abs(mpegps.read_scr(pack_header(seconds), 0) - seconds) < 1 / mpegps.SCR_CLOCK
+
+
+def test_lpcm_info():
+    info = mpegps.lpcm_info(bytes([0xA0, 1, 0, 4, 0, 0x55, 0x80]))
+    assert (info.bit_rate, info.channels, info.sample_rate) == (96000 * 20 * 6, 6, 96000)
+    assert mpegps.lpcm_info(bytes([0xA0, 1, 0, 4, 0, 0xC1, 0x80])) == None
+    assert mpegps.lpcm_info(b"\xa0") == None
+
+
+def test_probe_rejects(tmp_path):
+    video = pes(0xE0, SEQUENCE_HEADER)
+    # No duration with a single clock reference
+    assert mpegps.probe(write(tmp_path, pack_header(1.0) + video)) == None
+    # Not starting with a pack header
+    assert mpegps.probe(write(tmp_path, b"\x00" * 16, pack_header(1.0) + video, pack_header(2.0))) == None
+    # Video without a sequence header and audio without a frame header
+    assert mpegps.probe(write(tmp_path, pack_header(1.0) + pes(0xE0, b"\x00" * 16), pack_header(2.0))) == None
+    assert mpegps.probe(write(tmp_path, pack_header(1.0) + private(0x80, b"\x00" * 16), pack_header(2.0))) == None
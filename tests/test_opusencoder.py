@@ -0,0 +1,28 @@
+"""
+    Opus encoder options shared by the opus plugin and the normalize to opus mode.
+"""
+from opus.lib.pyff.audiostream import AudioStream
+from opus.lib.pyff.opusencoder import opus_args, opus_bitrate, opus_layout
+
+
+def test_bitrate_per_channel():
+    assert opus_bitrate(1) == 96000
+    assert opus_bitrate(2) == 128000
+    assert opus_bitrate(6) == 320000
+
+
+def test_bitrate_does_not_follow_the_source():
+    # A 96 kbit/s stereo source is encoded like its PCM decode would be by the opus plugin
+    a_stream = AudioStream(1, "aac", 96000, 2, "stereo")
+    assert opus_args(a_stream, 0, ["loudnorm"]) == [
+        "-c:a:0", "libopus", "-filter:a:0", "loudnorm,channelmap=channel_layout=stereo",
+        "-compression_level", "10", "-b:a:0", "128000",
+    ]
+
+
+def test_channelmap_and_bitrate_override():
+    a_stream = AudioStream(1, "pcm_s16le", 320000, 6, "5.1(side)")
+    assert opus_layout(a_stream.channel_layout) == "5.1"
+    args = opus_args(a_stream, 2, channelmap = "channelmap=map=FL-FC:channel_layout=mono", bitrate = 64000)
+    assert args[3] == "channelmap=map=FL-FC:channel_layout=mono"
+    assert args[-2:] == ["-b:a:2", "64000"]
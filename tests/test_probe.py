@@ -0,0 +1,68 @@
+"""
+    parse_flat, the ffprobe flat writer output in the layout of the json writer.
+"""
+from hevc_nvenc.lib.pyff.probe import SHOW_ENTRIES, parse_flat
+
+
+def test_format_and_streams():
+    lines = [
+        'format.format_name="matroska,webm"\n',
+        'format.duration="60.000000"\n',
+        'format.size="1024"\n',
+        'streams.stream.0.index=0\n',
+        'streams.stream.0.codec_type="video"\n',
+        'streams.stream.0.width=1920\n',
+        'streams.stream.1.index=1\n',
+        'streams.stream.1.codec_type="audio"\n',
+        'streams.stream.1.channels=2\n',
+        'streams.stream.1.tags.language="eng"\n',
+    ]
+    data = parse_flat(lines)
+    assert data["format"] == {"format_name": "matroska,webm", "duration": "60.000000", "size": "1024"}
+    assert data["streams"] == [
+        {"index": 0, "codec_type": "video", "width": 1920},
+        {"index": 1, "codec_type": "audio", "channels": 2, "tags": {"language": "eng"}},
+    ]
+
+
+def test_streams_are_ordered_by_index():
+    lines = ['format.size="1"', 'streams.stream.10.index=10', 'streams.stream.2.index=2', 'streams.stream.0.index=0']
+    assert [s["index"] for s in parse_flat(lines)["streams"]] == [0, 2, 10]
+
+
+def test_unknown_values_are_left_out():
+    data = parse_flat(['format.size="1"', 'format.bit_rate="N/A"', 'streams.stream.0.index=0',
+                       'streams.stream.0.channel_layout="N/A"'])
+    assert data["format"] == {"size": "1"}
+    assert data["streams"] == [{"index": 0}]
+
+
+def test_numbers_and_escapes():
+    data = parse_flat([
+        'format.size="1"\r\n',
+        'streams.stream.0.start_pts=-42',
+        'streams.stream.0.tags.title="a \\"quoted\\" line\\nand a \\\\ backslash"',
+    ])
+    assert data["streams"][0]["start_pts"] == -42
+    assert data["streams"][0]["tags"]["title"] == 'a "quoted" line\nand a \\ backslash'
+
+
+def test_other_lines_are_skipped():
+    data = parse_flat(['format.size="1"', 'no separator', 'programs.program.0.id=1', 'streams.stream.x.index=0',
+                       'streams.stream.0.disposition.default=1'])
+    assert data == {"format": {"size": "1"}, "streams": [{}]}
+
+
+def test_stream_id_and_max_bit_rate():
+    # MediaFile maps streams by id and takes the peak bit rate, both must be asked for
+    stream_entries = SHOW_ENTRIES.split(":stream=")[1].split(":")[0].split(",")
+    assert "id" in stream_entries
+    assert "max_bit_rate" in stream_entries
+    data = parse_flat(['format.size="1"', 'streams.stream.0.index=0', 'streams.stream.0.id="0x1e0"',
+                       'streams.stream.0.max_bit_rate=9800000'])
+    assert data["streams"] == [{"index": 0, "id": "0x1e0", "max_bit_rate": 9800000}]
+
+
+def test_without_format():
+    assert parse_flat([]) == None
+    assert parse_flat(['streams.stream.0.index=0']) == None
@@ -0,0 +1,115 @@
+"""
+    ProbeCache eviction and invalidation, with a clock that advances on every read so access order is exact.
+"""
+import itertools
+import types
+
+import pytest
+
+from hevc_nvenc.lib.pyff import probecache
+from hevc_nvenc.lib.pyff.fileidentity import FileIdentity
+from hevc_nvenc.lib.pyff.probecache import ProbeCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(probecache, "time", types.SimpleNamespace(time = lambda: float(next(ticks))))
+
+
+def identity(n, size = 100):
+    return FileIdentity("/media/{}.mkv".format(n), size, 1, n)
+
+
+def test_round_trip(tmp_path, clock):
+    cache = ProbeCache(str(tmp_path / "cache.db"))
+    assert cache.get(identity(1)) == None
+    cache.put(identity(1), {"format": {"size": "100"}})
+    assert cache.get(identity(1)) == {"format": {"size": "100"}}
+    assert cache.stats()["entries"] == 1
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+    # Reopened from disk
+    cache = ProbeCache(str(tmp_path / "cache.db"))
+    assert cache.stats()["entries"] == 1
+    assert cache.get(identity(1)) == {"format": {"size": "100"}}
+
+
+def test_changed_file(tmp_path, clock):
+    cache = ProbeCache(str(tmp_path / "cache.db"))
+    cache.put(identity(1), {})
+    cache.put_analysis(identity(1), 0, "loudnorm", {"input_i": "-23.00"})
+    assert cache.get(identity(1, size = 200)) == None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["analyses"] == 0
+    assert cache.get(identity(1)) == None
+
+
+def test_analyses(tmp_path, clock):
+    cache = ProbeCache(str(tmp_path / "cache.db"))
+    cache.put(identity(1), {})
+    cache.put_analysis(identity(1), 0, "loudnorm", {"input_i": "-23.00"})
+    cache.put_analysis(identity(1), 1, "loudnorm", {"input_i": "-20.00"}, params = "windows=8x30.0")
+    assert cache.get_analysis(identity(1), 0, "loudnorm") == {"input_i": "-23.00"}
+    assert cache.get_analysis(identity(1), 1, "loudnorm") == None
+    assert cache.get_analysis(identity(1), 1, "loudnorm", params = "windows=8x30.0") == {"input_i": "-20.00"}
+    assert cache.get_analysis(identity(1), 0, "channels") == None
+
+    # A changed file drops the results of every stream
+    assert cache.get_analysis(identity(1, size = 200), 0, "loudnorm") == None
+    assert cache.stats()["analyses"] == 0
+
+
+def test_put_drops_stale_analyses(tmp_path, clock):
+    cache = ProbeCache(str(tmp_path / "cache.db"))
+    cache.put_analysis(identity(1), 0, "loudnorm", {"input_i": "-23.00"})
+    cache.put(identity(1), {})
+    assert cache.stats()["analyses"] == 1
+    cache.put(identity(1, size = 200), {})
+    assert cache.stats()["analyses"] == 0
+    assert cache.stats()["entries"] == 1
+
+
+def test_invalidate(tmp_path, clock):
+    cache = ProbeCache(str(tmp_path / "cache.db"))
+    cache.put(identity(1), {})
+    cache.put_failure(identity(2), "Invalid data")
+    cache.put_analysis(identity(1), 0, "loudnorm", {})
+    cache.invalidate(identity(1).path)
+    cache.invalidate(identity(2).path)
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["failures"] == 0
+    assert cache.stats()["analyses"] == 0
+    assert cache.get(identity(1)) == None
+
+
+def test_eviction(tmp_path, clock):
+    cache = ProbeCache(str(tmp_path / "cache.db"), max_entries = 10)
+    for n in range(10):
+        cache.put(identity(n), {})
+        cache.put_analysis(identity(n), 0, "loudnorm", {})
+    # The oldest entry is used again, the next two are the least recently used
+    assert cache.get(identity(0)) == {}
+    cache.put(identity(10), {})
+
+    stats = cache.stats()
+    assert stats["entries"] == 9
+    assert stats["evictions"] == 2
+    assert stats["analyses"] == 8
+    assert cache.get(identity(1)) == None
+    assert cache.get(identity(2)) == None
+    assert cache.get(identity(0)) == {}
+    assert cache.get_analysis(identity(0), 0, "loudnorm") == {}
+    assert cache.get_analysis(identity(1), 0, "loudnorm") == None
+
+
+def test_failures(tmp_path, clock):
+    cache = ProbeCache(str(tmp_path / "cache.db"), failure_ttl = 3600)
+    cache.put_failure(identity(1), "Invalid data")
+    assert cache.get_failure(identity(1)) == "Invalid data"
+    assert cache.get_failure(identity(1, size = 200)) == None
+    assert cache.get_failure(identity(1)) == None
+
+    disabled = ProbeCache(str(tmp_path / "disabled.db"), failure_ttl = 0)
+    disabled.put_failure(identity(1), "Invalid data")
+    assert disabled.get_failure(identity(1)) == None
@@ -0,0 +1,88 @@
+"""
+    LoudnessHistogram, the gated loudness of whole and merged streams, and the confidence bound of the sampled
+    loudness estimate.
+"""
+import math
+
+import pytest
+
+from normalize.lib.pyff.r128 import ABSOLUTE_GATE, LoudnessHistogram, estimate_bound
+
+
+def histogram(blocks, short_term = (), true_peak = 0.0):
+    result = LoudnessHistogram(true_peak = true_peak)
+    for loudness in blocks:
+        result.add_block(loudness)
+    for loudness in short_term:
+        result.add_short_term(loudness)
+    return result
+
+
+def test_integrated_loudness():
+    assert histogram([-23.0] * 50).integrated() == pytest.approx(-23.0, abs = 1e-9)
+    assert histogram([-23.0] * 50).threshold() == pytest.approx(-33.0, abs = 1e-9)
+
+
+def test_gates():
+    # Blocks below the absolute gate are not counted, blocks below the relative gate do not change the loudness
+    assert sum(histogram([-23.0, -75.0]).blocks.values()) == 1
+    assert histogram([-23.0] * 50 + [-40.0] * 10).integrated() == pytest.approx(-23.0, abs = 1e-9)
+    assert histogram([-23.0] * 50 + [-30.0] * 10).integrated() < -23.0
+
+
+def test_silence():
+    silent = histogram([-80.0] * 10)
+    assert silent.integrated() == ABSOLUTE_GATE
+    assert silent.threshold() == ABSOLUTE_GATE
+    assert silent.loudness_range() == 0.0
+    assert silent.true_peak_db() == -math.inf
+    assert silent.to_measured()["input_tp"] == "-99.00"
+
+
+def test_loudness_range():
+    assert histogram([], [-20.0] * 100).loudness_range() == 0.0
+    assert histogram([], [-20.0] * 100 + [-30.0] * 100).loudness_range() == pytest.approx(10.0)
+    # Short-term blocks 20 LU below the mean energy are left out
+    assert histogram([], [-20.0] * 100 + [-30.0] * 100 + [-60.0] * 10).loudness_range() == pytest.approx(10.0)
+
+
+def test_merge_equals_single_pass():
+    blocks = [-20.0 - (i % 17) * 0.7 for i in range(300)]
+    short_term = [-22.0 - (i % 11) * 0.9 for i in range(300)]
+    whole = histogram(blocks, short_term, true_peak = 0.8)
+    merged = histogram(blocks[:120], short_term[:120], true_peak = 0.5)
+    merged.merge(histogram(blocks[120:], short_term[120:], true_peak = 0.8))
+    assert merged.to_measured() == whole.to_measured()
+    assert merged.true_peak == 0.8
+
+
+def test_to_measured():
+    measured = histogram([-23.0] * 50, [-23.0] * 50, true_peak = 0.5).to_measured()
+    assert measured == {
+        "input_i": "-23.00",
+        "input_tp": "{:.2f}".format(20 * math.log10(0.5)),
+        "input_lra": "0.00",
+        "input_thresh": "-33.00",
+        "target_offset": "0.00",
+    }
+
+
+def test_bound_of_equal_windows():
+    merged, bound = estimate_bound([histogram([-23.0] * 50) for _ in range(4)])
+    assert merged.integrated() == pytest.approx(-23.0, abs = 1e-9)
+    assert sum(merged.blocks.values()) == 200
+    assert bound == pytest.approx(0.0, abs = 1e-9)
+
+
+def test_bound_grows_with_disagreement():
+    close = [histogram([-23.0 + d] * 50) for d in [-0.5, 0.0, 0.5, 0.0]]
+    far = [histogram([-23.0 + d] * 50) for d in [-4.0, 0.0, 4.0, 0.0]]
+    _, close_bound = estimate_bound(close)
+    _, far_bound = estimate_bound(far)
+    assert 0.0 < close_bound < far_bound < math.inf
+
+
+def test_bound_is_infinite_without_estimate():
+    assert estimate_bound([histogram([-23.0] * 50)])[1] == math.inf
+    assert estimate_bound([])[1] == math.inf
+    assert estimate_bound([histogram([-80.0]), histogram([-80.0])])[1] == math.inf